@@ -1,13 +1,42 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, ForeignKey, Text
+from sqlalchemy import create_engine, Column, Integer, String, Float, ForeignKey, Index, MetaData, Table, Text, func, case, and_, text, insert, update, literal, literal_column, union_all
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship, sessionmaker
-from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, status, APIRouter
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import relationship, sessionmaker, selectinload, contains_eager, deferred, undefer, column_property
+from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, status, APIRouter, Header, Query, Request, WebSocket
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.future import select
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 from typing import List, Optional
+import anyio
+import asyncio
 import base64
-from pydantic import BaseModel
-from sqlalchemy.dialects.postgresql import OID
-from fastapi.responses import JSONResponse, Response
+import binascii
+import bisect
+import collections
+import contextlib
+import contextvars
+import csv
+import enum
+import functools
+import hashlib
+import hmac
+import io
+import json
+import logging
+import os
+import time
+import types
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pydantic import BaseModel, BaseSettings, conlist, validator
+from sqlalchemy.dialects.postgresql import OID, insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from starlette.datastructures import Headers, MutableHeaders
 
 Base = declarative_base()
 
@@ -15,100 +44,1459 @@ class ResepMaster(Base):
     __tablename__ = 'resep_master'
     id = Column(Integer, primary_key=True)
     name = Column(String(255))
+    version = Column(Integer, nullable=False, default=1, server_default='1')
     bahan_master = relationship("BahanMaster", back_populates="resep_master")
     cara_membuat = relationship("CaraMembuat", back_populates="resep_master")
     testi_diskusi = relationship("TestiDiskusi", back_populates="resep_master")
     rating = relationship("Rating", back_populates="resep_master")
+    # The summary row's primary key is the recipe id, so it can only go
+    # away with the recipe, never be detached from it.
+    rating_summary = relationship("RatingSummary", back_populates="resep_master", uselist=False, lazy="joined", cascade="all, delete-orphan")
 
 class BahanMaster(Base):
     __tablename__ = 'bahan_master'
     id = Column(Integer, primary_key=True)
-    id_resep_master = Column(Integer, ForeignKey('resep_master.id'))
+    id_resep_master = Column(Integer, ForeignKey('resep_master.id'), index=True)
     porsi = Column(Integer)
+    version = Column(Integer, nullable=False, default=1, server_default='1')
     bahan_detail = relationship("BahanDetail", back_populates="bahan_master")
     resep_master = relationship("ResepMaster", back_populates="bahan_master")
 
 class BahanDetail(Base):
     __tablename__ = 'bahan_detail'
     id = Column(Integer, primary_key=True)
-    id_bahan_master = Column(Integer, ForeignKey('bahan_master.id'))
+    id_bahan_master = Column(Integer, ForeignKey('bahan_master.id'), index=True)
     name = Column(String(255))
+    version = Column(Integer, nullable=False, default=1, server_default='1')
     bahan_master = relationship("BahanMaster", back_populates="bahan_detail")
 
 class CaraMembuat(Base):
     __tablename__ = 'cara_membuat'
     id = Column(Integer, primary_key=True)
-    id_resep_master = Column(Integer, ForeignKey('resep_master.id'))
+    id_resep_master = Column(Integer, ForeignKey('resep_master.id'), index=True)
     lama_waktu = Column(Integer)
     tips = Column(String(255))
+    version = Column(Integer, nullable=False, default=1, server_default='1')
     cara_membuat_detail = relationship("CaraMembuatDetail", back_populates="cara_membuat")
     resep_master = relationship("ResepMaster", back_populates="cara_membuat")
 
 class CaraMembuatDetail(Base):
     __tablename__ = 'cara_membuat_detail'
     id = Column(Integer, primary_key=True)
-    id_cara_membuat = Column(Integer, ForeignKey('cara_membuat.id'))
+    id_cara_membuat = Column(Integer, ForeignKey('cara_membuat.id'), index=True)
     cara = Column(String(255))
+    version = Column(Integer, nullable=False, default=1, server_default='1')
     cara_membuat = relationship("CaraMembuat", back_populates="cara_membuat_detail")
 
 class TestiDiskusi(Base):
     __tablename__ = 'testi_diskusi'
+    # (id_resep_master, id) serves both the FK lookup and a recipe's
+    # testimonials in id order.
+    __table_args__ = (Index('ix_testi_diskusi_id_resep_master_id', 'id_resep_master', 'id'),)
     id = Column(Integer, primary_key=True)
     id_resep_master = Column(Integer, ForeignKey('resep_master.id'))
-    user_id = Column(Integer, ForeignKey('user.id')) 
+    user_id = Column(Integer, ForeignKey('user.id'), index=True)
     foto = Column(String(255)) 
     testimonial = Column(String(255))
+    reply_count = Column(Integer, nullable=False, default=0, server_default='0')
+    foto_key = Column(String(64))
+    foto_type = Column(String(100))
+    version = Column(Integer, nullable=False, default=1, server_default='1')
     reply_diskusi = relationship("ReplyDiskusi", back_populates="testi_diskusi")
     resep_master = relationship("ResepMaster", back_populates="testi_diskusi")
 
 class ReplyDiskusi(Base):
     __tablename__ = 'reply_diskusi'
+    __table_args__ = (Index('ix_reply_diskusi_id_testi_diskusi_id', 'id_testi_diskusi', 'id'),)
     id = Column(Integer, primary_key=True)
     id_testi_diskusi = Column(Integer, ForeignKey('testi_diskusi.id'))
     user_id = Column(Integer)
     testimonial = Column(String(255))
+    version = Column(Integer, nullable=False, default=1, server_default='1')
     testi_diskusi = relationship("TestiDiskusi", back_populates="reply_diskusi")
 
 class Rating(Base):
     __tablename__ = 'rating'
+    # Covers rebuild_rating_summary's GROUP BY as an index-only scan.
+    __table_args__ = (Index('ix_rating_id_resep_master_rating', 'id_resep_master', 'rating'),)
     id = Column(Integer, primary_key=True)
     id_resep_master = Column(Integer, ForeignKey('resep_master.id'))
     rating = Column(Float)
+    version = Column(Integer, nullable=False, default=1, server_default='1')
     resep_master = relationship("ResepMaster", back_populates="rating")
 
+class RatingSummary(Base):
+    __tablename__ = 'rating_summary'
+    id_resep_master = Column(Integer, ForeignKey('resep_master.id'), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    total = Column(Float, nullable=False, default=0)
+    average = Column(Float, index=True)
+    star_1 = Column(Integer, nullable=False, default=0)
+    star_2 = Column(Integer, nullable=False, default=0)
+    star_3 = Column(Integer, nullable=False, default=0)
+    star_4 = Column(Integer, nullable=False, default=0)
+    star_5 = Column(Integer, nullable=False, default=0)
+    resep_master = relationship("ResepMaster", back_populates="rating_summary")
+
+    @property
+    def histogram(self):
+        return [self.star_1, self.star_2, self.star_3, self.star_4, self.star_5]
+
 class User(Base):
     __tablename__ = 'user'
     id = Column(Integer, primary_key=True)
-    user_pict = Column(Text)
+    user_pict = deferred(Column(Text))
+    user_pict_key = Column(String(64))
+    user_pict_type = Column(String(100))
     name = Column(String(255))
     email = Column(String(255))
+    version = Column(Integer, nullable=False, default=1, server_default='1')
+
+# Lets user reads know a legacy base64 picture exists without loading it.
+User.has_legacy_pict = column_property(User.__table__.c.user_pict.isnot(None))
+
+
+class Settings(BaseSettings):
+    # Every field can be overridden by the environment variable of the same
+    # name in upper case, e.g. DB_HOST or DB_POOL_SIZE.
+    db_user: str = 'admin'
+    db_password: str = 'admin'
+    db_host: str = 'localhost'
+    db_port: int = 5432
+    db_name: str = 'Resep'
+    db_url: Optional[str] = None
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    db_statement_timeout_ms: int = 0
+    db_async: bool = True
+    db_replica_urls: str = ''
+    db_replica_policy: str = 'round_robin'
+    db_replica_max_lag_seconds: float = 5
+    db_replica_check_interval: float = 2
+    read_your_writes_seconds: float = 5
+    blob_root: str = 'blobs'
+    upload_max_bytes: int = 5 * 1024 * 1024
+    image_workers: int = 2
+    image_max_pixels: int = 50_000_000
+    cache_backend: str = 'memory'
+    cache_max_entries: int = 10000
+    cache_ttl_seconds: float = 60
+    cache_redis_url: str = 'redis://localhost:6379/0'
+    slow_request_ms: float = 500
+    slow_request_queries: int = 20
+    json_response: str = 'validated'
+    admin_token: Optional[str] = None
+    write_buffer: bool = False
+    write_buffer_ack: str = 'flush'
+    write_buffer_max_rows: int = 500
+    write_buffer_max_delay_ms: float = 20
+    write_buffer_queue_size: int = 10000
+    similar_rebuild_seconds: float = 300
+    events_queue_size: int = 100
+    events_keepalive_seconds: float = 15
+    events_notify: bool = True
+
+settings = Settings()
+
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+def database_url(settings):
+    if settings.db_url:
+        return make_url(settings.db_url)
+    return make_url(f"postgresql://{settings.db_user}:{settings.db_password}@{settings.db_host}:{settings.db_port}/{settings.db_name}")
+
+def async_url(url):
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+
+def async_database_url(settings):
+    return async_url(database_url(settings))
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self):
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.buckets + [float("inf")], self.counts):
+            cumulative += count
+            buckets["+Inf" if bound == float("inf") else str(bound)] = cumulative
+        return {"buckets": buckets, "sum": self.sum, "count": self.count}
+
+POOL_WAIT_SECONDS = Histogram([0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30])
+
+class TimedPoolMixin:
+    # Times how long a checkout waits for a free connection.
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_WAIT_SECONDS.observe(time.perf_counter() - started)
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    pass
+
+class TimedAsyncPool(TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+def engine_options(url, settings, is_async=False):
+    options = {
+        "poolclass": TimedAsyncPool if is_async else TimedQueuePool,
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+    if url.get_backend_name() == "sqlite":
+        if not is_async:
+            options["connect_args"] = {"check_same_thread": False}
+    elif settings.db_statement_timeout_ms:
+        timeout = str(settings.db_statement_timeout_ms)
+        if is_async:
+            options["connect_args"] = {"server_settings": {"statement_timeout": timeout}}
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={timeout}"}
+    return options
+
+# Nothing here touches the database at import time: the session factories
+# are bound to engines by the lifespan hook (async, request handlers) or by
+# the CLI at the bottom of this file (sync). The schema is managed by the
+# Alembic migrations in migrations/ (python app.py create-schema).
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+
+AsyncSessionLocal = sessionmaker(class_=AsyncSession, autocommit=False, autoflush=False, expire_on_commit=False)
+
+def init_engine(settings):
+    url = database_url(settings)
+    engine = create_engine(url, **engine_options(url, settings))
+    SessionLocal.configure(bind=engine)
+    return engine
+
+def init_async_engine(settings):
+    url = async_database_url(settings)
+    async_engine = create_async_engine(url, **engine_options(url, settings, is_async=True))
+    AsyncSessionLocal.configure(bind=async_engine)
+    return async_engine
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    app.state.async_engine = init_async_engine(settings)
+    # The engine whose pool request handlers check connections out of.
+    app.state.request_engine = app.state.async_engine.sync_engine if settings.db_async else init_engine(settings)
+    await replicas.start(settings)
+    if replicas.replicas:
+        read_cache.replica_lag = settings.db_replica_max_lag_seconds
+    if settings.write_buffer:
+        write_buffer.start()
+    if settings.events_notify:
+        events.start(database_url(settings))
+    yield
+    await events.stop()
+    await write_buffer.stop()
+    await replicas.stop()
+    await app.state.async_engine.dispose()
+    if not settings.db_async:
+        app.state.request_engine.dispose()
+    image_workers.shutdown()
+
+app = FastAPI(lifespan=lifespan)
+
+class ThreadedSession:
+    # DB_ASYNC=false: AsyncSession's interface over a blocking Session, each
+    # call run in the threadpool. That is how every handler talked to the
+    # database before the async engine, kept so the two can be compared
+    # (bench/load_test.py against a server started either way).
+    def __init__(self, session):
+        self.sync_session = session
+
+    @property
+    def bind(self):
+        return self.sync_session.bind
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    def add_all(self, instances):
+        self.sync_session.add_all(instances)
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return await run_in_threadpool(fn, self.sync_session, *args, **kwargs)
+
+    async def execute(self, *args, **kwargs):
+        return await run_in_threadpool(self.sync_session.execute, *args, **kwargs)
+
+    async def scalar(self, *args, **kwargs):
+        return await run_in_threadpool(self.sync_session.scalar, *args, **kwargs)
+
+    async def get(self, *args, **kwargs):
+        return await run_in_threadpool(self.sync_session.get, *args, **kwargs)
+
+    async def delete(self, instance):
+        await run_in_threadpool(self.sync_session.delete, instance)
+
+    async def refresh(self, *args, **kwargs):
+        await run_in_threadpool(self.sync_session.refresh, *args, **kwargs)
+
+    async def flush(self):
+        await run_in_threadpool(self.sync_session.flush)
+
+    async def commit(self):
+        await run_in_threadpool(self.sync_session.commit)
+
+    async def rollback(self):
+        await run_in_threadpool(self.sync_session.rollback)
+
+    async def stream(self, *args, **kwargs):
+        result = await self.execute(*args, **kwargs)
+
+        async def rows():
+            while batch := await run_in_threadpool(result.fetchmany, STREAM_BATCH_SIZE):
+                for row in batch:
+                    yield row
+        return rows()
+
+    async def close(self):
+        await run_in_threadpool(self.sync_session.close)
+
+@contextlib.asynccontextmanager
+async def primary_session():
+    if settings.db_async:
+        async with AsyncSessionLocal() as db:
+            yield db
+        return
+    db = ThreadedSession(SessionLocal(expire_on_commit=False))
+    try:
+        yield db
+    finally:
+        await db.close()
 
+async def get_db():
+    async with primary_session() as db:
+        yield db
 
-username = 'admin'
-password = 'admin'
-host = 'localhost'
-port = '5432'
-
-connection_string = f"postgresql://{username}:{password}@{host}:{port}/Resep"
-
-engine = create_engine(connection_string)
-
-Base.metadata.create_all(bind=engine)
+READ_YOUR_WRITES_COOKIE = "read_primary_until"
+REPLICA_CHECK_TIMEOUT = 2
+
+# Seconds the replica is behind; 0 when it has replayed everything it
+# received (an idle primary otherwise looks like growing lag).
+REPLICA_LAG_SQL = {
+    "postgresql": "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                  "ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp()) END",
+    "sqlite": "SELECT 0",
+}
+
+class Replica:
+    def __init__(self, engine):
+        self.engine = engine
+        self.name = repr(engine.url)
+        self.healthy = False
+        self.lag = None
+        self.error = None
+        self.in_flight = 0
+        self.reads = 0
+
+class Replicas:
+    # DB_REPLICA_URLS: GET handlers read from these (get_read_db), everything
+    # else uses the primary. A background check every
+    # DB_REPLICA_CHECK_INTERVAL seconds takes a replica out while it is down
+    # or more than DB_REPLICA_MAX_LAG_SECONDS behind; with none left, reads go
+    # to the primary.
+    def __init__(self):
+        self.replicas = []
+        self.policy = "round_robin"
+        self.max_lag = 0
+        self.turn = 0
+        self.task = None
+
+    async def start(self, settings):
+        self.policy = settings.db_replica_policy
+        self.max_lag = settings.db_replica_max_lag_seconds
+        for replica_url in filter(None, (part.strip() for part in settings.db_replica_urls.split(","))):
+            url = async_url(make_url(replica_url))
+            self.replicas.append(Replica(create_async_engine(url, **engine_options(url, settings, is_async=True))))
+        if self.replicas:
+            await self.check()
+            self.task = asyncio.create_task(self.monitor(settings.db_replica_check_interval))
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        for replica in self.replicas:
+            await replica.engine.dispose()
+        self.replicas = []
+
+    async def monitor(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            await self.check()
+
+    async def check(self):
+        for replica in self.replicas:
+            try:
+                lag = await asyncio.wait_for(self.lag(replica), REPLICA_CHECK_TIMEOUT)
+            except Exception as error:
+                replica.healthy, replica.lag, replica.error = False, None, str(error) or type(error).__name__
+                continue
+            replica.lag = lag
+            replica.healthy = lag <= self.max_lag
+            replica.error = None if replica.healthy else f"{lag:.1f}s behind"
+
+    async def lag(self, replica):
+        async with replica.engine.connect() as connection:
+            return float((await connection.execute(text(REPLICA_LAG_SQL[replica.engine.dialect.name]))).scalar() or 0)
+
+    def choose(self):
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        if self.policy == "least_connections":
+            return min(healthy, key=lambda replica: replica.in_flight)
+        self.turn += 1
+        return healthy[self.turn % len(healthy)]
+
+    def stats(self):
+        return {
+            "policy": self.policy,
+            "replicas": [
+                {"url": replica.name, "healthy": replica.healthy, "lag_seconds": replica.lag, "error": replica.error,
+                 "in_flight": replica.in_flight, "reads": replica.reads}
+                for replica in self.replicas
+            ],
+        }
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+replicas = Replicas()
 
-app = FastAPI()
+def reads_from_primary(request):
+    # Read-your-writes: a client that has just written reads from the primary
+    # until its cookie runs out.
+    try:
+        return float(request.cookies.get(READ_YOUR_WRITES_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+async def get_read_db(request: Request):
+    replica = None if reads_from_primary(request) else replicas.choose()
+    if replica is None:
+        async with primary_session() as db:
+            yield db
+        return
+    replica.in_flight += 1
+    replica.reads += 1
+    try:
+        async with AsyncSessionLocal(bind=replica.engine) as db:
+            yield db
+    except DBAPIError as error:
+        # Down since the last check: stop sending it reads until the next one
+        # finds it healthy again.
+        if error.connection_invalidated or isinstance(error, (OperationalError, InterfaceError)):
+            replica.healthy, replica.error = False, str(error.orig)
+        raise
+    finally:
+        replica.in_flight -= 1
+
+class ReadYourWritesMiddleware:
+    # With replicas configured, a successful write sets a cookie that sends
+    # the client's reads to the primary for READ_YOUR_WRITES_SECONDS.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in ("GET", "HEAD", "OPTIONS") or not replicas.replicas:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_sticky(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                window = settings.read_your_writes_seconds
+                cookie = f"{READ_YOUR_WRITES_COOKIE}={time.time() + window:.3f}; Max-Age={int(window) or 1}; Path=/; HttpOnly; SameSite=Lax"
+                MutableHeaders(scope=message).append("Set-Cookie", cookie)
+            await send(message)
+
+        await self.app(scope, receive, send_sticky)
+
+app.add_middleware(ReadYourWritesMiddleware)
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 500
+
+class PageParams:
+    def __init__(self, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), after: Optional[int] = None, stream: bool = False):
+        self.limit = limit
+        self.after = after
+        self.stream = stream
+
+class FeedParams:
+    def __init__(self, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), before: Optional[int] = None):
+        self.limit = limit
+        self.before = before
+
+def project(model, schema):
+    # Select only the columns the response schema needs. Rows come back as
+    # plain tuples, so no ORM entities or identity map entries are built.
+    return select(*[getattr(model, name) for name in schema.__fields__])
+
+def row_dict(row):
+    return row._asdict()
+
+@functools.lru_cache(maxsize=None)
+def row_serializer(schema):
+    # Row -> dict for rows selected with project(model, schema), built once per
+    # schema. Columns come back in field order, so values are zipped onto the
+    # field names; float fields are converted (Numeric columns return Decimal).
+    names = tuple(schema.__fields__)
+    floats = [i for i, field in enumerate(schema.__fields__.values()) if field.outer_type_ is float]
+    if not floats:
+        return lambda row: dict(zip(names, row))
+    def serialize(row):
+        values = list(row)
+        for i in floats:
+            if values[i] is not None:
+                values[i] = float(values[i])
+        return dict(zip(names, values))
+    return serialize
+
+def json_response_class(name):
+    if name == "orjson":
+        from fastapi.responses import ORJSONResponse
+        return ORJSONResponse
+    if name == "fast":
+        return JSONResponse
+    return None
+
+def list_response(items, response):
+    # JSON_RESPONSE=fast or orjson sends the rows as they are instead of
+    # returning them for FastAPI to validate against response_model and run
+    # through jsonable_encoder. The OpenAPI schema still comes from
+    # response_model. Headers set on the injected response are carried over,
+    # since FastAPI does not merge them into a returned Response.
+    response_class = json_response_class(settings.json_response)
+    if response_class is None:
+        return items
+    return response_class(content=items, headers=dict(response.headers))
+
+async def ndjson_lines(db, stmt, serialize):
+    result = await db.stream(stmt.execution_options(yield_per=STREAM_BATCH_SIZE))
+    async for row in result:
+        yield json.dumps(serialize(row), default=str) + "\n"
+
+async def paginate(db, stmt, model, response, page, serialize=row_dict):
+    # Keyset pagination on the primary key: the next page starts after the
+    # last id returned, exposed to the client through X-Next-Cursor.
+    stmt = stmt.order_by(model.id)
+    if page.after is not None:
+        stmt = stmt.where(model.id > page.after)
+    if page.stream:
+        return StreamingResponse(ndjson_lines(db, stmt, serialize), media_type="application/x-ndjson")
+    rows = (await db.execute(stmt.limit(page.limit + 1))).all()
+    if len(rows) > page.limit:
+        rows = rows[:page.limit]
+        response.headers["X-Next-Cursor"] = str(rows[-1].id)
+    return list_response([serialize(row) for row in rows], response)
+
+async def feed(db, stmt, model, response, page):
+    # Newest first, keyset on the primary key: the next page is everything
+    # before the last id returned, exposed through X-Next-Cursor.
+    stmt = stmt.order_by(model.id.desc())
+    if page.before is not None:
+        stmt = stmt.where(model.id < page.before)
+    rows = (await db.execute(stmt.limit(page.limit + 1))).all()
+    if len(rows) > page.limit:
+        rows = rows[:page.limit]
+        response.headers["X-Next-Cursor"] = str(rows[-1].id)
+    return [row_dict(row) for row in rows]
+
+def dialect_insert(db, table):
+    if db.bind.dialect.name == "sqlite":
+        return sqlite_insert(table)
+    return pg_insert(table)
+
+def rating_bucket(value):
+    return "star_%d" % min(5, max(1, int(value + 0.5)))
+
+async def apply_ratings(db, resep_master_id, values, sign=1):
+    # Fold votes for one recipe into rating_summary (sign=-1 takes them back
+    # out) with a single upsert, so reads never aggregate the rating table.
+    values = [value for value in values if value is not None]
+    if resep_master_id is None or not values:
+        return
+    table = RatingSummary.__table__
+    buckets = collections.Counter(rating_bucket(value) for value in values)
+    count = table.c.count + sign * len(values)
+    total = table.c.total + sign * sum(values)
+    changes = {
+        "count": count,
+        "total": total,
+        "average": case((count > 0, total / count), else_=None),
+        **{bucket: table.c[bucket] + sign * n for bucket, n in buckets.items()},
+    }
+    if sign < 0:
+        # Votes can only be taken out of an existing row; a missing one has
+        # nothing to subtract from.
+        await db.execute(update(table).where(table.c.id_resep_master == resep_master_id).values(**changes))
+        return
+    stmt = dialect_insert(db, table).values(
+        id_resep_master=resep_master_id,
+        count=len(values),
+        total=sum(values),
+        average=sum(values) / len(values),
+        **buckets,
+    )
+    await db.execute(stmt.on_conflict_do_update(index_elements=[table.c.id_resep_master], set_=changes))
+
+async def apply_rating(db, resep_master_id, value, sign=1):
+    await apply_ratings(db, resep_master_id, [value], sign)
+
+async def apply_reply_counts(db, deltas):
+    # Keeps testi_diskusi.reply_count in step with reply_diskusi, so feeds
+    # never count replies on read.
+    for testi_diskusi_id, delta in deltas.items():
+        if testi_diskusi_id is not None and delta:
+            await db.execute(update(TestiDiskusi).where(TestiDiskusi.id == testi_diskusi_id).values(
+                reply_count=TestiDiskusi.reply_count + delta
+            ).execution_options(synchronize_session=False))
+
+MAX_BULK_SIZE = 1000
+
+async def bulk_insert(db, model, rows):
+    # One multi-row INSERT ... RETURNING. Dialects without RETURNING
+    # (SQLite) fall back to an ORM flush of the batch.
+    values = [row.dict() for row in rows]
+    if db.bind.dialect.full_returning:
+        result = await db.execute(insert(model).values(values).returning(*model.__table__.c))
+        return [row_dict(row) for row in result]
+    items = [model(**value) for value in values]
+    db.add_all(items)
+    await db.flush()
+    return items
+
+def if_match_version(if_match):
+    # If-Match carries a version as sent in the ETag of PATCH/PUT responses:
+    # "3" (W/"3" and a bare 3 are accepted too). "*" matches any version.
+    if_match = if_match.strip()
+    if if_match == "*":
+        return None
+    try:
+        return int(if_match.removeprefix("W/").strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail="If-Match does not match the current version")
+
+def version_etag(version):
+    return f'"{version}"'
+
+async def patch_row(db, model, row_id, patch, if_match=None, columns=None):
+    # Writes the fields sent in patch and bumps version, with one
+    # UPDATE ... RETURNING that also returns the row as it was before (a
+    # self-join on the same version), for the handlers to move counts and
+    # drop cache entries. With a version from If-Match (412) or the body
+    # (409) the WHERE only matches that version, so concurrent editors cannot
+    # overwrite each other and no row lock is held.
+    # Returns (new row, old row) as dicts of columns (default: every column
+    # of the table).
+    values = patch.dict(exclude_unset=True, exclude_none=True)
+    version = values.pop("version", None)
+    conflict_status = status.HTTP_409_CONFLICT
+    if if_match is not None:
+        version = if_match_version(if_match)
+        conflict_status = status.HTTP_412_PRECONDITION_FAILED
+    if not values:
+        raise HTTPException(status_code=400, detail="Nothing to update")
+    table = model.__table__
+    columns = columns or list(table.c)
+    stmt = update(table).where(table.c.id == row_id).values(**values, version=table.c.version + 1)
+    if version is not None:
+        stmt = stmt.where(table.c.version == version)
+    old = table.alias("old")
+    old_columns = [old.c[column.name] for column in columns if column.name in table.c.keys()]
+    while True:
+        if db.bind.dialect.full_returning:
+            # The FROM side comes from the statement's snapshot; matching its
+            # version makes a row changed concurrently a miss rather than a
+            # wrong "old" row.
+            returning = stmt.where(old.c.id == table.c.id, old.c.version == table.c.version)
+            row = (await db.execute(returning.returning(*columns, *[column.label(f"old_{column.name}") for column in old_columns]))).first()
+            if row is not None:
+                row = row._asdict()
+                return {column.name: row[column.name] for column in columns}, {column.name: row[f"old_{column.name}"] for column in old_columns}
+        else:
+            # No UPDATE ... RETURNING (SQLite, local runs): read the row, then
+            # update it only if it still has the version that was read.
+            old_row = (await db.execute(select(*columns).where(table.c.id == row_id))).first()
+            if old_row is not None and version in (None, old_row.version):
+                result = await db.execute(stmt.where(table.c.version == old_row.version))
+                if result.rowcount:
+                    old_row = old_row._asdict()
+                    return {**old_row, **values, "version": old_row["version"] + 1}, old_row
+        if (await db.execute(select(table.c.id).where(table.c.id == row_id))).first() is None:
+            raise HTTPException(status_code=404, detail=f"{model.__name__} not found")
+        if version is not None:
+            raise HTTPException(status_code=conflict_status, detail=f"{model.__name__} was changed by another update")
+        # Unconditional, but the row changed between the read and the write:
+        # try again on its new version.
+
+async def allocate_ids(db, model, count):
+    # Primary keys for count new rows in one round trip: from the sequence on
+    # PostgreSQL, after the current maximum on SQLite (local runs).
+    if db.bind.dialect.name == "postgresql":
+        sequence = f"{model.__tablename__}_id_seq"
+        return (await db.execute(select(func.nextval(sequence)).select_from(func.generate_series(1, count)))).scalars().all()
+    start = (await db.execute(select(func.coalesce(func.max(model.id), 0)))).scalar() + 1
+    return list(range(start, start + count))
+
+async def assign_ids(db, objects):
+    # Taking primary keys from the sequence up front lets the flush send each
+    # table as one executemany instead of one INSERT ... RETURNING per row.
+    if not objects or db.bind.dialect.name != "postgresql":
+        return
+    ids = await allocate_ids(db, type(objects[0]), len(objects))
+    for obj, id in zip(objects, ids):
+        obj.id = id
+
+RATING_SUMMARY_COLUMNS = ["id_resep_master", "count", "total", "average", "star_1", "star_2", "star_3", "star_4", "star_5"]
+
+def rating_summary_votes():
+    # One rating_summary row per recipe, aggregated from the rating table.
+    buckets = [
+        Rating.rating < 1.5,
+        and_(Rating.rating >= 1.5, Rating.rating < 2.5),
+        and_(Rating.rating >= 2.5, Rating.rating < 3.5),
+        and_(Rating.rating >= 3.5, Rating.rating < 4.5),
+        Rating.rating >= 4.5,
+    ]
+    return select(
+        Rating.id_resep_master,
+        func.count(Rating.rating),
+        func.sum(Rating.rating),
+        func.avg(Rating.rating),
+        *[func.sum(case((bucket, 1), else_=0)) for bucket in buckets],
+    ).where(Rating.id_resep_master.isnot(None), Rating.rating.isnot(None)).group_by(Rating.id_resep_master)
+
+def rebuild_rating_summary(db):
+    table = RatingSummary.__table__
+    db.execute(table.delete())
+    db.execute(table.insert().from_select(RATING_SUMMARY_COLUMNS, rating_summary_votes()))
+    db.commit()
 
-def get_db():
-    db = SessionLocal()
+# Inlined rather than bound so search_vector() is textually the expression
+# of the GIN indexes in migration 0004 and the planner can use them.
+SEARCH_CONFIG = literal_column("'simple'::regconfig")
+
+def search_vector(column):
+    return func.to_tsvector(SEARCH_CONFIG, func.coalesce(column, literal_column("''")))
+
+def text_search(dialect_name, column, q):
+    # Returns (match, rank) for one text column.
+    if dialect_name == "postgresql":
+        query = func.websearch_to_tsquery(SEARCH_CONFIG, q)
+        return search_vector(column).op("@@")(query), func.ts_rank(search_vector(column), query)
+    # SQLite (local runs): every word as a substring, unranked.
+    return and_(*[column.ilike(f"%{word}%") for word in q.split()]), literal(1.0)
+
+def recipes_with_ingredient(dialect_name, name):
+    match, _ = text_search(dialect_name, BahanDetail.name, name)
+    return select(BahanMaster.id_resep_master).join(BahanDetail, BahanDetail.id_bahan_master == BahanMaster.id).where(match)
+
+def search_hits(dialect_name, q):
+    # (id_resep_master, score) for every matching row, one GIN lookup per
+    # field; a hit in the recipe name weighs more than one in a step.
+    resep_match, resep_rank = text_search(dialect_name, ResepMaster.name, q)
+    bahan_match, bahan_rank = text_search(dialect_name, BahanDetail.name, q)
+    tips_match, tips_rank = text_search(dialect_name, CaraMembuat.tips, q)
+    cara_match, cara_rank = text_search(dialect_name, CaraMembuatDetail.cara, q)
+    return union_all(
+        select(ResepMaster.id.label("id_resep_master"), resep_rank.label("score")).where(resep_match),
+        select(BahanMaster.id_resep_master, (bahan_rank * 0.6).label("score")).join(BahanDetail, BahanDetail.id_bahan_master == BahanMaster.id).where(bahan_match),
+        select(CaraMembuat.id_resep_master, (tips_rank * 0.3).label("score")).where(tips_match),
+        select(CaraMembuat.id_resep_master, (cara_rank * 0.3).label("score")).join(CaraMembuatDetail, CaraMembuatDetail.id_cara_membuat == CaraMembuat.id).where(cara_match),
+    ).subquery()
+
+def search_statement(dialect_name, q, include, exclude):
+    if q:
+        hits = search_hits(dialect_name, q)
+        scores = select(hits.c.id_resep_master, func.sum(hits.c.score).label("score")).group_by(hits.c.id_resep_master).subquery()
+        stmt = select(ResepMaster.id, ResepMaster.name, scores.c.score).join(scores, scores.c.id_resep_master == ResepMaster.id)
+    else:
+        stmt = select(ResepMaster.id, ResepMaster.name, literal(0.0).label("score"))
+    for name in include:
+        stmt = stmt.where(ResepMaster.id.in_(recipes_with_ingredient(dialect_name, name)))
+    for name in exclude:
+        stmt = stmt.where(~recipes_with_ingredient(dialect_name, name).where(BahanMaster.id_resep_master == ResepMaster.id).exists())
+    return stmt.order_by(literal_column("score").desc(), ResepMaster.id.desc())
+
+def normalize_ingredient(name):
+    return " ".join((name or "").lower().split())
+
+def load_numpy():
+    # numpy is only needed for GET /resep_master/{id}/similar.
     try:
-        yield db
+        import numpy
+    except ImportError:
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail="Similar recipes need numpy installed")
+    return numpy
+
+def popcount(np, words):
+    # Set bits per element, summed over the first axis.
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).sum(axis=0, dtype=np.int32)
+    table = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+    return table[words.view(np.uint8)].reshape(words.shape[0], -1, 8).sum(axis=(0, 2), dtype=np.int32)
+
+RECIPE_INGREDIENTS = select(BahanMaster.id_resep_master, BahanDetail.name).join(BahanDetail, BahanDetail.id_bahan_master == BahanMaster.id)
+
+SimilarMetric = enum.Enum("SimilarMetric", {"jaccard": "jaccard", "cosine": "cosine"}, type=str)
+
+class SimilarIndex:
+    # Recipe x ingredient bit matrix, stored as one uint64 row per 64
+    # ingredients of the vocabulary and one column per recipe. A recipe's
+    # overlap with every other recipe is an AND and a popcount over the few
+    # rows its own ingredients are in. Per process; built on first use,
+    # rebuilt every rebuild_seconds and patched in between for the recipes
+    # whose ingredients changed (invalidate()).
+    def __init__(self, rebuild_seconds):
+        self.rebuild_seconds = rebuild_seconds
+        self.lock = asyncio.Lock()
+        self.dirty = set()
+        self.built_at = None
+        self.vocabulary = {}
+        self.columns = {}
+        self.ids = self.bits = self.sizes = None
+        self.count = 0
+
+    def load(self, pairs):
+        # pairs: (recipe id, ingredient name). Builds the whole matrix and
+        # swaps it in at once.
+        np = load_numpy()
+        vocabulary, columns, recipe_columns, words = {}, {}, [], []
+        for recipe_id, name in pairs:
+            name = normalize_ingredient(name)
+            if name:
+                recipe_columns.append(columns.setdefault(recipe_id, len(columns)))
+                words.append(vocabulary.setdefault(name, len(vocabulary)))
+        recipe_columns = np.array(recipe_columns, dtype=np.int64)
+        words = np.array(words, dtype=np.int64)
+        bits = np.zeros((len(vocabulary) // 64 + 1, max(1024, len(columns))), dtype=np.uint64)
+        np.bitwise_or.at(bits, (words >> 6, recipe_columns), np.left_shift(np.uint64(1), (words & 63).astype(np.uint64)))
+        ids = np.zeros(bits.shape[1], dtype=np.int64)
+        ids[list(columns.values())] = list(columns.keys())
+        self.vocabulary, self.columns, self.ids, self.bits = vocabulary, columns, ids, bits
+        self.sizes = popcount(np, bits)
+        self.count = len(columns)
+
+    def set_ingredients(self, ingredients):
+        # ingredients: {recipe id: ingredient names}; an empty set removes
+        # the recipe from the results.
+        np = load_numpy()
+        for recipe_id, names in ingredients.items():
+            column = self.columns.get(recipe_id)
+            if column is None:
+                if not names:
+                    continue
+                column = self.columns[recipe_id] = self.count
+                self.count += 1
+                if column == self.bits.shape[1]:
+                    self.bits = np.concatenate([self.bits, np.zeros_like(self.bits)], axis=1)
+                    self.ids = np.concatenate([self.ids, np.zeros_like(self.ids)])
+                    self.sizes = np.concatenate([self.sizes, np.zeros_like(self.sizes)])
+                self.ids[column] = recipe_id
+            self.bits[:, column] = 0
+            names = {normalize_ingredient(name) for name in names} - {""}
+            for name in names:
+                word = self.vocabulary.setdefault(name, len(self.vocabulary))
+                if word >> 6 == self.bits.shape[0]:
+                    self.bits = np.concatenate([self.bits, np.zeros((1, self.bits.shape[1]), dtype=np.uint64)])
+                self.bits[word >> 6, column] |= np.uint64(1) << np.uint64(word & 63)
+            self.sizes[column] = len(names)
+
+    def similar(self, recipe_id, limit, metric):
+        # [(recipe id, score)], best first, ties by newest recipe.
+        np = load_numpy()
+        column = self.columns.get(recipe_id)
+        if column is None or not self.sizes[column]:
+            return []
+        target = self.bits[:, column]
+        rows = np.flatnonzero(target)
+        overlap = popcount(np, self.bits[rows, :self.count] & target[rows, None])
+        sizes = self.sizes[:self.count]
+        if metric == SimilarMetric.cosine:
+            denominator = np.sqrt(sizes * float(sizes[column]))
+        else:
+            denominator = (sizes + sizes[column] - overlap).astype(np.float64)
+        scores = np.divide(overlap, denominator, out=np.zeros(self.count), where=denominator > 0)
+        scores[column] = 0
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > limit:
+            # Everything scoring at least the limit-th best, so ties at the
+            # cut are decided by id below rather than by argpartition.
+            cut = np.partition(scores[candidates], len(candidates) - limit)[len(candidates) - limit]
+            candidates = candidates[scores[candidates] >= cut]
+        best = candidates[np.lexsort((-self.ids[candidates], -scores[candidates]))][:limit]
+        return [(int(self.ids[i]), float(scores[i])) for i in best]
+
+    async def refresh(self):
+        # Reads from the primary, so a lagging replica cannot undo a change.
+        if self.built_at is not None and self.lock.locked():
+            return
+        async with self.lock:
+            async with AsyncSessionLocal() as db:
+                if self.built_at is None or time.monotonic() - self.built_at > self.rebuild_seconds:
+                    self.dirty = set()
+                    built_at = time.monotonic()
+                    pairs = (await db.execute(RECIPE_INGREDIENTS)).all()
+                    await run_in_threadpool(self.load, pairs)
+                    self.built_at = built_at
+                elif self.dirty:
+                    ingredients = {recipe_id: set() for recipe_id in self.dirty}
+                    self.dirty = set()
+                    stmt = RECIPE_INGREDIENTS.where(BahanMaster.id_resep_master.in_(ingredients))
+                    for recipe_id, name in await db.execute(stmt):
+                        ingredients[recipe_id].add(name)
+                    self.set_ingredients(ingredients)
+
+    def invalidate(self, recipe_ids):
+        self.dirty.update(recipe_id for recipe_id in recipe_ids if recipe_id is not None)
+
+    def reset(self):
+        self.built_at = None
+
+similar_index = SimilarIndex(settings.similar_rebuild_seconds)
+
+BLOB_CHUNK_SIZE = 64 * 1024
+
+class LocalBlobStore:
+    # Content-addressed: the key is the sha256 of the bytes, so uploading the
+    # same picture twice stores it once.
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def variant_path(self, key, size):
+        return f"{self.path(key)}.{size}.jpg"
+
+    def temp_path(self):
+        os.makedirs(os.path.join(self.root, "tmp"), exist_ok=True)
+        return os.path.join(self.root, "tmp", f"{uuid.uuid4().hex}.tmp")
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def put_file(self, tmp_path, key):
+        # Moves a fully written temp file into place under its key; False if
+        # the same bytes were already stored.
+        path = self.path(key)
+        if os.path.exists(path):
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+        return True
+
+    def delete(self, key, variants=()):
+        for path in [self.path(key)] + [self.variant_path(key, variant) for variant in variants]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def put(self, data):
+        key = hashlib.sha256(data).hexdigest()
+        path = self.path(key)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return key
+
+blob_store = LocalBlobStore(settings.blob_root)
+
+IMAGE_TYPES = {"image/jpeg", "image/png", "image/gif", "image/webp"}
+SNIFF_BYTES = 12
+
+def sniff_image_type(head):
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+def check_upload_headers(content_type, content_length=None):
+    # Rejects before a single byte of the body is read.
+    if content_type and content_type.split(";")[0].strip() not in IMAGE_TYPES | {"application/octet-stream"}:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=f"Upload must be one of {', '.join(sorted(IMAGE_TYPES))}")
+    if content_length and content_length.isdigit() and int(content_length) > settings.upload_max_bytes:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=f"Upload is larger than {settings.upload_max_bytes} bytes")
+
+# The other form fields (name, email) and the multipart framing around the
+# picture.
+MULTIPART_OVERHEAD_BYTES = 16 * 1024
+
+class MultipartLimitMiddleware:
+    # Starlette spools a whole multipart body to disk while parsing the form,
+    # before the handler and store_upload's limit run, so form uploads are
+    # checked on Content-Length first: over UPLOAD_MAX_BYTES is 413 and no
+    # length (a chunked body) is 411. The server stops reading at the
+    # declared length.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        headers = Headers(scope=scope) if scope["type"] == "http" else None
+        if headers is None or not headers.get("content-type", "").startswith("multipart/form-data"):
+            await self.app(scope, receive, send)
+            return
+        content_length = headers.get("content-length", "")
+        if not content_length.isdigit():
+            response = JSONResponse({"detail": "Form uploads need a Content-Length"}, status_code=status.HTTP_411_LENGTH_REQUIRED)
+        elif int(content_length) > settings.upload_max_bytes + MULTIPART_OVERHEAD_BYTES:
+            response = JSONResponse({"detail": f"Upload is larger than {settings.upload_max_bytes} bytes"}, status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        else:
+            await self.app(scope, receive, send)
+            return
+        await response(scope, receive, send)
+
+app.add_middleware(MultipartLimitMiddleware)
+
+async def upload_chunks(upload):
+    while chunk := await upload.read(BLOB_CHUNK_SIZE):
+        yield chunk
+
+async def store_upload(chunks):
+    # Hashes and writes the upload to a temp file chunk by chunk, so memory
+    # use does not depend on its size, and stops at the first chunk over the
+    # size limit or as soon as the leading bytes are not a known image type.
+    # Returns (key, sniffed content type, whether the blob is new).
+    digest = hashlib.sha256()
+    size = 0
+    head = b""
+    content_type = None
+    tmp_path = blob_store.temp_path()
+    try:
+        async with await anyio.open_file(tmp_path, "wb") as file:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > settings.upload_max_bytes:
+                    raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=f"Upload is larger than {settings.upload_max_bytes} bytes")
+                if content_type is None and len(head) < SNIFF_BYTES:
+                    head += chunk[:SNIFF_BYTES - len(head)]
+                    if len(head) == SNIFF_BYTES:
+                        content_type = sniff_image_type(head)
+                        if content_type is None:
+                            raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Upload is not a JPEG, PNG, GIF or WebP image")
+                digest.update(chunk)
+                await file.write(chunk)
+        if content_type is None:
+            raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Upload is not a JPEG, PNG, GIF or WebP image")
+        key = digest.hexdigest()
+        created = await run_in_threadpool(blob_store.put_file, tmp_path, key)
     finally:
-        db.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return key, content_type, created
+
+THUMBNAIL_SIZES = {"small": 64, "medium": 256, "large": 1024}
+
+ImageSize = enum.Enum("ImageSize", {name: name for name in THUMBNAIL_SIZES}, type=str)
+
+def make_thumbnails(path, sizes, max_pixels):
+    # Runs in an image worker process; Pillow is only imported there. The
+    # pixel count comes from the header, so a small file that would decode
+    # to gigabytes is refused before decoding.
+    from PIL import Image
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    with Image.open(path) as image:
+        if image.width * image.height > max_pixels:
+            raise Image.DecompressionBombError(f"Image has {image.width * image.height} pixels, the limit is {max_pixels}")
+        image = image.convert("RGB")
+    for name, pixels in sizes:
+        variant_path = f"{path}.{name}.jpg"
+        if os.path.exists(variant_path):
+            continue
+        variant = image.copy()
+        variant.thumbnail((pixels, pixels))
+        tmp_path = f"{variant_path}.{uuid.uuid4().hex}.tmp"
+        variant.save(tmp_path, "JPEG", quality=85)
+        os.replace(tmp_path, variant_path)
+
+class ImageWorkers:
+    # Resizing is CPU-bound, so it runs in a process pool, started on first
+    # use, instead of on the event loop or in the thread pool.
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self.pool = None
+
+    async def run(self, fn, *args):
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return await asyncio.get_running_loop().run_in_executor(self.pool, fn, *args)
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+image_workers = ImageWorkers(settings.image_workers)
+
+async def generate_thumbnails(key):
+    from PIL import Image
+    try:
+        await image_workers.run(make_thumbnails, blob_store.path(key), list(THUMBNAIL_SIZES.items()), settings.image_max_pixels)
+    except Image.DecompressionBombError:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=f"Image is larger than {settings.image_max_pixels} pixels")
+    except OSError:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Image could not be decoded")
+
+async def store_image(chunks):
+    key, content_type, created = await store_upload(chunks)
+    try:
+        await generate_thumbnails(key)
+    except HTTPException:
+        # Nothing will point at a picture that cannot be thumbnailed; a blob
+        # that was already stored belongs to an earlier row and stays.
+        if created:
+            await run_in_threadpool(blob_store.delete, key, THUMBNAIL_SIZES)
+        raise
+    return key, content_type
+
+def parse_range(header, size):
+    # Only a single "bytes=" range is honoured; anything else gets the full body.
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start, _, end = header[len("bytes="):].strip().partition("-")
+    try:
+        if start:
+            start = int(start)
+            end = min(int(end), size - 1) if end else size - 1
+        else:
+            start = max(size - int(end), 0)
+            end = size - 1
+    except ValueError:
+        return None
+    return start, end
+
+class BlobFileResponse(Response):
+    def __init__(self, path, size, start=0, end=None, status_code=200, headers=None, media_type=None):
+        self.path = path
+        self.start = start
+        self.end = size - 1 if end is None else end
+        headers = dict(headers or {})
+        headers["content-length"] = str(self.end - self.start + 1)
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        count = self.end - self.start + 1
+        if scope["method"] == "HEAD" or count <= 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                # Let the server sendfile() straight from the page cache.
+                await send({"type": "http.response.zerocopysend", "file": file.wrapped, "offset": self.start, "count": count, "more_body": False})
+                return
+            await file.seek(self.start)
+            while count > 0:
+                chunk = await file.read(min(BLOB_CHUNK_SIZE, count))
+                if not chunk:
+                    break
+                count -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": count > 0})
+        if count > 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+# Cache-Control by route template prefix (e.g. /resep_master/{resep_master_id}),
+# first match wins. Recipe content changes rarely and can be reused for a
+# short while; discussions, ratings, anything that embeds them (the recipe
+# reads carry rating_summary) and user data always revalidate (cheap with
+# ETags); metrics are never cached.
+CACHE_CONTROL = [
+    ("/metrics", "no-store"),
+    ("/admin", "no-store"),
+    ("/users", "private, no-cache"),
+    ("/testi_diskusi", "no-cache"),
+    ("/reply_diskusi", "no-cache"),
+    ("/rating", "no-cache"),
+    ("/resep_master/top_rated", "no-cache"),
+    ("/resep_master/{resep_master_id}/testi_diskusi", "no-cache"),
+    ("/resep_master/{resep_master_id}/similar", "public, max-age=30"),
+    ("/resep_master/{resep_master_id}", "no-cache"),
+    ("/", "public, max-age=30"),
+]
+IMAGE_CACHE_CONTROL = "private, max-age=300"
+
+def cache_control(scope):
+    # Unmatched requests (404s) only have their raw path.
+    route = scope.get("route")
+    path = route.path if route is not None else scope["path"]
+    return next(policy for prefix, policy in CACHE_CONTROL if path.startswith(prefix))
+
+def body_etag(body):
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+def json_etag(value):
+    return body_etag(json.dumps(value, sort_keys=True, separators=(",", ":"), default=str).encode())
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+def not_modified(headers):
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+def cached_response(request, entry):
+    if etag_matches(request.headers.get("if-none-match"), entry["etag"]):
+        return not_modified({"ETag": entry["etag"]})
+    return JSONResponse(content=jsonable_encoder(entry["value"]), headers={"ETag": entry["etag"]})
+
+class ConditionalGetMiddleware:
+    # Adds Cache-Control to GET responses, and an ETag to JSON bodies that
+    # don't have one yet; answers a matching If-None-Match with 304. Written
+    # as plain ASGI so file responses (zerocopysend) and NDJSON streams pass
+    # through untouched.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            await self.app(scope, receive, send)
+            return
+        if_none_match = Headers(scope=scope).get("if-none-match")
+        start = None
+        body = []
+
+        async def send_conditional(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                if message["status"] in (200, 304) and "cache-control" not in headers:
+                    headers["Cache-Control"] = cache_control(scope)
+                if message["status"] != 200 or "etag" in headers or not headers.get("content-type", "").startswith("application/json"):
+                    await send(message)
+                    return
+                start = message
+                return
+            if start is None or message["type"] != "http.response.body":
+                await send(message)
+                return
+            body.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+            content = b"".join(body)
+            headers = MutableHeaders(scope=start)
+            headers["ETag"] = body_etag(content)
+            if etag_matches(if_none_match, headers["ETag"]):
+                del headers["content-length"]
+                del headers["content-type"]
+                start["status"] = status.HTTP_304_NOT_MODIFIED
+                content = b""
+            await send(start)
+            await send({"type": "http.response.body", "body": content, "more_body": False})
+
+        await self.app(scope, receive, send_conditional)
+
+app.add_middleware(ConditionalGetMiddleware)
+
+def blob_response(request, key, media_type, variant=None):
+    headers = {"ETag": f'"{key}"' if variant is None else f'"{key}.{variant}"', "Cache-Control": IMAGE_CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return not_modified(headers)
+    path = blob_store.path(key)
+    if variant is not None:
+        path = blob_store.variant_path(key, variant)
+        media_type = "image/jpeg"
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        raise HTTPException(status_code=404, detail="Image not found")
+    headers["Accept-Ranges"] = "bytes"
+    byte_range = parse_range(request.headers.get("range"), size)
+    if byte_range is None:
+        return BlobFileResponse(path, size, headers=headers, media_type=media_type)
+    start, end = byte_range
+    if start >= size or start > end:
+        return Response(status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE, headers={"Content-Range": f"bytes */{size}"})
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return BlobFileResponse(path, size, start, end, status_code=status.HTTP_206_PARTIAL_CONTENT, headers=headers, media_type=media_type)
+
+async def image_response(request, key, media_type, size=None):
+    variant = size.value if size is not None else None
+    if variant is not None and not await run_in_threadpool(os.path.exists, blob_store.variant_path(key, variant)):
+        # Pictures stored before thumbnails existed get them on first request.
+        await generate_thumbnails(key)
+    return blob_response(request, key, media_type, variant)
+
+class MemoryCache:
+    # LRU with a per-entry TTL, bounded to max_entries.
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = collections.OrderedDict()
+
+    async def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    async def set(self, key, value):
+        self.entries[key] = (value, time.monotonic() + self.ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.entries.pop(key, None)
+
+    async def clear(self):
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+class RedisCache:
+    # Works with any client exposing async get/set(ex=)/delete, e.g.
+    # redis.asyncio.Redis or an in-process stand-in.
+    def __init__(self, client, ttl, prefix="resep:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    async def get(self, key):
+        value = await self.client.get(self.prefix + key)
+        return None if value is None else json.loads(value)
+
+    async def set(self, key, value):
+        await self.client.set(self.prefix + key, json.dumps(value, default=str), ex=max(1, int(self.ttl)))
+
+    async def delete(self, *keys):
+        if keys:
+            await self.client.delete(*[self.prefix + key for key in keys])
+
+    async def clear(self):
+        keys = [key async for key in self.client.scan_iter(match=self.prefix + "*")]
+        if keys:
+            await self.client.delete(*keys)
+
+class NoCache:
+    async def get(self, key):
+        return None
+
+    async def set(self, key, value):
+        pass
+
+    async def delete(self, *keys):
+        pass
+
+    async def clear(self):
+        pass
+
+class ReadCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.replica_lag = 0
+        self.pending = set()
+
+    async def get(self, key):
+        value = await self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key, value):
+        # The ETag is computed once here, so a cache hit can answer
+        # If-None-Match without serializing the value again.
+        entry = {"etag": json_etag(value), "value": value}
+        await self.backend.set(key, entry)
+        return entry
+
+    async def delete(self, *keys):
+        await self.backend.delete(*keys)
+        if keys and self.replica_lag:
+            # A replica that has not replayed the write yet can serve the old
+            # rows and put them back; drop them again once it has caught up.
+            task = asyncio.create_task(self.delete_later(keys))
+            self.pending.add(task)
+            task.add_done_callback(self.pending.discard)
+
+    async def delete_later(self, keys):
+        await asyncio.sleep(self.replica_lag)
+        await self.backend.delete(*keys)
+
+    async def clear(self):
+        await self.backend.clear()
+
+    def stats(self):
+        entries = len(self.backend) if hasattr(self.backend, "__len__") else None
+        return {"backend": type(self.backend).__name__, "hits": self.hits, "misses": self.misses, "entries": entries}
+
+def cache_backend(settings):
+    if settings.cache_backend == "redis":
+        import redis.asyncio
+        return RedisCache(redis.asyncio.from_url(settings.cache_redis_url), settings.cache_ttl_seconds)
+    if settings.cache_backend == "memory":
+        return MemoryCache(settings.cache_max_entries, settings.cache_ttl_seconds)
+    return NoCache()
+
+read_cache = ReadCache(cache_backend(settings))
+
+def recipe_cache_keys(resep_master_ids, summary=False):
+    # resep_full embeds every child row; resep_master only embeds the rating
+    # summary, so it is dropped only when ratings change.
+    keys = []
+    for resep_master_id in set(resep_master_ids):
+        if resep_master_id is None:
+            continue
+        keys.append(f"resep_full:{resep_master_id}")
+        if summary:
+            keys.append(f"resep_master:{resep_master_id}")
+    return keys
+
+async def resep_master_id_map(db, parent_model, parent_ids):
+    # {parent id: recipe id}
+    parent_ids = {parent_id for parent_id in parent_ids if parent_id is not None}
+    if not parent_ids:
+        return {}
+    return dict((await db.execute(select(parent_model.id, parent_model.id_resep_master).where(parent_model.id.in_(parent_ids)))).all())
+
+async def resep_master_ids(db, parent_model, parent_ids):
+    return list((await resep_master_id_map(db, parent_model, parent_ids)).values())
 
 class ResepMasterSchema(BaseModel):
     id: int
     name: str
+    version: Optional[int] = None
 
     class Config:
         orm_mode = True
@@ -117,6 +1505,7 @@ class BahanMasterSchema(BaseModel):
     id: int
     id_resep_master: int
     porsi: int
+    version: Optional[int] = None
 
     class Config:
         orm_mode = True
@@ -125,6 +1514,7 @@ class BahanDetailSchema(BaseModel):
     id: int
     id_bahan_master: int
     name: str
+    version: Optional[int] = None
 
     class Config:
         orm_mode = True
@@ -134,6 +1524,7 @@ class CaraMembuatSchema(BaseModel):
     id_resep_master: int
     lama_waktu: int
     tips: str
+    version: Optional[int] = None
 
     class Config:
         orm_mode = True
@@ -142,6 +1533,7 @@ class CaraMembuatDetailSchema(BaseModel):
     id: int
     id_cara_membuat: int
     cara: str
+    version: Optional[int] = None
 
     class Config:
         orm_mode = True
@@ -152,6 +1544,7 @@ class TestiDiskusiSchema(BaseModel):
     user_id: int
     foto: str
     testimonial: str
+    version: Optional[int] = None
 
     class Config:
         orm_mode = True
@@ -161,18 +1554,149 @@ class ReplyDiskusiSchema(BaseModel):
     id_testi_diskusi: int
     user_id: int
     testimonial: str
+    version: Optional[int] = None
 
     class Config:
         orm_mode = True
 
+class UserRef(BaseModel):
+    id: int
+    name: Optional[str]
+    user_pict: Optional[str]
+
+class TestiDiskusiFeedItem(TestiDiskusiSchema):
+    reply_count: int = 0
+    user: Optional[UserRef]
+
+class ReplyDiskusiFeedItem(ReplyDiskusiSchema):
+    user: Optional[UserRef]
+
 class RatingSchema(BaseModel):
     id: int
     id_resep_master: int
     rating: float
+    version: Optional[int] = None
 
     class Config:
         orm_mode = True
 
+class RatingSummarySchema(BaseModel):
+    count: int = 0
+    average: Optional[float]
+    histogram: List[int] = [0, 0, 0, 0, 0]
+
+    class Config:
+        orm_mode = True
+
+class ResepMasterDisplay(ResepMasterSchema):
+    rating_summary: RatingSummarySchema = RatingSummarySchema()
+
+    @validator("rating_summary", pre=True, always=True)
+    def empty_rating_summary(cls, value):
+        return RatingSummarySchema() if value is None else value
+
+class ResepSearchResult(BaseModel):
+    id: int
+    name: Optional[str]
+    score: float
+
+class BahanMasterFullSchema(BahanMasterSchema):
+    bahan_detail: List[BahanDetailSchema] = []
+
+class CaraMembuatFullSchema(CaraMembuatSchema):
+    cara_membuat_detail: List[CaraMembuatDetailSchema] = []
+
+class TestiDiskusiFullSchema(TestiDiskusiSchema):
+    reply_diskusi: List[ReplyDiskusiSchema] = []
+
+class ResepFullSchema(ResepMasterDisplay):
+    bahan_master: List[BahanMasterFullSchema] = []
+    cara_membuat: List[CaraMembuatFullSchema] = []
+    testi_diskusi: List[TestiDiskusiFullSchema] = []
+
+class BahanDetailCreate(BaseModel):
+    id_bahan_master: int
+    name: str
+
+class CaraMembuatDetailCreate(BaseModel):
+    id_cara_membuat: int
+    cara: str
+
+class ReplyDiskusiCreate(BaseModel):
+    id_testi_diskusi: int
+    user_id: int
+    testimonial: str
+
+class RatingCreate(BaseModel):
+    id_resep_master: int
+    rating: float
+
+class BahanMasterCreate(BaseModel):
+    porsi: int
+    bahan_detail: List[str] = []
+
+class CaraMembuatCreate(BaseModel):
+    lama_waktu: int
+    tips: str
+    cara_membuat_detail: List[str] = []
+
+class ResepFullCreate(BaseModel):
+    name: str
+    bahan_master: List[BahanMasterCreate] = []
+    cara_membuat: List[CaraMembuatCreate] = []
+
+# PATCH bodies: only the fields sent are written; null counts as not sent
+# (patch_row drops it), since the read schemas have no null fields. version
+# (or an If-Match header) makes the update conditional on the version the
+# client read.
+class ResepMasterPatch(BaseModel):
+    name: Optional[str]
+    version: Optional[int]
+
+class BahanMasterPatch(BaseModel):
+    id_resep_master: Optional[int]
+    porsi: Optional[int]
+    version: Optional[int]
+
+class BahanDetailPatch(BaseModel):
+    id_bahan_master: Optional[int]
+    name: Optional[str]
+    version: Optional[int]
+
+class CaraMembuatPatch(BaseModel):
+    id_resep_master: Optional[int]
+    lama_waktu: Optional[int]
+    tips: Optional[str]
+    version: Optional[int]
+
+class CaraMembuatDetailPatch(BaseModel):
+    id_cara_membuat: Optional[int]
+    cara: Optional[str]
+    version: Optional[int]
+
+class TestiDiskusiPatch(BaseModel):
+    id_resep_master: Optional[int]
+    user_id: Optional[int]
+    foto: Optional[str]
+    testimonial: Optional[str]
+    version: Optional[int]
+
+class ReplyDiskusiPatch(BaseModel):
+    id_testi_diskusi: Optional[int]
+    user_id: Optional[int]
+    testimonial: Optional[str]
+    version: Optional[int]
+
+class RatingPatch(BaseModel):
+    id_resep_master: Optional[int]
+    rating: Optional[float]
+    version: Optional[int]
+
+class UserPatch(BaseModel):
+    name: Optional[str]
+    email: Optional[str]
+    version: Optional[int]
+
 class UserCreate(BaseModel):
     name: str
     email: str
@@ -188,6 +1712,7 @@ class UserDisplay(BaseModel):
     name: str
     email: str
     user_pict: Optional[str]
+    version: Optional[int] = None
 
     class Config:
         orm_mode = True
@@ -196,380 +1721,1034 @@ class UserDisplay(BaseModel):
 router = APIRouter(tags=["Resep Master"],prefix="/api")
 
 @app.post("/resep_master/", status_code=status.HTTP_201_CREATED)
-def create_resep_master(name: str, db: Session = Depends(get_db)):
+async def create_resep_master(name: str, db: AsyncSession = Depends(get_db)):
     new_resep_master = ResepMaster(name=name)
     db.add(new_resep_master)
-    db.commit()
-    db.refresh(new_resep_master)
+    await db.commit()
+    await db.refresh(new_resep_master)
     return new_resep_master
 
-@app.get("/resep_master/{resep_master_id}", response_model=ResepMasterSchema)
-def read_resep_master(resep_master_id: int, db: Session = Depends(get_db)):
-    resep_master = db.query(ResepMaster).filter(ResepMaster.id == resep_master_id).first()
+@app.post("/resep_master/full", response_model=ResepFullSchema, status_code=status.HTTP_201_CREATED)
+async def create_resep_full(resep: ResepFullCreate, db: AsyncSession = Depends(get_db)):
+    new_resep_master = ResepMaster(name=resep.name)
+    new_resep_master.bahan_master = [
+        BahanMaster(porsi=bahan.porsi, bahan_detail=[BahanDetail(name=name) for name in bahan.bahan_detail])
+        for bahan in resep.bahan_master
+    ]
+    new_resep_master.cara_membuat = [
+        CaraMembuat(lama_waktu=cara.lama_waktu, tips=cara.tips, cara_membuat_detail=[CaraMembuatDetail(cara=detail) for detail in cara.cara_membuat_detail])
+        for cara in resep.cara_membuat
+    ]
+    await assign_ids(db, [new_resep_master])
+    await assign_ids(db, new_resep_master.bahan_master)
+    await assign_ids(db, [detail for bahan in new_resep_master.bahan_master for detail in bahan.bahan_detail])
+    await assign_ids(db, new_resep_master.cara_membuat)
+    await assign_ids(db, [detail for cara in new_resep_master.cara_membuat for detail in cara.cara_membuat_detail])
+    db.add(new_resep_master)
+    await db.commit()
+    similar_index.invalidate([new_resep_master.id])
+    return ResepFullSchema(
+        id=new_resep_master.id,
+        name=new_resep_master.name,
+        version=new_resep_master.version,
+        bahan_master=new_resep_master.bahan_master,
+        cara_membuat=new_resep_master.cara_membuat,
+    )
+
+@app.get("/resep_master/top_rated", response_model=List[ResepMasterDisplay])
+async def read_top_rated_resep_master(limit: int = Query(10, ge=1, le=MAX_PAGE_SIZE), min_count: int = Query(1, ge=1), db: AsyncSession = Depends(get_read_db)):
+    return (await db.execute(select(ResepMaster).join(ResepMaster.rating_summary).options(contains_eager(ResepMaster.rating_summary)).where(
+        RatingSummary.count >= min_count
+    ).order_by(RatingSummary.average.desc(), RatingSummary.count.desc()).limit(limit))).scalars().all()
+
+@app.get("/resep_master/search", response_model=List[ResepSearchResult])
+async def search_resep_master(response: Response, q: Optional[str] = None, include: List[str] = Query([]), exclude: List[str] = Query([]),
+                              limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE), offset: int = Query(0, ge=0), db: AsyncSession = Depends(get_read_db)):
+    # Ranked, so pages are by offset; X-Next-Offset is set when there are more.
+    if not q and not include:
+        raise HTTPException(status_code=400, detail="Give q or at least one include")
+    stmt = search_statement(db.bind.dialect.name, q, include, exclude)
+    rows = (await db.execute(stmt.offset(offset).limit(limit + 1))).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Offset"] = str(offset + limit)
+    return [row_dict(row) for row in rows]
+
+@app.get("/resep_master/{resep_master_id}/similar", response_model=List[ResepSearchResult])
+async def read_similar_resep_master(resep_master_id: int, limit: int = Query(10, ge=1, le=100), metric: SimilarMetric = SimilarMetric.jaccard,
+                                    db: AsyncSession = Depends(get_read_db)):
+    if await db.get(ResepMaster, resep_master_id) is None:
+        raise HTTPException(status_code=404, detail="ResepMaster not found")
+    await similar_index.refresh()
+    scores = similar_index.similar(resep_master_id, limit, metric)
+    names = dict((await db.execute(select(ResepMaster.id, ResepMaster.name).where(ResepMaster.id.in_([i for i, _ in scores])))).all()) if scores else {}
+    return [{"id": i, "name": names.get(i), "score": score} for i, score in scores if i in names]
+
+@app.get("/resep_master/{resep_master_id}", response_model=ResepMasterDisplay)
+async def read_resep_master(resep_master_id: int, request: Request, db: AsyncSession = Depends(get_read_db)):
+    key = f"resep_master:{resep_master_id}"
+    cached = await read_cache.get(key)
+    if cached is not None:
+        return cached_response(request, cached)
+    resep_master = await db.get(ResepMaster, resep_master_id)
     if resep_master is None:
         raise HTTPException(status_code=404, detail="ResepMaster not found")
-    return resep_master
+    return cached_response(request, await read_cache.set(key, ResepMasterDisplay.from_orm(resep_master).dict()))
+
+@app.get("/resep_master/{resep_master_id}/full", response_model=ResepFullSchema)
+async def read_resep_full(resep_master_id: int, request: Request, db: AsyncSession = Depends(get_read_db)):
+    key = f"resep_full:{resep_master_id}"
+    cached = await read_cache.get(key)
+    if cached is not None:
+        return cached_response(request, cached)
+    # One query per relationship level (selectinload) instead of one per row,
+    # so the number of round trips does not depend on the size of the recipe.
+    resep_master = (await db.execute(select(ResepMaster).options(
+        selectinload(ResepMaster.bahan_master).selectinload(BahanMaster.bahan_detail),
+        selectinload(ResepMaster.cara_membuat).selectinload(CaraMembuat.cara_membuat_detail),
+        selectinload(ResepMaster.testi_diskusi).selectinload(TestiDiskusi.reply_diskusi),
+    ).where(ResepMaster.id == resep_master_id))).scalars().first()
+    if resep_master is None:
+        raise HTTPException(status_code=404, detail="ResepMaster not found")
+    return cached_response(request, await read_cache.set(key, ResepFullSchema(
+        id=resep_master.id,
+        name=resep_master.name,
+        version=resep_master.version,
+        bahan_master=resep_master.bahan_master,
+        cara_membuat=resep_master.cara_membuat,
+        testi_diskusi=resep_master.testi_diskusi,
+        rating_summary=resep_master.rating_summary,
+    ).dict()))
+
+@app.patch("/resep_master/{resep_master_id}", response_model=ResepMasterSchema)
+async def patch_resep_master(resep_master_id: int, resep_master: ResepMasterPatch, response: Response, if_match: Optional[str] = Header(None), db: AsyncSession = Depends(get_db)):
+    new, _ = await patch_row(db, ResepMaster, resep_master_id, resep_master, if_match)
+    await db.commit()
+    await read_cache.delete(*recipe_cache_keys([resep_master_id], summary=True))
+    response.headers["ETag"] = version_etag(new["version"])
+    return new
 
 @app.put("/resep_master/{resep_master_id}", response_model=ResepMasterSchema)
-def update_resep_master(resep_master_id: int, resep_master: ResepMasterSchema, db: Session = Depends(get_db)):
-    db_item = db.query(ResepMaster).filter(ResepMaster.id == resep_master_id).first()
-    if not db_item:
-        raise HTTPException(status_code=404, detail="ResepMaster not found")
-    for var, value in vars(resep_master).items():
-        setattr(db_item, var, value) if value else None
-    db.commit()
-    db.refresh(db_item)
-    return db_item
+async def update_resep_master(resep_master_id: int, resep_master: ResepMasterSchema, response: Response, if_match: Optional[str] = Header(None), db: AsyncSession = Depends(get_db)):
+    return await patch_resep_master(resep_master_id, ResepMasterPatch(**resep_master.dict()), response, if_match, db)
 
 @app.delete("/resep_master/{resep_master_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_resep_master(resep_master_id: int, db: Session = Depends(get_db)):
-    db_item = db.query(ResepMaster).filter(ResepMaster.id == resep_master_id).first()
+async def delete_resep_master(resep_master_id: int, db: AsyncSession = Depends(get_db)):
+    db_item = await db.get(ResepMaster, resep_master_id)
     if not db_item:
         raise HTTPException(status_code=404, detail="ResepMaster not found")
-    db.delete(db_item)
-    db.commit()
+    await db.delete(db_item)
+    await db.commit()
+    similar_index.invalidate([resep_master_id])
+    await read_cache.delete(*recipe_cache_keys([resep_master_id], summary=True))
     return {"ok": True}
 
 @app.get("/resep_master/", response_model=List[ResepMasterSchema])
-def read_all_resep_master(db: Session = Depends(get_db)):
-    return db.query(ResepMaster).all()
+async def read_all_resep_master(response: Response, page: PageParams = Depends(), db: AsyncSession = Depends(get_read_db)):
+    return await paginate(db, project(ResepMaster, ResepMasterSchema), ResepMaster, response, page, serialize=row_serializer(ResepMasterSchema))
 
 router = APIRouter(tags=["Bahan"],prefix="/api")
 
 @app.post("/bahan_master/", status_code=status.HTTP_201_CREATED)
-def create_bahan_master(resep_master_id: int, porsi: int, db: Session = Depends(get_db)):
+async def create_bahan_master(resep_master_id: int, porsi: int, db: AsyncSession = Depends(get_db)):
     new_bahan_master = BahanMaster(id_resep_master=resep_master_id, porsi=porsi)
     db.add(new_bahan_master)
-    db.commit()
-    db.refresh(new_bahan_master)
+    cache_keys = recipe_cache_keys([new_bahan_master.id_resep_master])
+    await db.commit()
+    await read_cache.delete(*cache_keys)
+    await db.refresh(new_bahan_master)
     return new_bahan_master
 
 @app.post("/bahan_detail/", status_code=status.HTTP_201_CREATED)
-def create_bahan_detail(bahan_master_id: int, name: str, db: Session = Depends(get_db)):
+async def create_bahan_detail(bahan_master_id: int, name: str, db: AsyncSession = Depends(get_db)):
     new_bahan_detail = BahanDetail(id_bahan_master=bahan_master_id, name=name)
     db.add(new_bahan_detail)
-    db.commit()
-    db.refresh(new_bahan_detail)
+    recipe_ids = await resep_master_ids(db, BahanMaster, [new_bahan_detail.id_bahan_master])
+    cache_keys = recipe_cache_keys(recipe_ids)
+    await db.commit()
+    similar_index.invalidate(recipe_ids)
+    await read_cache.delete(*cache_keys)
+    await db.refresh(new_bahan_detail)
+    return new_bahan_detail
+
+@app.post("/bahan_detail/bulk", response_model=List[BahanDetailSchema], status_code=status.HTTP_201_CREATED)
+async def create_bahan_detail_bulk(bahan_detail: conlist(BahanDetailCreate, min_items=1, max_items=MAX_BULK_SIZE), db: AsyncSession = Depends(get_db)):
+    new_bahan_detail = await bulk_insert(db, BahanDetail, bahan_detail)
+    recipe_ids = await resep_master_ids(db, BahanMaster, [item.id_bahan_master for item in bahan_detail])
+    cache_keys = recipe_cache_keys(recipe_ids)
+    await db.commit()
+    similar_index.invalidate(recipe_ids)
+    await read_cache.delete(*cache_keys)
     return new_bahan_detail
 
 @app.get("/bahan_master/{bahan_master_id}", response_model=BahanMasterSchema)
-def read_bahan_master(bahan_master_id: int, db: Session = Depends(get_db)):
-    bahan_master = db.query(BahanMaster).filter(BahanMaster.id == bahan_master_id).first()
+async def read_bahan_master(bahan_master_id: int, request: Request, db: AsyncSession = Depends(get_read_db)):
+    key = f"bahan_master:{bahan_master_id}"
+    cached = await read_cache.get(key)
+    if cached is not None:
+        return cached_response(request, cached)
+    bahan_master = await db.get(BahanMaster, bahan_master_id)
     if bahan_master is None:
         raise HTTPException(status_code=404, detail="BahanMaster not found")
-    return bahan_master
+    return cached_response(request, await read_cache.set(key, BahanMasterSchema.from_orm(bahan_master).dict()))
 
 @app.get("/bahan_detail/{bahan_detail_id}", response_model=BahanDetailSchema)
-def read_bahan_detail(bahan_detail_id: int, db: Session = Depends(get_db)):
-    bahan_detail = db.query(BahanDetail).filter(BahanDetail.id == bahan_detail_id).first()
+async def read_bahan_detail(bahan_detail_id: int, request: Request, db: AsyncSession = Depends(get_read_db)):
+    key = f"bahan_detail:{bahan_detail_id}"
+    cached = await read_cache.get(key)
+    if cached is not None:
+        return cached_response(request, cached)
+    bahan_detail = await db.get(BahanDetail, bahan_detail_id)
     if bahan_detail is None:
         raise HTTPException(status_code=404, detail="BahanDetail not found")
-    return bahan_detail
+    return cached_response(request, await read_cache.set(key, BahanDetailSchema.from_orm(bahan_detail).dict()))
+
+@app.patch("/bahan_master/{bahan_master_id}", response_model=BahanMasterSchema)
+async def patch_bahan_master(bahan_master_id: int, bahan_master: BahanMasterPatch, response: Response, if_match: Optional[str] = Header(None), db: AsyncSession = Depends(get_db)):
+    new, old = await patch_row(db, BahanMaster, bahan_master_id, bahan_master, if_match)
+    recipe_ids = [old["id_resep_master"], new["id_resep_master"]]
+    await db.commit()
+    similar_index.invalidate(recipe_ids)
+    await read_cache.delete(f"bahan_master:{bahan_master_id}", *recipe_cache_keys(recipe_ids))
+    response.headers["ETag"] = version_etag(new["version"])
+    return new
 
 @app.put("/bahan_master/{bahan_master_id}", response_model=BahanMasterSchema)
-def update_bahan_master(bahan_master_id: int, bahan_master: BahanMasterSchema, db: Session = Depends(get_db)):
-    db_item = db.query(BahanMaster).filter(BahanMaster.id == bahan_master_id).first()
-    if not db_item:
-        raise HTTPException(status_code=404, detail="BahanMaster not found")
-    for var, value in vars(bahan_master).items():
-        setattr(db_item, var, value) if value else None
-    db.commit()
-    db.refresh(db_item)
-    return db_item
+async def update_bahan_master(bahan_master_id: int, bahan_master: BahanMasterSchema, response: Response, if_match: Optional[str] = Header(None), db: AsyncSession = Depends(get_db)):
+    return await patch_bahan_master(bahan_master_id, BahanMasterPatch(**bahan_master.dict()), response, if_match, db)
+
+@app.patch("/bahan_detail/{bahan_detail_id}", response_model=BahanDetailSchema)
+async def patch_bahan_detail(bahan_detail_id: int, bahan_detail: BahanDetailPatch, response: Response, if_match: Optional[str] = Header(None), db: AsyncSession = Depends(get_db)):
+    new, old = await patch_row(db, BahanDetail, bahan_detail_id, bahan_detail, if_match)
+    recipe_ids = await resep_master_ids(db, BahanMaster, [old["id_bahan_master"], new["id_bahan_master"]])
+    await db.commit()
+    similar_index.invalidate(recipe_ids)
+    await read_cache.delete(f"bahan_detail:{bahan_detail_id}", *recipe_cache_keys(recipe_ids))
+    response.headers["ETag"] = version_etag(new["version"])
+    return new
 
 @app.put("/bahan_detail/{bahan_detail_id}", response_model=BahanDetailSchema)
-def update_bahan_detail(bahan_detail_id: int, bahan_detail: BahanDetailSchema, db: Session = Depends(get_db)):
-    db_item = db.query(BahanDetail).filter(BahanDetail.id == bahan_detail_id).first()
-    if not db_item:
-        raise HTTPException(status_code=404, detail="BahanDetail not found")
-    for var, value in vars(bahan_detail).items():
-        setattr(db_item, var, value) if value else None
-    db.commit()
-    db.refresh(db_item)
-    return db_item
+async def update_bahan_detail(bahan_detail_id: int, bahan_detail: BahanDetailSchema, response: Response, if_match: Optional[str] = Header(None), db: AsyncSession = Depends(get_db)):
+    return await patch_bahan_detail(bahan_detail_id, BahanDetailPatch(**bahan_detail.dict()), response, if_match, db)
 
 @app.delete("/bahan_master/{bahan_master_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_bahan_master(bahan_master_id: int, db: Session = Depends(get_db)):
-    db_item = db.query(BahanMaster).filter(BahanMaster.id == bahan_master_id).first()
+async def delete_bahan_master(bahan_master_id: int, db: AsyncSession = Depends(get_db)):
+    db_item = await db.get(BahanMaster, bahan_master_id)
     if not db_item:
         raise HTTPException(status_code=404, detail="BahanMaster not found")
-    db.delete(db_item)
-    db.commit()
+    recipe_ids = [db_item.id_resep_master]
+    cache_keys = [f"bahan_master:{bahan_master_id}", *recipe_cache_keys(recipe_ids)]
+    await db.delete(db_item)
+    await db.commit()
+    similar_index.invalidate(recipe_ids)
+    await read_cache.delete(*cache_keys)
     return {"ok": True}
 
 @app.delete("/bahan_detail/{bahan_detail_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_bahan_detail(bahan_detail_id: int, db: Session = Depends(get_db)):
-    db_item = db.query(BahanDetail).filter(BahanDetail.id == bahan_detail_id).first()
+async def delete_bahan_detail(bahan_detail_id: int, db: AsyncSession = Depends(get_db)):
+    db_item = await db.get(BahanDetail, bahan_detail_id)
     if not db_item:
         raise HTTPException(status_code=404, detail="BahanDetail not found")
-    db.delete(db_item)
-    db.commit()
+    recipe_ids = await resep_master_ids(db, BahanMaster, [db_item.id_bahan_master])
+    cache_keys = [f"bahan_detail:{bahan_detail_id}", *recipe_cache_keys(recipe_ids)]
+    await db.delete(db_item)
+    await db.commit()
+    similar_index.invalidate(recipe_ids)
+    await read_cache.delete(*cache_keys)
     return {"ok": True}
 
 @app.get("/bahan_master/", response_model=List[BahanMasterSchema])
-def read_all_bahan_master(db: Session = Depends(get_db)):
-    return db.query(BahanMaster).all()
+async def read_all_bahan_master(response: Response, page: PageParams = Depends(), db: AsyncSession = Depends(get_read_db)):
+    return await paginate(db, project(BahanMaster, BahanMasterSchema), BahanMaster, response, page, serialize=row_serializer(BahanMasterSchema))
 
 @app.get("/bahan_detail/", response_model=List[BahanDetailSchema])
-def read_all_bahan_detail(db: Session = Depends(get_db)):
-    return db.query(BahanDetail).all()
+async def read_all_bahan_detail(response: Response, page: PageParams = Depends(), db: AsyncSession = Depends(get_read_db)):
+    return await paginate(db, project(BahanDetail, BahanDetailSchema), BahanDetail, response, page, serialize=row_serializer(BahanDetailSchema))
 
 router = APIRouter(tags=["Cara Membuat"],prefix="/api")
 
 @app.post("/cara_membuat/", status_code=status.HTTP_201_CREATED)
-def create_cara_membuat(resep_master_id: int, lama_waktu: int, tips: str, db: Session = Depends(get_db)):
+async def create_cara_membuat(resep_master_id: int, lama_waktu: int, tips: str, db: AsyncSession = Depends(get_db)):
     new_cara_membuat = CaraMembuat(id_resep_master=resep_master_id, lama_waktu=lama_waktu, tips=tips)
     db.add(new_cara_membuat)
-    db.commit()
-    db.refresh(new_cara_membuat)
+    cache_keys = recipe_cache_keys([new_cara_membuat.id_resep_master])
+    await db.commit()
+    await read_cache.delete(*cache_keys)
+    await db.refresh(new_cara_membuat)
     return new_cara_membuat
 
 @app.post("/cara_membuat_detail/", status_code=status.HTTP_201_CREATED)
-def create_cara_membuat_detail(cara_membuat_id: int, cara: str, db: Session = Depends(get_db)):
+async def create_cara_membuat_detail(cara_membuat_id: int, cara: str, db: AsyncSession = Depends(get_db)):
     new_cara_membuat_detail = CaraMembuatDetail(id_cara_membuat=cara_membuat_id, cara=cara)
     db.add(new_cara_membuat_detail)
-    db.commit()
-    db.refresh(new_cara_membuat_detail)
+    cache_keys = recipe_cache_keys(await resep_master_ids(db, CaraMembuat, [new_cara_membuat_detail.id_cara_membuat]))
+    await db.commit()
+    await read_cache.delete(*cache_keys)
+    await db.refresh(new_cara_membuat_detail)
+    return new_cara_membuat_detail
+
+@app.post("/cara_membuat_detail/bulk", response_model=List[CaraMembuatDetailSchema], status_code=status.HTTP_201_CREATED)
+async def create_cara_membuat_detail_bulk(cara_membuat_detail: conlist(CaraMembuatDetailCreate, min_items=1, max_items=MAX_BULK_SIZE), db: AsyncSession = Depends(get_db)):
+    new_cara_membuat_detail = await bulk_insert(db, CaraMembuatDetail, cara_membuat_detail)
+    cache_keys = recipe_cache_keys(await resep_master_ids(db, CaraMembuat, [item.id_cara_membuat for item in cara_membuat_detail]))
+    await db.commit()
+    await read_cache.delete(*cache_keys)
     return new_cara_membuat_detail
 
 @app.get("/cara_membuat/{cara_membuat_id}", response_model=CaraMembuatSchema)
-def read_cara_membuat(cara_membuat_id: int, db: Session = Depends(get_db)):
-    cara_membuat = db.query(CaraMembuat).filter(CaraMembuat.id == cara_membuat_id).first()
+async def read_cara_membuat(cara_membuat_id: int, request: Request, db: AsyncSession = Depends(get_read_db)):
+    key = f"cara_membuat:{cara_membuat_id}"
+    cached = await read_cache.get(key)
+    if cached is not None:
+        return cached_response(request, cached)
+    cara_membuat = await db.get(CaraMembuat, cara_membuat_id)
     if cara_membuat is None:
         raise HTTPException(status_code=404, detail="CaraMembuat not found")
-    return cara_membuat
+    return cached_response(request, await read_cache.set(key, CaraMembuatSchema.from_orm(cara_membuat).dict()))
 
 @app.get("/cara_membuat_detail/{cara_membuat_detail_id}", response_model=CaraMembuatDetailSchema)
-def read_cara_membuat_detail(cara_membuat_detail_id: int, db: Session = Depends(get_db)):
-    cara_membuat_detail = db.query(CaraMembuatDetail).filter(CaraMembuatDetail.id == cara_membuat_detail_id).first()
+async def read_cara_membuat_detail(cara_membuat_detail_id: int, request: Request, db: AsyncSession = Depends(get_read_db)):
+    key = f"cara_membuat_detail:{cara_membuat_detail_id}"
+    cached = await read_cache.get(key)
+    if cached is not None:
+        return cached_response(request, cached)
+    cara_membuat_detail = await db.get(CaraMembuatDetail, cara_membuat_detail_id)
     if cara_membuat_detail is None:
         raise HTTPException(status_code=404, detail="CaraMembuatDetail not found")
-    return cara_membuat_detail
+    return cached_response(request, await read_cache.set(key, CaraMembuatDetailSchema.from_orm(cara_membuat_detail).dict()))
 
 @app.get("/cara_membuat/", response_model=List[CaraMembuatSchema])
-def read_all_cara_membuat(db: Session = Depends(get_db)):
-    return db.query(CaraMembuat).all()
+async def read_all_cara_membuat(response: Response, page: PageParams = Depends(), db: AsyncSession = Depends(get_read_db)):
+    return await paginate(db, project(CaraMembuat, CaraMembuatSchema), CaraMembuat, response, page, serialize=row_serializer(CaraMembuatSchema))
 
 @app.get("/cara_membuat_detail/", response_model=List[CaraMembuatDetailSchema])
-def read_all_cara_membuat_detail(db: Session = Depends(get_db)):
-    return db.query(CaraMembuatDetail).all()
+async def read_all_cara_membuat_detail(response: Response, page: PageParams = Depends(), db: AsyncSession = Depends(get_read_db)):
+    return await paginate(db, project(CaraMembuatDetail, CaraMembuatDetailSchema), CaraMembuatDetail, response, page, serialize=row_serializer(CaraMembuatDetailSchema))
+
+@app.patch("/cara_membuat/{cara_membuat_id}", response_model=CaraMembuatSchema)
+async def patch_cara_membuat(cara_membuat_id: int, cara_membuat: CaraMembuatPatch, response: Response, if_match: Optional[str] = Header(None), db: AsyncSession = Depends(get_db)):
+    new, old = await patch_row(db, CaraMembuat, cara_membuat_id, cara_membuat, if_match)
+    await db.commit()
+    await read_cache.delete(f"cara_membuat:{cara_membuat_id}", *recipe_cache_keys([old["id_resep_master"], new["id_resep_master"]]))
+    response.headers["ETag"] = version_etag(new["version"])
+    return new
 
 @app.put("/cara_membuat/{cara_membuat_id}", response_model=CaraMembuatSchema)
-def update_cara_membuat(cara_membuat_id: int, cara_membuat: CaraMembuatSchema, db: Session = Depends(get_db)):
-    db_item = db.query(CaraMembuat).filter(CaraMembuat.id == cara_membuat_id).first()
-    if not db_item:
-        raise HTTPException(status_code=404, detail="CaraMembuat not found")
-    for var, value in vars(cara_membuat).items():
-        setattr(db_item, var, value) if value else None
-    db.commit()
-    db.refresh(db_item)
-    return db_item
+async def update_cara_membuat(cara_membuat_id: int, cara_membuat: CaraMembuatSchema, response: Response, if_match: Optional[str] = Header(None), db: AsyncSession = Depends(get_db)):
+    return await patch_cara_membuat(cara_membuat_id, CaraMembuatPatch(**cara_membuat.dict()), response, if_match, db)
+
+@app.patch("/cara_membuat_detail/{cara_membuat_detail_id}", response_model=CaraMembuatDetailSchema)
+async def patch_cara_membuat_detail(cara_membuat_detail_id: int, cara_membuat_detail: CaraMembuatDetailPatch, response: Response, if_match: Optional[str] = Header(None), db: AsyncSession = Depends(get_db)):
+    new, old = await patch_row(db, CaraMembuatDetail, cara_membuat_detail_id, cara_membuat_detail, if_match)
+    cache_keys = [f"cara_membuat_detail:{cara_membuat_detail_id}", *recipe_cache_keys(await resep_master_ids(db, CaraMembuat, [old["id_cara_membuat"], new["id_cara_membuat"]]))]
+    await db.commit()
+    await read_cache.delete(*cache_keys)
+    response.headers["ETag"] = version_etag(new["version"])
+    return new
 
 @app.put("/cara_membuat_detail/{cara_membuat_detail_id}", response_model=CaraMembuatDetailSchema)
-def update_cara_membuat_detail(cara_membuat_detail_id: int, cara_membuat_detail: CaraMembuatDetailSchema, db: Session = Depends(get_db)):
-    db_item = db.query(CaraMembuatDetail).filter(CaraMembuatDetail.id == cara_membuat_detail_id).first()
-    if not db_item:
-        raise HTTPException(status_code=404, detail="CaraMembuatDetail not found")
-    for var, value in vars(cara_membuat_detail).items():
-        setattr(db_item, var, value) if value else None
-    db.commit()
-    db.refresh(db_item)
-    return db_item
+async def update_cara_membuat_detail(cara_membuat_detail_id: int, cara_membuat_detail: CaraMembuatDetailSchema, response: Response, if_match: Optional[str] = Header(None), db: AsyncSession = Depends(get_db)):
+    return await patch_cara_membuat_detail(cara_membuat_detail_id, CaraMembuatDetailPatch(**cara_membuat_detail.dict()), response, if_match, db)
 
 @app.delete("/cara_membuat/{cara_membuat_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_cara_membuat(cara_membuat_id: int, db: Session = Depends(get_db)):
-    db_item = db.query(CaraMembuat).filter(CaraMembuat.id == cara_membuat_id).first()
+async def delete_cara_membuat(cara_membuat_id: int, db: AsyncSession = Depends(get_db)):
+    db_item = await db.get(CaraMembuat, cara_membuat_id)
     if not db_item:
         raise HTTPException(status_code=404, detail="CaraMembuat not found")
-    db.delete(db_item)
-    db.commit()
+    cache_keys = [f"cara_membuat:{cara_membuat_id}", *recipe_cache_keys([db_item.id_resep_master])]
+    await db.delete(db_item)
+    await db.commit()
+    await read_cache.delete(*cache_keys)
     return {"ok": True}
 
 @app.delete("/cara_membuat_detail/{cara_membuat_detail_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_cara_membuat_detail(cara_membuat_detail_id: int, db: Session = Depends(get_db)):
-    db_item = db.query(CaraMembuatDetail).filter(CaraMembuatDetail.id == cara_membuat_detail_id).first()
+async def delete_cara_membuat_detail(cara_membuat_detail_id: int, db: AsyncSession = Depends(get_db)):
+    db_item = await db.get(CaraMembuatDetail, cara_membuat_detail_id)
     if not db_item:
         raise HTTPException(status_code=404, detail="CaraMembuatDetail not found")
-    db.delete(db_item)
-    db.commit()
+    cache_keys = [f"cara_membuat_detail:{cara_membuat_detail_id}", *recipe_cache_keys(await resep_master_ids(db, CaraMembuat, [db_item.id_cara_membuat]))]
+    await db.delete(db_item)
+    await db.commit()
+    await read_cache.delete(*cache_keys)
     return {"ok": True}
 
+EVENTS_CHANNEL = "resep_events"
+EVENT_BRIDGE_RETRY_SECONDS = 5
+# PostgreSQL refuses NOTIFY payloads of 8000 bytes or more.
+NOTIFY_MAX_BYTES = 7999
+
+def event_data(schema, row):
+    # bulk_insert returns dicts on PostgreSQL and ORM objects on SQLite.
+    return (schema.parse_obj(row) if isinstance(row, dict) else schema.from_orm(row)).dict()
+
+def change_event(resep_master_id, event_type, action, data):
+    return {"type": event_type, "action": action, "id_resep_master": resep_master_id, "data": data}
+
+def notify_payloads(events):
+    # Packs events into JSON arrays that each fit in one NOTIFY. Returns the
+    # payloads and the events too large to go out on their own.
+    payloads, too_large, chunk, size = [], [], [], 2
+    for change in events:
+        encoded = json.dumps(change, default=str)
+        length = len(encoded.encode()) + 1
+        if length + 1 > NOTIFY_MAX_BYTES:
+            too_large.append(change)
+            continue
+        if size + length > NOTIFY_MAX_BYTES:
+            payloads.append(f"[{','.join(chunk)}]")
+            chunk, size = [], 2
+        chunk.append(encoded)
+        size += length
+    if chunk:
+        payloads.append(f"[{','.join(chunk)}]")
+    return payloads, too_large
+
+class Subscription:
+    def __init__(self, resep_master_id, queue_size):
+        self.resep_master_id = resep_master_id
+        self.queue = asyncio.Queue(queue_size)
+        self.overflowed = False
+
+    async def events(self, keepalive=None):
+        # Yields events, None after keepalive seconds without one, and ends
+        # with an "overflow" event once the subscriber has been dropped.
+        while not (self.overflowed and self.queue.empty()):
+            try:
+                yield await asyncio.wait_for(self.queue.get(), keepalive)
+            except asyncio.TimeoutError:
+                yield None
+        yield {"type": "overflow", "id_resep_master": self.resep_master_id}
+
+class EventHub:
+    # Fans out testimonial, reply and rating changes to the subscribers of
+    # their recipe (GET /resep_master/{id}/events and /resep_master/{id}/ws).
+    # Every subscriber has its own bounded queue: one that falls queue_size
+    # events behind is dropped (it gets an "overflow" event and should
+    # re-read the feeds) instead of buffering without limit or holding up
+    # the others. On PostgreSQL events go out as NOTIFY on one channel that
+    # every worker LISTENs on, so subscribers see writes made by any worker;
+    # while that connection is down events only reach this worker. All the
+    # events of one request or write batch share one round trip, packed into
+    # as few payloads as the NOTIFY size limit allows.
+    def __init__(self, queue_size):
+        self.queue_size = queue_size
+        self.subscribers = collections.defaultdict(set)
+        self.connection = None
+        self.task = None
+        self.lock = asyncio.Lock()
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def start(self, url):
+        if url.get_backend_name() == "postgresql":
+            self.task = asyncio.create_task(self.listen(url.set(drivername="postgresql").render_as_string(hide_password=False)))
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self.task
+            self.task = None
+
+    async def listen(self, dsn):
+        import asyncpg
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(dsn)
+                closed = asyncio.get_running_loop().create_future()
+                connection.add_termination_listener(lambda _: closed.done() or closed.set_result(None))
+                await connection.add_listener(EVENTS_CHANNEL, self.notified)
+                self.connection = connection
+                await closed
+            except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError) as error:
+                logger.error("event bridge: %s", error)
+            finally:
+                self.connection = None
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+            await asyncio.sleep(EVENT_BRIDGE_RETRY_SECONDS)
+
+    def notified(self, connection, pid, channel, payload):
+        for change in json.loads(payload):
+            self.deliver(change)
+
+    def subscribe(self, resep_master_id):
+        subscription = Subscription(resep_master_id, self.queue_size)
+        self.subscribers[resep_master_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscribers = self.subscribers.get(subscription.resep_master_id)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self.subscribers[subscription.resep_master_id]
+
+    def deliver(self, change):
+        for subscription in list(self.subscribers.get(change["id_resep_master"], ())):
+            try:
+                subscription.queue.put_nowait(change)
+                self.delivered += 1
+            except asyncio.QueueFull:
+                subscription.overflowed = True
+                self.dropped += 1
+                self.unsubscribe(subscription)
+
+    async def publish(self, resep_master_ids, event_type, action, data):
+        # One change, sent to every recipe it belongs to.
+        await self.publish_events([
+            change_event(resep_master_id, event_type, action, data)
+            for resep_master_id in dict.fromkeys(resep_master_ids)
+        ])
+
+    async def publish_events(self, events):
+        # Called after the commit. Never fails the write that caused it.
+        events = [change for change in events if change["id_resep_master"] is not None]
+        self.published += len(events)
+        if events and self.connection is not None:
+            payloads, too_large = notify_payloads(events)
+            try:
+                async with self.lock:
+                    await self.connection.execute("SELECT pg_notify($1, payload) FROM unnest($2::text[]) AS payload", EVENTS_CHANNEL, payloads)
+                if too_large:
+                    logger.error("event bridge: %d events over the NOTIFY size limit, delivering locally", len(too_large))
+                events = too_large
+            except Exception as error:
+                logger.error("event bridge NOTIFY failed, delivering locally: %s", error)
+        for change in events:
+            self.deliver(change)
+
+    def stats(self):
+        return {
+            "subscribers": sum(len(subscribers) for subscribers in self.subscribers.values()),
+            "recipes": len(self.subscribers),
+            "queue_size": self.queue_size,
+            "bridge": "connected" if self.connection is not None else ("disconnected" if self.task is not None else "off"),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+        }
+
+events = EventHub(settings.events_queue_size)
+
+WRITE_FLUSH_BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5]
+WRITE_BATCH_BUCKETS = [1, 5, 10, 50, 100, 500, 1000]
+
+def column_dict(obj):
+    # What the unbuffered handlers return after refresh, read from the object
+    # without loading anything: columns never set are NULL.
+    return {column.key: obj.__dict__.get(column.key) for column in obj.__table__.columns}
+
+class WriteBuffer:
+    # WRITE_BUFFER=true: single-row rating and testimonial creates are queued
+    # and a background task writes them in batches, one transaction per
+    # batch, every max_rows rows or max_delay seconds, whichever comes first.
+    # Ratings in a batch become one rating_summary upsert per recipe. A full
+    # queue answers 503 instead of piling up requests. ack decides what the
+    # client waits for: "flush" returns the created row once its batch is
+    # committed, "enqueue" returns 202 as soon as the write is queued (and it
+    # is lost if the process dies before the flush).
+    def __init__(self, max_rows, max_delay, queue_size, ack):
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.queue_size = queue_size
+        self.ack = ack
+        self.queue = None
+        self.task = None
+        self.flush_seconds = Histogram(WRITE_FLUSH_BUCKETS)
+        self.batch_rows = Histogram(WRITE_BATCH_BUCKETS)
+        self.rejected = 0
+        self.failed = 0
+
+    def start(self):
+        self.queue = asyncio.Queue(self.queue_size)
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        # Writes already accepted are flushed before shutdown.
+        if self.task is not None:
+            await self.queue.put(None)
+            await self.task
+            self.task = None
+
+    async def submit(self, model, values):
+        future = asyncio.get_running_loop().create_future() if self.ack == "flush" else None
+        try:
+            self.queue.put_nowait((model, values, future))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Write queue is full", headers={"Retry-After": "1"})
+        if future is None:
+            return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content={"queued": True})
+        return await future
+
+    async def run(self):
+        stopping = False
+        while not stopping:
+            item = await self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_rows:
+                try:
+                    item = self.queue.get_nowait() if self.queue.qsize() else await asyncio.wait_for(self.queue.get(), deadline - time.monotonic())
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            try:
+                await self.flush(batch)
+            except Exception as error:
+                # A bug outside write() must not end the task: the waiting
+                # requests would hang and the queue fill up for good.
+                self.failed += len(batch)
+                logger.exception("write buffer flush failed")
+                for model, values, future in batch:
+                    if future is not None and not future.done():
+                        future.set_exception(error)
+
+    async def flush(self, batch):
+        started = time.perf_counter()
+        try:
+            results, cache_keys = await self.write(batch)
+        except Exception as error:
+            if len(batch) > 1:
+                # One bad row (e.g. an unknown recipe) must not fail the
+                # writes queued with it: retry them one at a time.
+                for item in batch:
+                    await self.flush([item])
+                return
+            self.failed += 1
+            logger.error("buffered %s write failed: %s", batch[0][0].__tablename__, error)
+            results, cache_keys = [error], []
+        try:
+            await read_cache.delete(*cache_keys)
+        except Exception as error:
+            logger.error("buffered write cache invalidation failed: %s", error)
+        self.flush_seconds.observe(time.perf_counter() - started)
+        self.batch_rows.observe(len(batch))
+        # The rows are committed: answer the waiting requests before the
+        # events go out.
+        for (model, values, future), result in zip(batch, results):
+            if future is not None and not future.done():
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+        await events.publish_events([
+            change_event(result["id_resep_master"], model.__tablename__, "created", event_data(RatingSchema if model is Rating else TestiDiskusiSchema, result))
+            for (model, values, future), result in zip(batch, results)
+            if not isinstance(result, Exception)
+        ])
+
+    async def write(self, batch):
+        objects = [model(**values) for model, values, future in batch]
+        async with AsyncSessionLocal() as db:
+            for model in {type(obj) for obj in objects}:
+                await assign_ids(db, [obj for obj in objects if type(obj) is model])
+            db.add_all(objects)
+            await db.flush()
+            votes = collections.defaultdict(list)
+            for obj in objects:
+                if isinstance(obj, Rating):
+                    votes[obj.id_resep_master].append(obj.rating)
+            for resep_master_id, values in votes.items():
+                await apply_ratings(db, resep_master_id, values)
+            cache_keys = [
+                *recipe_cache_keys([obj.id_resep_master for obj in objects if isinstance(obj, TestiDiskusi)]),
+                *recipe_cache_keys(votes, summary=True),
+            ]
+            await db.commit()
+        return [column_dict(obj) for obj in objects], cache_keys
+
+    def stats(self):
+        return {
+            "enabled": self.task is not None,
+            "ack": self.ack,
+            "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+            "queue_size": self.queue_size,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "flush_seconds": self.flush_seconds.snapshot(),
+            "batch_rows": self.batch_rows.snapshot(),
+        }
+
+write_buffer = WriteBuffer(settings.write_buffer_max_rows, settings.write_buffer_max_delay_ms / 1000, settings.write_buffer_queue_size, settings.write_buffer_ack)
+
 router = APIRouter(tags=["Testi Diskusi"],prefix="/api")
 
 @app.post("/testi_diskusi/", status_code=status.HTTP_201_CREATED)
-def create_testi_diskusi(resep_master_id: int, user_id: int, foto: str, testimonial: str, db: Session = Depends(get_db)):
+async def create_testi_diskusi(resep_master_id: int, user_id: int, foto: str, testimonial: str, db: AsyncSession = Depends(get_db)):
+    if settings.write_buffer:
+        return await write_buffer.submit(TestiDiskusi, {"id_resep_master": resep_master_id, "user_id": user_id, "foto": foto, "testimonial": testimonial})
     new_testi_diskusi = TestiDiskusi(id_resep_master=resep_master_id, user_id=user_id, foto=foto, testimonial=testimonial)
     db.add(new_testi_diskusi)
-    db.commit()
-    db.refresh(new_testi_diskusi)
+    cache_keys = recipe_cache_keys([new_testi_diskusi.id_resep_master])
+    await db.commit()
+    await read_cache.delete(*cache_keys)
+    await db.refresh(new_testi_diskusi)
+    await events.publish([resep_master_id], "testi_diskusi", "created", event_data(TestiDiskusiSchema, new_testi_diskusi))
     return new_testi_diskusi
 
 @app.post("/reply_diskusi/", status_code=status.HTTP_201_CREATED)
-def create_reply_diskusi(testi_diskusi_id: int, user_id: int, testimonial: str, db: Session = Depends(get_db)):
+async def create_reply_diskusi(testi_diskusi_id: int, user_id: int, testimonial: str, db: AsyncSession = Depends(get_db)):
     new_reply_diskusi = ReplyDiskusi(id_testi_diskusi=testi_diskusi_id, user_id=user_id, testimonial=testimonial)
     db.add(new_reply_diskusi)
-    db.commit()
-    db.refresh(new_reply_diskusi)
+    await apply_reply_counts(db, {testi_diskusi_id: 1})
+    recipe_ids = await resep_master_ids(db, TestiDiskusi, [new_reply_diskusi.id_testi_diskusi])
+    cache_keys = recipe_cache_keys(recipe_ids)
+    await db.commit()
+    await read_cache.delete(*cache_keys)
+    await db.refresh(new_reply_diskusi)
+    await events.publish(recipe_ids, "reply_diskusi", "created", event_data(ReplyDiskusiSchema, new_reply_diskusi))
+    return new_reply_diskusi
+
+@app.post("/reply_diskusi/bulk", response_model=List[ReplyDiskusiSchema], status_code=status.HTTP_201_CREATED)
+async def create_reply_diskusi_bulk(reply_diskusi: conlist(ReplyDiskusiCreate, min_items=1, max_items=MAX_BULK_SIZE), db: AsyncSession = Depends(get_db)):
+    new_reply_diskusi = await bulk_insert(db, ReplyDiskusi, reply_diskusi)
+    await apply_reply_counts(db, collections.Counter(item.id_testi_diskusi for item in reply_diskusi))
+    recipe_ids = await resep_master_id_map(db, TestiDiskusi, [item.id_testi_diskusi for item in reply_diskusi])
+    cache_keys = recipe_cache_keys(recipe_ids.values())
+    await db.commit()
+    await read_cache.delete(*cache_keys)
+    replies = [event_data(ReplyDiskusiSchema, item) for item in new_reply_diskusi]
+    await events.publish_events([change_event(recipe_ids.get(data["id_testi_diskusi"]), "reply_diskusi", "created", data) for data in replies])
     return new_reply_diskusi
 
 @app.get("/testi_diskusi/{testi_diskusi_id}", response_model=TestiDiskusiSchema)
-def read_testi_diskusi(testi_diskusi_id: int, db: Session = Depends(get_db)):
-    testi_diskusi = db.query(TestiDiskusi).filter(TestiDiskusi.id == testi_diskusi_id).first()
+async def read_testi_diskusi(testi_diskusi_id: int, request: Request, db: AsyncSession = Depends(get_read_db)):
+    key = f"testi_diskusi:{testi_diskusi_id}"
+    cached = await read_cache.get(key)
+    if cached is not None:
+        return cached_response(request, cached)
+    testi_diskusi = await db.get(TestiDiskusi, testi_diskusi_id)
     if testi_diskusi is None:
         raise HTTPException(status_code=404, detail="TestiDiskusi not found")
-    return testi_diskusi
+    return cached_response(request, await read_cache.set(key, TestiDiskusiSchema.from_orm(testi_diskusi).dict()))
 
 @app.get("/reply_diskusi/{reply_diskusi_id}", response_model=ReplyDiskusiSchema)
-def read_reply_diskusi(reply_diskusi_id: int, db: Session = Depends(get_db)):
-    reply_diskusi = db.query(ReplyDiskusi).filter(ReplyDiskusi.id == reply_diskusi_id).first()
+async def read_reply_diskusi(reply_diskusi_id: int, request: Request, db: AsyncSession = Depends(get_read_db)):
+    key = f"reply_diskusi:{reply_diskusi_id}"
+    cached = await read_cache.get(key)
+    if cached is not None:
+        return cached_response(request, cached)
+    reply_diskusi = await db.get(ReplyDiskusi, reply_diskusi_id)
     if reply_diskusi is None:
         raise HTTPException(status_code=404, detail="ReplyDiskusi not found")
-    return reply_diskusi
+    return cached_response(request, await read_cache.set(key, ReplyDiskusiSchema.from_orm(reply_diskusi).dict()))
 
 @app.get("/testi_diskusi/", response_model=List[TestiDiskusiSchema])
-def read_all_testi_diskusi(db: Session = Depends(get_db)):
-    return db.query(TestiDiskusi).all()
+async def read_all_testi_diskusi(response: Response, page: PageParams = Depends(), db: AsyncSession = Depends(get_read_db)):
+    return await paginate(db, project(TestiDiskusi, TestiDiskusiSchema), TestiDiskusi, response, page, serialize=row_serializer(TestiDiskusiSchema))
 
 @app.get("/reply_diskusi/", response_model=List[ReplyDiskusiSchema])
-def read_all_reply_diskusi(db: Session = Depends(get_db)):
-    return db.query(ReplyDiskusi).all()
+async def read_all_reply_diskusi(response: Response, page: PageParams = Depends(), db: AsyncSession = Depends(get_read_db)):
+    return await paginate(db, project(ReplyDiskusi, ReplyDiskusiSchema), ReplyDiskusi, response, page, serialize=row_serializer(ReplyDiskusiSchema))
+
+@app.get("/resep_master/{resep_master_id}/testi_diskusi", response_model=List[TestiDiskusiFeedItem])
+async def read_resep_testi_diskusi(resep_master_id: int, response: Response, page: FeedParams = Depends(), db: AsyncSession = Depends(get_read_db)):
+    stmt = project(TestiDiskusi, TestiDiskusiSchema).add_columns(TestiDiskusi.reply_count).where(TestiDiskusi.id_resep_master == resep_master_id)
+    return await with_users(db, await feed(db, stmt, TestiDiskusi, response, page))
+
+@app.get("/testi_diskusi/{testi_diskusi_id}/reply_diskusi", response_model=List[ReplyDiskusiFeedItem])
+async def read_testi_reply_diskusi(testi_diskusi_id: int, response: Response, page: FeedParams = Depends(), db: AsyncSession = Depends(get_read_db)):
+    stmt = project(ReplyDiskusi, ReplyDiskusiSchema).where(ReplyDiskusi.id_testi_diskusi == testi_diskusi_id)
+    return await with_users(db, await feed(db, stmt, ReplyDiskusi, response, page))
+
+@app.patch("/testi_diskusi/{testi_diskusi_id}", response_model=TestiDiskusiSchema)
+async def patch_testi_diskusi(testi_diskusi_id: int, testi_diskusi: TestiDiskusiPatch, response: Response, if_match: Optional[str] = Header(None), db: AsyncSession = Depends(get_db)):
+    new, old = await patch_row(db, TestiDiskusi, testi_diskusi_id, testi_diskusi, if_match)
+    recipe_ids = [old["id_resep_master"], new["id_resep_master"]]
+    await db.commit()
+    await read_cache.delete(f"testi_diskusi:{testi_diskusi_id}", *recipe_cache_keys(recipe_ids))
+    await events.publish(recipe_ids, "testi_diskusi", "updated", event_data(TestiDiskusiSchema, new))
+    response.headers["ETag"] = version_etag(new["version"])
+    return new
 
 @app.put("/testi_diskusi/{testi_diskusi_id}", response_model=TestiDiskusiSchema)
-def update_testi_diskusi(testi_diskusi_id: int, testi_diskusi: TestiDiskusiSchema, db: Session = Depends(get_db)):
-    db_item = db.query(TestiDiskusi).filter(TestiDiskusi.id == testi_diskusi_id).first()
-    if not db_item:
-        raise HTTPException(status_code=404, detail="TestiDiskusi not found")
-    for var, value in vars(testi_diskusi).items():
-        setattr(db_item, var, value) if value else None
-    db.commit()
-    db.refresh(db_item)
-    return db_item
+async def update_testi_diskusi(testi_diskusi_id: int, testi_diskusi: TestiDiskusiSchema, response: Response, if_match: Optional[str] = Header(None), db: AsyncSession = Depends(get_db)):
+    return await patch_testi_diskusi(testi_diskusi_id, TestiDiskusiPatch(**testi_diskusi.dict()), response, if_match, db)
+
+@app.patch("/reply_diskusi/{reply_diskusi_id}", response_model=ReplyDiskusiSchema)
+async def patch_reply_diskusi(reply_diskusi_id: int, reply_diskusi: ReplyDiskusiPatch, response: Response, if_match: Optional[str] = Header(None), db: AsyncSession = Depends(get_db)):
+    new, old = await patch_row(db, ReplyDiskusi, reply_diskusi_id, reply_diskusi, if_match)
+    if new["id_testi_diskusi"] != old["id_testi_diskusi"]:
+        await apply_reply_counts(db, {old["id_testi_diskusi"]: -1, new["id_testi_diskusi"]: 1})
+    recipe_ids = await resep_master_ids(db, TestiDiskusi, [old["id_testi_diskusi"], new["id_testi_diskusi"]])
+    cache_keys = [f"reply_diskusi:{reply_diskusi_id}", *recipe_cache_keys(recipe_ids)]
+    await db.commit()
+    await read_cache.delete(*cache_keys)
+    await events.publish(recipe_ids, "reply_diskusi", "updated", event_data(ReplyDiskusiSchema, new))
+    response.headers["ETag"] = version_etag(new["version"])
+    return new
 
 @app.put("/reply_diskusi/{reply_diskusi_id}", response_model=ReplyDiskusiSchema)
-def update_reply_diskusi(reply_diskusi_id: int, reply_diskusi: ReplyDiskusiSchema, db: Session = Depends(get_db)):
-    db_item = db.query(ReplyDiskusi).filter(ReplyDiskusi.id == reply_diskusi_id).first()
+async def update_reply_diskusi(reply_diskusi_id: int, reply_diskusi: ReplyDiskusiSchema, response: Response, if_match: Optional[str] = Header(None), db: AsyncSession = Depends(get_db)):
+    return await patch_reply_diskusi(reply_diskusi_id, ReplyDiskusiPatch(**reply_diskusi.dict()), response, if_match, db)
+
+@app.put("/testi_diskusi/{testi_diskusi_id}/foto", response_model=TestiDiskusiSchema)
+async def upload_testi_diskusi_foto(testi_diskusi_id: int, request: Request, db: AsyncSession = Depends(get_db)):
+    # Same streaming upload as PUT /users/{id}/image; foto becomes the URL
+    # of the uploaded photo.
+    check_upload_headers(request.headers.get("content-type"), request.headers.get("content-length"))
+    db_item = await db.get(TestiDiskusi, testi_diskusi_id)
     if not db_item:
-        raise HTTPException(status_code=404, detail="ReplyDiskusi not found")
-    for var, value in vars(reply_diskusi).items():
-        setattr(db_item, var, value) if value else None
-    db.commit()
-    db.refresh(db_item)
+        raise HTTPException(status_code=404, detail="TestiDiskusi not found")
+    db_item.foto_key, db_item.foto_type = await store_image(request.stream())
+    db_item.foto = f"/testi_diskusi/{testi_diskusi_id}/foto"
+    db_item.version = TestiDiskusi.version + 1
+    cache_keys = [f"testi_diskusi:{testi_diskusi_id}", *recipe_cache_keys([db_item.id_resep_master])]
+    await db.commit()
+    await read_cache.delete(*cache_keys)
+    await db.refresh(db_item, ["version"])
+    await events.publish([db_item.id_resep_master], "testi_diskusi", "updated", event_data(TestiDiskusiSchema, db_item))
     return db_item
 
+@app.get("/testi_diskusi/{testi_diskusi_id}/foto")
+async def read_testi_diskusi_foto(testi_diskusi_id: int, request: Request, size: Optional[ImageSize] = None, db: AsyncSession = Depends(get_read_db)):
+    testi_diskusi = (await db.execute(select(TestiDiskusi.foto_key, TestiDiskusi.foto_type).where(TestiDiskusi.id == testi_diskusi_id))).first()
+    if not testi_diskusi:
+        raise HTTPException(status_code=404, detail="TestiDiskusi not found")
+    if not testi_diskusi.foto_key:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return await image_response(request, testi_diskusi.foto_key, testi_diskusi.foto_type or "image/jpeg", size)
+
 @app.delete("/testi_diskusi/{testi_diskusi_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_testi_diskusi(testi_diskusi_id: int, db: Session = Depends(get_db)):
-    db_item = db.query(TestiDiskusi).filter(TestiDiskusi.id == testi_diskusi_id).first()
+async def delete_testi_diskusi(testi_diskusi_id: int, db: AsyncSession = Depends(get_db)):
+    db_item = await db.get(TestiDiskusi, testi_diskusi_id)
     if not db_item:
         raise HTTPException(status_code=404, detail="TestiDiskusi not found")
-    db.delete(db_item)
-    db.commit()
+    recipe_ids = [db_item.id_resep_master]
+    cache_keys = [f"testi_diskusi:{testi_diskusi_id}", *recipe_cache_keys(recipe_ids)]
+    await db.delete(db_item)
+    await db.commit()
+    await read_cache.delete(*cache_keys)
+    await events.publish(recipe_ids, "testi_diskusi", "deleted", {"id": testi_diskusi_id})
     return {"ok": True}
 
 @app.delete("/reply_diskusi/{reply_diskusi_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_reply_diskusi(reply_diskusi_id: int, db: Session = Depends(get_db)):
-    db_item = db.query(ReplyDiskusi).filter(ReplyDiskusi.id == reply_diskusi_id).first()
+async def delete_reply_diskusi(reply_diskusi_id: int, db: AsyncSession = Depends(get_db)):
+    db_item = await db.get(ReplyDiskusi, reply_diskusi_id)
     if not db_item:
         raise HTTPException(status_code=404, detail="ReplyDiskusi not found")
-    db.delete(db_item)
-    db.commit()
+    recipe_ids = await resep_master_ids(db, TestiDiskusi, [db_item.id_testi_diskusi])
+    cache_keys = [f"reply_diskusi:{reply_diskusi_id}", *recipe_cache_keys(recipe_ids)]
+    await apply_reply_counts(db, {db_item.id_testi_diskusi: -1})
+    await db.delete(db_item)
+    await db.commit()
+    await read_cache.delete(*cache_keys)
+    await events.publish(recipe_ids, "reply_diskusi", "deleted", {"id": reply_diskusi_id, "id_testi_diskusi": db_item.id_testi_diskusi})
     return {"ok": True}
 
 router = APIRouter(tags=["Rating"],prefix="/api")
 
 @app.post("/rating/", status_code=status.HTTP_201_CREATED)
-def create_rating(resep_master_id: int, rating_value: float, db: Session = Depends(get_db)):
+async def create_rating(resep_master_id: int, rating_value: float, db: AsyncSession = Depends(get_db)):
+    if settings.write_buffer:
+        return await write_buffer.submit(Rating, {"id_resep_master": resep_master_id, "rating": rating_value})
     new_rating = Rating(id_resep_master=resep_master_id, rating=rating_value)
     db.add(new_rating)
-    db.commit()
-    db.refresh(new_rating)
+    await apply_rating(db, resep_master_id, rating_value)
+    await db.commit()
+    await read_cache.delete(*recipe_cache_keys([resep_master_id], summary=True))
+    await db.refresh(new_rating)
+    await events.publish([resep_master_id], "rating", "created", event_data(RatingSchema, new_rating))
+    return new_rating
+
+@app.post("/rating/bulk", response_model=List[RatingSchema], status_code=status.HTTP_201_CREATED)
+async def create_rating_bulk(rating: conlist(RatingCreate, min_items=1, max_items=MAX_BULK_SIZE), db: AsyncSession = Depends(get_db)):
+    new_rating = await bulk_insert(db, Rating, rating)
+    votes = collections.defaultdict(list)
+    for item in rating:
+        votes[item.id_resep_master].append(item.rating)
+    for resep_master_id, values in votes.items():
+        await apply_ratings(db, resep_master_id, values)
+    await db.commit()
+    await read_cache.delete(*recipe_cache_keys(votes, summary=True))
+    ratings = [event_data(RatingSchema, item) for item in new_rating]
+    await events.publish_events([change_event(data["id_resep_master"], "rating", "created", data) for data in ratings])
     return new_rating
 
 @app.get("/rating/{rating_id}", response_model=RatingSchema)
-def read_rating(rating_id: int, db: Session = Depends(get_db)):
-    rating = db.query(Rating).filter(Rating.id == rating_id).first()
+async def read_rating(rating_id: int, request: Request, db: AsyncSession = Depends(get_read_db)):
+    key = f"rating:{rating_id}"
+    cached = await read_cache.get(key)
+    if cached is not None:
+        return cached_response(request, cached)
+    rating = await db.get(Rating, rating_id)
     if rating is None:
         raise HTTPException(status_code=404, detail="Rating not found")
-    return rating
+    return cached_response(request, await read_cache.set(key, RatingSchema.from_orm(rating).dict()))
 
 @app.get("/rating/", response_model=List[RatingSchema])
-def read_all_rating(db: Session = Depends(get_db)):
-    return db.query(Rating).all()
+async def read_all_rating(response: Response, page: PageParams = Depends(), db: AsyncSession = Depends(get_read_db)):
+    return await paginate(db, project(Rating, RatingSchema), Rating, response, page, serialize=row_serializer(RatingSchema))
+
+@app.patch("/rating/{rating_id}", response_model=RatingSchema)
+async def patch_rating(rating_id: int, rating: RatingPatch, response: Response, if_match: Optional[str] = Header(None), db: AsyncSession = Depends(get_db)):
+    new, old = await patch_row(db, Rating, rating_id, rating, if_match)
+    if (new["id_resep_master"], new["rating"]) != (old["id_resep_master"], old["rating"]):
+        await apply_rating(db, old["id_resep_master"], old["rating"], sign=-1)
+        await apply_rating(db, new["id_resep_master"], new["rating"])
+    await db.commit()
+    await read_cache.delete(f"rating:{rating_id}", *recipe_cache_keys([old["id_resep_master"], new["id_resep_master"]], summary=True))
+    await events.publish([old["id_resep_master"], new["id_resep_master"]], "rating", "updated", event_data(RatingSchema, new))
+    response.headers["ETag"] = version_etag(new["version"])
+    return new
 
 @app.put("/rating/{rating_id}", response_model=RatingSchema)
-def update_rating(rating_id: int, rating: RatingSchema, db: Session = Depends(get_db)):
-    db_item = db.query(Rating).filter(Rating.id == rating_id).first()
-    if not db_item:
-        raise HTTPException(status_code=404, detail="Rating not found")
-    for var, value in vars(rating).items():
-        setattr(db_item, var, value) if value else None
-    db.commit()
-    db.refresh(db_item)
-    return db_item
+async def update_rating(rating_id: int, rating: RatingSchema, response: Response, if_match: Optional[str] = Header(None), db: AsyncSession = Depends(get_db)):
+    return await patch_rating(rating_id, RatingPatch(**rating.dict()), response, if_match, db)
 
 @app.delete("/rating/{rating_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_rating(rating_id: int, db: Session = Depends(get_db)):
-    db_item = db.query(Rating).filter(Rating.id == rating_id).first()
+async def delete_rating(rating_id: int, db: AsyncSession = Depends(get_db)):
+    db_item = await db.get(Rating, rating_id)
     if not db_item:
         raise HTTPException(status_code=404, detail="Rating not found")
-    db.delete(db_item)
-    db.commit()
+    cache_keys = [f"rating:{rating_id}", *recipe_cache_keys([db_item.id_resep_master], summary=True)]
+    await apply_rating(db, db_item.id_resep_master, db_item.rating, sign=-1)
+    await db.delete(db_item)
+    await db.commit()
+    await read_cache.delete(*cache_keys)
+    await events.publish([db_item.id_resep_master], "rating", "deleted", {"id": rating_id})
     return {"ok": True}
 
+router = APIRouter(tags=["Events"],prefix="/api")
+
+async def require_resep_master(resep_master_id):
+    # Own short session: a dependency's session would stay checked out for
+    # as long as the subscription is open.
+    async with AsyncSessionLocal() as db:
+        if await db.get(ResepMaster, resep_master_id) is None:
+            raise HTTPException(status_code=404, detail="ResepMaster not found")
+
+async def sse_lines(resep_master_id):
+    subscription = events.subscribe(resep_master_id)
+    try:
+        yield ": subscribed\n\n"
+        async for change in subscription.events(settings.events_keepalive_seconds):
+            if change is None:
+                yield ": keepalive\n\n"
+            else:
+                yield f"event: {change['type']}\ndata: {json.dumps(change, default=str)}\n\n"
+    finally:
+        events.unsubscribe(subscription)
+
+@app.get("/resep_master/{resep_master_id}/events")
+async def stream_resep_events(resep_master_id: int):
+    await require_resep_master(resep_master_id)
+    return StreamingResponse(sse_lines(resep_master_id), media_type="text/event-stream", headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"})
+
+@app.websocket("/resep_master/{resep_master_id}/ws")
+async def resep_events_websocket(websocket: WebSocket, resep_master_id: int):
+    try:
+        await require_resep_master(resep_master_id)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    subscription = events.subscribe(resep_master_id)
+
+    async def watch_disconnect(cancel_scope):
+        # Messages from the client are ignored; this only notices it leaving.
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+        cancel_scope.cancel()
+
+    try:
+        async with anyio.create_task_group() as tasks:
+            tasks.start_soon(watch_disconnect, tasks.cancel_scope)
+            async for change in subscription.events():
+                await websocket.send_text(json.dumps(change, default=str))
+            await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+            tasks.cancel_scope.cancel()
+    finally:
+        events.unsubscribe(subscription)
+
 router = APIRouter(tags=["User"],prefix="/api")
 
 @app.post("/users/", response_model=UserDisplay, status_code=status.HTTP_201_CREATED)
-async def create_user(name: str, email: str, user_pict: UploadFile = File(None), db: Session = Depends(get_db)):
-    image_data = None
+async def create_user(name: str, email: str, user_pict: UploadFile = File(None), db: AsyncSession = Depends(get_db)):
+    new_user = User(name=name, email=email)
     if user_pict:
-        contents = await user_pict.read()
-        image_data = base64.b64encode(contents).decode('utf-8')
-    new_user = User(name=name, email=email, user_pict=image_data)
+        check_upload_headers(user_pict.content_type)
+        new_user.user_pict_key, new_user.user_pict_type = await store_image(upload_chunks(user_pict))
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-    return new_user
+    await db.commit()
+    await db.refresh(new_user)
+    return user_display(new_user)
 
 @app.get("/users/{user_id}", response_model=UserDisplay)
-def read_user(user_id: int, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == user_id).first()
+async def read_user(user_id: int, db: AsyncSession = Depends(get_read_db)):
+    user = (await db.execute(select(*USER_COLUMNS).where(User.id == user_id))).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    user_data = {
+    return JSONResponse(content=user_display(user))
+
+USER_COLUMNS = (User.id, User.name, User.email, User.user_pict_key, User.has_legacy_pict, User.version)
+
+# What PATCH /users/{id} returns; the legacy picture itself is not read.
+USER_PATCH_COLUMNS = [
+    *[User.__table__.c[name] for name in ("id", "name", "email", "user_pict_key", "version")],
+    User.__table__.c.user_pict.isnot(None).label("has_legacy_pict"),
+]
+
+def user_pict_url(user):
+    if user.user_pict_key or user.has_legacy_pict:
+        return f"/users/{user.id}/image"
+    return None
+
+def user_display(user):
+    return {
         "id": user.id,
         "name": user.name,
         "email": user.email,
-        "user_pict": None
+        "user_pict": user_pict_url(user),
+        "version": user.version,
     }
 
-    if user.user_pict:
-        try:
-            user_data["user_pict"] = "data:image/jpeg;base64," + user.user_pict
-        except Exception as e:
-            raise HTTPException(status_code=500, detail="Error processing image data")
+USER_REF_COLUMNS = (User.id, User.name, User.user_pict_key, User.has_legacy_pict)
+
+def user_ref(user):
+    return {"id": user.id, "name": user.name, "user_pict": user_pict_url(user)}
+
+async def with_users(db, items):
+    # One IN query for every author on the page instead of one per row.
+    user_ids = {item["user_id"] for item in items if item["user_id"] is not None}
+    users = {}
+    if user_ids:
+        users = {user.id: user_ref(user) for user in await db.execute(select(*USER_REF_COLUMNS).where(User.id.in_(user_ids)))}
+    for item in items:
+        item["user"] = users.get(item["user_id"])
+    return items
 
-    return JSONResponse(content=user_data)
+def user_list_item(user):
+    return {
+        "id": user.id,
+        "name": user.name,
+        "email": user.email,
+        "user_pict": user_pict_url(user) or "No image available"
+    }
 
 @app.get("/users")
-def read_all_user(db: Session = Depends(get_db)):
-    users = db.query(User).all()
-    response = []
-    for user in users:
-        user_data = {
-            "id": user.id,
-            "name": user.name,
-            "email": user.email,
-            "user_pict": "data:image/jpeg;base64," + user.user_pict if user.user_pict else "No image available"
-        }
-        response.append(user_data)
-    return response
+async def read_all_user(response: Response, page: PageParams = Depends(), db: AsyncSession = Depends(get_read_db)):
+    return await paginate(db, select(*USER_COLUMNS), User, response, page, serialize=user_list_item)
 
 @app.get("/users/{user_id}/image")
-def read_user_image(user_id: int, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == user_id).first()
+async def read_user_image(user_id: int, request: Request, size: Optional[ImageSize] = None, db: AsyncSession = Depends(get_read_db)):
+    user = (await db.execute(select(User.user_pict_key, User.user_pict_type, User.user_pict).where(User.id == user_id))).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
+    if user.user_pict_key:
+        return await image_response(request, user.user_pict_key, user.user_pict_type or "image/jpeg", size)
+
     if not user.user_pict:
         raise HTTPException(status_code=404, detail="Image not found")
 
@@ -578,11 +2757,14 @@ def read_user_image(user_id: int, db: Session = Depends(get_db)):
     except ValueError:
         raise HTTPException(status_code=500, detail="Error decoding image data")
 
-    return Response(content=image_data, media_type="image/jpeg")
+    headers = {"ETag": body_etag(image_data), "Cache-Control": IMAGE_CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return not_modified(headers)
+    return Response(content=image_data, media_type="image/jpeg", headers=headers)
 
 @app.put("/users/{user_id}", response_model=UserDisplay)
-async def update_user(user_id: int, name: Optional[str] = None, email: Optional[str] = None, user_pict: UploadFile = File(None), db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.id == user_id).first()
+async def update_user(user_id: int, name: Optional[str] = None, email: Optional[str] = None, user_pict: UploadFile = File(None), db: AsyncSession = Depends(get_db)):
+    db_user = await db.get(User, user_id)
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
     if name:
@@ -590,16 +2772,695 @@ async def update_user(user_id: int, name: Optional[str] = None, email: Optional[
     if email:
         db_user.email = email
     if user_pict:
-        contents = await user_pict.read()
-        db_user.user_pict = base64.b64encode(contents).decode('utf-8')
-    db.commit()
-    return db_user
+        check_upload_headers(user_pict.content_type)
+        db_user.user_pict_key, db_user.user_pict_type = await store_image(upload_chunks(user_pict))
+        db_user.user_pict = None
+    db_user.version = User.version + 1
+    await db.commit()
+    await db.refresh(db_user)
+    return user_display(db_user)
+
+@app.patch("/users/{user_id}", response_model=UserDisplay)
+async def patch_user(user_id: int, user: UserPatch, response: Response, if_match: Optional[str] = Header(None), db: AsyncSession = Depends(get_db)):
+    new, _ = await patch_row(db, User, user_id, user, if_match, columns=USER_PATCH_COLUMNS)
+    await db.commit()
+    response.headers["ETag"] = version_etag(new["version"])
+    return user_display(types.SimpleNamespace(**new))
+
+@app.put("/users/{user_id}/image", response_model=UserDisplay)
+async def upload_user_image(user_id: int, request: Request, db: AsyncSession = Depends(get_db)):
+    # The request body is the image itself (not a form), streamed to the
+    # blob store as it arrives.
+    check_upload_headers(request.headers.get("content-type"), request.headers.get("content-length"))
+    db_user = await db.get(User, user_id)
+    if not db_user:
+        raise HTTPException(status_code=404, detail="User not found")
+    db_user.user_pict_key, db_user.user_pict_type = await store_image(request.stream())
+    db_user.user_pict = None
+    db_user.version = User.version + 1
+    await db.commit()
+    await db.refresh(db_user)
+    return user_display(db_user)
 
 @app.delete("/users/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_user(user_id: int, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.id == user_id).first()
+async def delete_user(user_id: int, db: AsyncSession = Depends(get_db)):
+    db_user = await db.get(User, user_id)
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
-    db.delete(db_user)
-    db.commit()
-    return {"ok": True}
\ No newline at end of file
+    await db.delete(db_user)
+    await db.commit()
+    return {"ok": True}
+
+router = APIRouter(tags=["Metrics"],prefix="/api")
+
+def pool_stats(pool):
+    return {
+        "size": pool.size() if hasattr(pool, "size") else None,
+        "checked_in": pool.checkedin() if hasattr(pool, "checkedin") else None,
+        "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else None,
+        "overflow": pool.overflow() if hasattr(pool, "overflow") else None,
+    }
+
+@app.get("/metrics/pool")
+def read_pool_metrics(request: Request):
+    return {**pool_stats(request.app.state.request_engine.pool), "wait_seconds": POOL_WAIT_SECONDS.snapshot()}
+
+@app.get("/metrics/cache")
+def read_cache_metrics():
+    return read_cache.stats()
+
+@app.get("/metrics/replicas")
+def read_replica_metrics():
+    return replicas.stats()
+
+@app.get("/metrics/write_buffer")
+def read_write_buffer_metrics():
+    return write_buffer.stats()
+
+@app.get("/metrics/events")
+def read_event_metrics():
+    return events.stats()
+
+logger = logging.getLogger("app")
+
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+SIZE_BUCKETS = [100, 1000, 10000, 100000, 1000000, 10000000]
+QUERY_COUNT_BUCKETS = [0, 1, 2, 5, 10, 20, 50, 100]
+MAX_LOGGED_STATEMENTS = 50
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = []
+
+# Set by RequestMetricsMiddleware for the duration of a request; the engine
+# events below add every statement run on its behalf.
+QUERY_STATS = contextvars.ContextVar("query_stats", default=None)
+
+@event.listens_for(Engine, "before_cursor_execute")
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info["query_started"] = time.perf_counter()
+
+@event.listens_for(Engine, "after_cursor_execute")
+def record_query(conn, cursor, statement, parameters, context, executemany):
+    stats = QUERY_STATS.get()
+    if stats is None:
+        return
+    elapsed = time.perf_counter() - conn.info.pop("query_started", time.perf_counter())
+    stats.count += 1
+    stats.seconds += elapsed
+    if len(stats.statements) < MAX_LOGGED_STATEMENTS:
+        stats.statements.append((elapsed, statement))
+
+class RouteMetrics:
+    def __init__(self):
+        self.status = collections.Counter()
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.size = Histogram(SIZE_BUCKETS)
+        self.queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.query_seconds = Histogram(LATENCY_BUCKETS)
+
+class RequestMetrics:
+    def __init__(self):
+        self.in_flight = 0
+        self.routes = collections.defaultdict(RouteMetrics)
+
+    def observe(self, method, route, status_code, elapsed, size, stats):
+        metrics = self.routes[method, route]
+        metrics.status[status_code] += 1
+        metrics.latency.observe(elapsed)
+        metrics.size.observe(size)
+        metrics.queries.observe(stats.count)
+        metrics.query_seconds.observe(stats.seconds)
+
+REQUEST_METRICS = RequestMetrics()
+
+def log_slow_request(scope, status_code, elapsed, stats):
+    statements = "\n".join(f"  {seconds * 1000:.1f}ms {statement}" for seconds, statement in stats.statements)
+    logger.warning("slow request %s %s -> %s: %.1fms, %d queries (%.1fms)\n%s",
+                   scope["method"], scope["path"], status_code, elapsed * 1000, stats.count, stats.seconds * 1000, statements)
+
+class RequestMetricsMiddleware:
+    # Plain ASGI like ConditionalGetMiddleware, so file and streaming
+    # responses are measured without being buffered. Routes are labelled by
+    # their template (/resep_master/{resep_master_id}), not the raw path.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = QueryStats()
+        token = QUERY_STATS.set(stats)
+        status_code = 500
+        size = 0
+        event_stream = False
+
+        async def send_measured(message):
+            nonlocal status_code, size, event_stream
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                event_stream = Headers(raw=message["headers"]).get("content-type", "").startswith("text/event-stream")
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            elif message["type"] == "http.response.zerocopysend":
+                size += message.get("count") or 0
+            await send(message)
+
+        REQUEST_METRICS.in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_measured)
+        finally:
+            elapsed = time.perf_counter() - started
+            REQUEST_METRICS.in_flight -= 1
+            QUERY_STATS.reset(token)
+            route = scope.get("route")
+            REQUEST_METRICS.observe(scope["method"], route.path if route else "unmatched", status_code, elapsed, size, stats)
+            # Event streams are long by design.
+            if not event_stream and (elapsed * 1000 > settings.slow_request_ms or stats.count > settings.slow_request_queries):
+                log_slow_request(scope, status_code, elapsed, stats)
+
+app.add_middleware(RequestMetricsMiddleware)
+
+def prometheus_labels(labels):
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in labels.items()) + "}" if labels else ""
+
+def prometheus_histogram(name, labels, histogram):
+    snapshot = histogram.snapshot()
+    lines = [f"{name}_bucket{prometheus_labels({**labels, 'le': bound})} {count}" for bound, count in snapshot["buckets"].items()]
+    lines.append(f"{name}_sum{prometheus_labels(labels)} {snapshot['sum']}")
+    lines.append(f"{name}_count{prometheus_labels(labels)} {snapshot['count']}")
+    return lines
+
+def prometheus_text(app):
+    lines = [
+        "# TYPE http_requests_in_flight gauge",
+        f"http_requests_in_flight {REQUEST_METRICS.in_flight}",
+    ]
+    families = [
+        ("http_request_duration_seconds", "latency"),
+        ("http_response_size_bytes", "size"),
+        ("db_queries_per_request", "queries"),
+        ("db_query_seconds_per_request", "query_seconds"),
+    ]
+    lines.append("# TYPE http_requests_total counter")
+    for (method, route), metrics in sorted(REQUEST_METRICS.routes.items()):
+        for status_code, count in sorted(metrics.status.items()):
+            lines.append(f"http_requests_total{prometheus_labels({'method': method, 'route': route, 'status': status_code})} {count}")
+    for name, attribute in families:
+        lines.append(f"# TYPE {name} histogram")
+        for (method, route), metrics in sorted(REQUEST_METRICS.routes.items()):
+            lines.extend(prometheus_histogram(name, {"method": method, "route": route}, getattr(metrics, attribute)))
+    engine = getattr(app.state, "request_engine", None)
+    if engine is not None:
+        for name, value in pool_stats(engine.pool).items():
+            if value is not None:
+                lines.append(f"# TYPE db_pool_{name} gauge")
+                lines.append(f"db_pool_{name} {value}")
+    lines.append("# TYPE db_pool_wait_seconds histogram")
+    lines.extend(prometheus_histogram("db_pool_wait_seconds", {}, POOL_WAIT_SECONDS))
+    cache = read_cache.stats()
+    lines.append("# TYPE cache_hits_total counter")
+    lines.append(f"cache_hits_total {cache['hits']}")
+    lines.append("# TYPE cache_misses_total counter")
+    lines.append(f"cache_misses_total {cache['misses']}")
+    if cache["entries"] is not None:
+        lines.append("# TYPE cache_entries gauge")
+        lines.append(f"cache_entries {cache['entries']}")
+    if replicas.replicas:
+        lines.append("# TYPE db_replica_healthy gauge")
+        lines.extend(f"db_replica_healthy{prometheus_labels({'replica': replica.name})} {int(replica.healthy)}" for replica in replicas.replicas)
+        lines.append("# TYPE db_replica_lag_seconds gauge")
+        lines.extend(f"db_replica_lag_seconds{prometheus_labels({'replica': replica.name})} {replica.lag}" for replica in replicas.replicas if replica.lag is not None)
+        lines.append("# TYPE db_replica_reads_total counter")
+        lines.extend(f"db_replica_reads_total{prometheus_labels({'replica': replica.name})} {replica.reads}" for replica in replicas.replicas)
+    buffer = write_buffer.stats()
+    lines.append("# TYPE write_buffer_queue_depth gauge")
+    lines.append(f"write_buffer_queue_depth {buffer['queue_depth']}")
+    lines.append("# TYPE write_buffer_rejected_total counter")
+    lines.append(f"write_buffer_rejected_total {buffer['rejected']}")
+    lines.append("# TYPE write_buffer_failed_total counter")
+    lines.append(f"write_buffer_failed_total {buffer['failed']}")
+    lines.append("# TYPE write_buffer_flush_seconds histogram")
+    lines.extend(prometheus_histogram("write_buffer_flush_seconds", {}, write_buffer.flush_seconds))
+    lines.append("# TYPE write_buffer_batch_rows histogram")
+    lines.extend(prometheus_histogram("write_buffer_batch_rows", {}, write_buffer.batch_rows))
+    hub = events.stats()
+    lines.append("# TYPE events_subscribers gauge")
+    lines.append(f"events_subscribers {hub['subscribers']}")
+    lines.append("# TYPE events_published_total counter")
+    lines.append(f"events_published_total {hub['published']}")
+    lines.append("# TYPE events_delivered_total counter")
+    lines.append(f"events_delivered_total {hub['delivered']}")
+    lines.append("# TYPE events_dropped_subscribers_total counter")
+    lines.append(f"events_dropped_subscribers_total {hub['dropped']}")
+    return "\n".join(lines) + "\n"
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def read_prometheus_metrics(request: Request):
+    return PlainTextResponse(prometheus_text(request.app), media_type="text/plain; version=0.0.4")
+
+router = APIRouter(tags=["Admin"],prefix="/api")
+
+IMPORT_BATCH_SIZE = 10000
+EXPORT_QUEUE_SIZE = 64
+
+TransferFormat = enum.Enum("TransferFormat", {"csv": "csv", "ndjson": "ndjson"}, type=str)
+
+class TransferTable:
+    # Columns carried by import and export. parents maps a column to the
+    # table its ids point at; reply_count and rating_summary are derived and
+    # rebuilt after an import instead.
+    def __init__(self, model, columns, parents=None):
+        self.model = model
+        self.name = model.__tablename__
+        self.columns = columns
+        self.parents = parents or {}
+        self.types = [model.__table__.c[column].type.python_type for column in columns]
+
+# In dependency order: parents before children.
+TRANSFER_TABLES = {table.name: table for table in [
+    TransferTable(User, ["id", "name", "email", "user_pict_key", "user_pict_type"]),
+    TransferTable(ResepMaster, ["id", "name"]),
+    TransferTable(BahanMaster, ["id", "id_resep_master", "porsi"], {"id_resep_master": "resep_master"}),
+    TransferTable(BahanDetail, ["id", "id_bahan_master", "name"], {"id_bahan_master": "bahan_master"}),
+    TransferTable(CaraMembuat, ["id", "id_resep_master", "lama_waktu", "tips"], {"id_resep_master": "resep_master"}),
+    TransferTable(CaraMembuatDetail, ["id", "id_cara_membuat", "cara"], {"id_cara_membuat": "cara_membuat"}),
+    TransferTable(TestiDiskusi, ["id", "id_resep_master", "user_id", "foto", "testimonial", "foto_key", "foto_type"],
+                  {"id_resep_master": "resep_master", "user_id": "user"}),
+    TransferTable(ReplyDiskusi, ["id", "id_testi_diskusi", "user_id", "testimonial"], {"id_testi_diskusi": "testi_diskusi", "user_id": "user"}),
+    TransferTable(Rating, ["id", "id_resep_master", "rating"], {"id_resep_master": "resep_master"}),
+]}
+
+def transfer_table(name):
+    if name not in TRANSFER_TABLES:
+        raise ValueError(f"unknown table {name!r}")
+    return TRANSFER_TABLES[name]
+
+def transfer_values(table, row):
+    # CSV gives every value as a string: an empty one is NULL except in text
+    # columns.
+    unknown = set(row) - set(table.columns)
+    if unknown:
+        raise ValueError(f"{table.name}: unknown columns {', '.join(sorted(unknown))}")
+    values = []
+    for column, python_type in zip(table.columns, table.types):
+        value = row.get(column)
+        if value is None or (value == "" and python_type is not str):
+            values.append(None)
+            continue
+        try:
+            values.append(python_type(value))
+        except (TypeError, ValueError):
+            raise ValueError(f"{table.name}.{column}: invalid value {value!r}")
+    return values
+
+def staging_tables(table, metadata):
+    # Per-connection temporary tables: staging holds one batch as sent plus
+    # the id allocated to each row; id_map keeps original id -> new id for
+    # every row imported so far, for the children that follow.
+    columns = [Column(column, Text if python_type is str else table.model.__table__.c[column].type)
+               for column, python_type in zip(table.columns, table.types)]
+    staging = Table(f"import_{table.name}", metadata, Column("new_id", Integer), *columns, prefixes=["TEMPORARY"])
+    id_map = Table(f"import_{table.name}_ids", metadata, Column("id", Integer, index=True), Column("new_id", Integer), prefixes=["TEMPORARY"])
+    return staging, id_map
+
+async def driver_connection(db):
+    connection = await (await db.connection()).get_raw_connection()
+    return connection.connection.driver_connection
+
+async def copy_records(db, table, columns, records):
+    if db.bind.dialect.driver == "asyncpg":
+        # COPY ... FROM STDIN, in asyncpg's binary format.
+        await (await driver_connection(db)).copy_records_to_table(table.name, records=records, columns=columns)
+    else:
+        await db.execute(table.insert(), [dict(zip(columns, record)) for record in records])
+
+class Importer:
+    # Buffers rows per table and loads them a batch at a time: ids for the
+    # whole batch in one round trip, COPY into the staging table, then one
+    # INSERT ... SELECT that swaps every parent id for the id that parent got
+    # in this import. Parent ids that did not come in this import are kept as
+    # they are, so rows can also be added to existing recipes and users.
+    # Tables are flushed together, parents first, so parents have to come
+    # before their children in the input.
+    def __init__(self, db, batch_size=IMPORT_BATCH_SIZE):
+        self.db = db
+        self.batch_size = batch_size
+        self.pending = {name: [] for name in TRANSFER_TABLES}
+        self.counts = {}
+        self.metadata = MetaData()
+        self.tables = {name: staging_tables(table, self.metadata) for name, table in TRANSFER_TABLES.items()}
+
+    async def create(self):
+        # Dropped first: SQLite does not roll temporary tables back with a
+        # failed import, and the connection goes back to the pool.
+        await self.db.run_sync(lambda session: self.metadata.drop_all(session.connection()))
+        await self.db.run_sync(lambda session: self.metadata.create_all(session.connection(), checkfirst=False))
+
+    async def add(self, name, row):
+        table = transfer_table(name)
+        self.pending[name].append(transfer_values(table, row))
+        if len(self.pending[name]) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        for name, rows in self.pending.items():
+            if rows:
+                await self.load(TRANSFER_TABLES[name], rows)
+                self.counts[name] = self.counts.get(name, 0) + len(rows)
+                rows.clear()
+
+    async def load(self, table, rows):
+        staging, id_map = self.tables[table.name]
+        new_ids = await allocate_ids(self.db, table.model, len(rows))
+        await copy_records(self.db, staging, ["new_id", *table.columns], [(new_id, *row) for new_id, row in zip(new_ids, rows)])
+        await self.db.execute(id_map.insert().from_select(["id", "new_id"], select(staging.c.id, staging.c.new_id)))
+        values = [staging.c.new_id]
+        source = staging
+        for column in table.columns[1:]:
+            if column in table.parents:
+                parent_ids = self.tables[table.parents[column]][1].alias(f"parent_{column}")
+                source = source.outerjoin(parent_ids, parent_ids.c.id == staging.c[column])
+                values.append(func.coalesce(parent_ids.c.new_id, staging.c[column]))
+            else:
+                values.append(staging.c[column])
+        await self.db.execute(table.model.__table__.insert().from_select(table.columns, select(*values).select_from(source)))
+        await self.db.execute(staging.delete())
+
+    def imported(self, name):
+        return select(self.tables[name][1].c.new_id)
+
+    async def finish(self):
+        await self.flush()
+        # Derived data, for the recipes and testimonials that got new rows.
+        recipes = select(Rating.id_resep_master).where(Rating.id.in_(self.imported("rating")))
+        await self.db.execute(RatingSummary.__table__.delete().where(RatingSummary.id_resep_master.in_(recipes)))
+        await self.db.execute(RatingSummary.__table__.insert().from_select(
+            RATING_SUMMARY_COLUMNS, rating_summary_votes().where(Rating.id_resep_master.in_(recipes))
+        ))
+        testimonials = select(ReplyDiskusi.id_testi_diskusi).where(ReplyDiskusi.id.in_(self.imported("reply_diskusi")))
+        await self.db.execute(update(TestiDiskusi).where(TestiDiskusi.id.in_(testimonials)).values(
+            reply_count=select(func.count()).where(ReplyDiskusi.id_testi_diskusi == TestiDiskusi.id).scalar_subquery()
+        ).execution_options(synchronize_session=False))
+        await self.db.run_sync(lambda session: self.metadata.drop_all(session.connection()))
+
+async def import_rows(db, rows, batch_size=IMPORT_BATCH_SIZE):
+    # rows: async iterable of (table name, dict). The whole import is one
+    # transaction; returns the number of rows imported per table.
+    importer = Importer(db, batch_size)
+    await importer.create()
+    async for name, row in rows:
+        await importer.add(name, row)
+    await importer.finish()
+    await db.commit()
+    # Imported rows can belong to recipes that are cached.
+    await read_cache.clear()
+    similar_index.reset()
+    return importer.counts
+
+async def csv_rows(name, lines):
+    # The first record is the header. A quoted value may span lines, so lines
+    # are joined until the quotes balance.
+    header = None
+    record = ""
+    async for line in lines:
+        record += line
+        if record.count('"') % 2:
+            continue
+        values = next(csv.reader([record]), None)
+        record = ""
+        if not values:
+            continue
+        if header is None:
+            header = values
+            continue
+        yield name, dict(zip(header, values))
+
+async def ndjson_rows(name, lines):
+    # Without a table name every object names its own in "table" (the whole
+    # schema in one stream, as GET /admin/export writes it).
+    async for line in lines:
+        if not line.strip():
+            continue
+        row = json.loads(line)
+        if not isinstance(row, dict):
+            raise ValueError(f"expected a JSON object per line, got {line[:80]!r}")
+        yield (row.pop("table", None) if name is None else name), row
+
+async def body_lines(request):
+    buffer = b""
+    async for chunk in request.stream():
+        *lines, buffer = (buffer + chunk).split(b"\n")
+        for line in lines:
+            yield line.decode() + "\n"
+    if buffer:
+        yield buffer.decode()
+
+async def file_lines(path):
+    with open(path, newline="") as f:
+        for line in f:
+            yield line
+
+def transfer_select(table):
+    return select(*[table.model.__table__.c[column] for column in table.columns]).order_by(table.model.id)
+
+def csv_line(values):
+    line = io.StringIO()
+    csv.writer(line, lineterminator="\n").writerow(values)
+    return line.getvalue()
+
+async def copy_lines(db, stmt):
+    # COPY (...) TO STDOUT, handed on chunk by chunk through a bounded queue
+    # so a slow reader holds back the copy instead of buffering the table.
+    sql = str(stmt.compile(dialect=db.bind.dialect, compile_kwargs={"literal_binds": True}))
+    connection = await driver_connection(db)
+    chunks = asyncio.Queue(EXPORT_QUEUE_SIZE)
+
+    async def copy():
+        try:
+            await connection.copy_from_query(sql, output=chunks.put, format="csv", header=True)
+        finally:
+            await chunks.put(None)
+
+    task = asyncio.create_task(copy())
+    try:
+        while True:
+            chunk = await chunks.get()
+            if chunk is None:
+                break
+            yield chunk
+        await task
+    finally:
+        task.cancel()
+
+async def csv_lines(db, table):
+    if db.bind.dialect.driver == "asyncpg":
+        async for chunk in copy_lines(db, transfer_select(table)):
+            yield chunk
+        return
+    yield csv_line(table.columns)
+    result = await db.stream(transfer_select(table).execution_options(yield_per=STREAM_BATCH_SIZE))
+    async for row in result:
+        yield csv_line(row)
+
+def export_lines(db, name, format):
+    table = TRANSFER_TABLES[name]
+    if format == TransferFormat.csv:
+        return csv_lines(db, table)
+    return ndjson_lines(db, transfer_select(table), row_dict)
+
+async def export_all_lines(db):
+    for name, table in TRANSFER_TABLES.items():
+        async for line in ndjson_lines(db, transfer_select(table), lambda row: {"table": name, **row._asdict()}):
+            yield line
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not settings.admin_token or not x_admin_token or not hmac.compare_digest(x_admin_token, settings.admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@app.post("/admin/import", dependencies=[Depends(require_admin)])
+async def import_data(request: Request, table: Optional[str] = None, format: TransferFormat = TransferFormat.ndjson, db: AsyncSession = Depends(get_db)):
+    if table is not None and table not in TRANSFER_TABLES:
+        raise HTTPException(status_code=404, detail="Table not found")
+    if format == TransferFormat.csv and table is None:
+        raise HTTPException(status_code=400, detail="CSV imports need a table")
+    parse = csv_rows if format == TransferFormat.csv else ndjson_rows
+    try:
+        counts = await import_rows(db, parse(table, body_lines(request)))
+    except (ValueError, csv.Error) as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    except DBAPIError as error:
+        raise HTTPException(status_code=400, detail=str(error.orig))
+    return {"rows": counts}
+
+@app.get("/admin/export", dependencies=[Depends(require_admin)])
+async def export_data(db: AsyncSession = Depends(get_db)):
+    return StreamingResponse(export_all_lines(db), media_type="application/x-ndjson")
+
+@app.get("/admin/export/{table}", dependencies=[Depends(require_admin)])
+async def export_table(table: str, format: TransferFormat = TransferFormat.csv, db: AsyncSession = Depends(get_db)):
+    if table not in TRANSFER_TABLES:
+        raise HTTPException(status_code=404, detail="Table not found")
+    media_type = "text/csv" if format == TransferFormat.csv else "application/x-ndjson"
+    return StreamingResponse(export_lines(db, table, format), media_type=media_type)
+
+MIGRATE_BATCH_SIZE = 500
+
+def migrate_user_pict(db):
+    # Moves base64 pictures from user.user_pict into the blob store, one
+    # batch per transaction so it can be stopped and resumed.
+    last_id = 0
+    migrated = 0
+    while True:
+        users = db.query(User).options(undefer(User.user_pict)).filter(User.id > last_id, User.user_pict.isnot(None)).order_by(User.id).limit(MIGRATE_BATCH_SIZE).all()
+        if not users:
+            break
+        for user in users:
+            try:
+                contents = base64.b64decode(user.user_pict, validate=True)
+            except (binascii.Error, ValueError):
+                print(f"user {user.id}: invalid base64 picture, skipped")
+                continue
+            user.user_pict_key = blob_store.put(contents)
+            user.user_pict_type = user.user_pict_type or "image/jpeg"
+            user.user_pict = None
+            migrated += 1
+        last_id = users[-1].id
+        db.commit()
+        db.expunge_all()
+    print(f"migrated {migrated} user pictures")
+
+def hot_queries():
+    # The per-parent lookups behind the full recipe read, the cascades and the
+    # rating summary; each one has to be answered from an index.
+    return {
+        "bahan_master by recipe": select(BahanMaster).where(BahanMaster.id_resep_master == 1),
+        "bahan_detail by bahan_master": select(BahanDetail).where(BahanDetail.id_bahan_master == 1),
+        "cara_membuat by recipe": select(CaraMembuat).where(CaraMembuat.id_resep_master == 1),
+        "cara_membuat_detail by cara_membuat": select(CaraMembuatDetail).where(CaraMembuatDetail.id_cara_membuat == 1),
+        "testi_diskusi page by recipe": select(TestiDiskusi).where(TestiDiskusi.id_resep_master == 1).order_by(TestiDiskusi.id.desc()).limit(20),
+        "testi_diskusi by user": select(TestiDiskusi).where(TestiDiskusi.user_id == 1),
+        "reply_diskusi page by testi_diskusi": select(ReplyDiskusi).where(ReplyDiskusi.id_testi_diskusi == 1).order_by(ReplyDiskusi.id.desc()).limit(20),
+        "rating by recipe": select(Rating.rating).where(Rating.id_resep_master == 1),
+    }
+
+def search_hot_queries():
+    # PostgreSQL only: the SQLite fallback searches with LIKE.
+    return {
+        "search": search_statement("postgresql", "santan", ["gula"], ["kacang"]).limit(20),
+    }
+
+def seq_scans(db, stmt):
+    sql = str(stmt.compile(dialect=db.bind.dialect, compile_kwargs={"literal_binds": True}))
+    if db.bind.dialect.name == "sqlite":
+        details = [row[3] for row in db.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+        return [detail.split()[1] for detail in details if detail.startswith("SCAN ") and " USING " not in detail]
+    # With seq scans priced out the planner only falls back to one when no
+    # index can answer the query, so tiny test tables give a stable answer.
+    db.execute(text("SET LOCAL enable_seqscan = off"))
+    plan = db.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()[0]["Plan"]
+    db.rollback()
+    scans, nodes = [], [plan]
+    while nodes:
+        node = nodes.pop()
+        if node["Node Type"] == "Seq Scan":
+            scans.append(node["Relation Name"])
+        nodes.extend(node.get("Plans", []))
+    return scans
+
+def explain_hot_queries(db):
+    failed = 0
+    queries = hot_queries()
+    if db.bind.dialect.name == "postgresql":
+        queries.update(search_hot_queries())
+    for name, stmt in queries.items():
+        scans = seq_scans(db, stmt)
+        print(f"{'SEQ SCAN' if scans else 'ok':8} {name}" + (f" ({', '.join(scans)})" if scans else ""))
+        failed += bool(scans)
+    return 1 if failed else 0
+
+def create_schema(db):
+    # Same as `alembic upgrade head`: creates the tables on an empty database
+    # or brings an existing one up to date.
+    from alembic import command
+    from alembic.config import Config
+    command.upgrade(Config(os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini")), "head")
+
+async def with_async_db(fn, *args):
+    engine = init_async_engine(settings)
+    try:
+        async with AsyncSessionLocal() as db:
+            return await fn(db, *args)
+    finally:
+        await engine.dispose()
+
+def transfer_files(path):
+    # A directory of <table>.csv / <table>.ndjson files, imported in
+    # dependency order, or one NDJSON file holding several tables.
+    if not os.path.isdir(path):
+        return [(ndjson_rows, None, path)]
+    files = []
+    for name in TRANSFER_TABLES:
+        for format, parse in ((TransferFormat.csv, csv_rows), (TransferFormat.ndjson, ndjson_rows)):
+            file_path = os.path.join(path, f"{name}.{format.value}")
+            if os.path.exists(file_path):
+                files.append((parse, name, file_path))
+    return files
+
+async def import_files(db, path):
+    async def rows():
+        for parse, name, file_path in transfer_files(path):
+            async for row in parse(name, file_lines(file_path)):
+                yield row
+    return await import_rows(db, rows())
+
+def import_data_command(db, path):
+    started = time.perf_counter()
+    try:
+        counts = asyncio.run(with_async_db(import_files, path))
+    except (OSError, ValueError, csv.Error, DBAPIError) as error:
+        print(f"import failed, nothing was imported: {error}")
+        return 1
+    for name, count in counts.items():
+        print(f"{name}: {count} rows")
+    print(f"imported in {time.perf_counter() - started:.1f}s")
+
+async def export_files(db, path, format):
+    os.makedirs(path, exist_ok=True)
+    for name in TRANSFER_TABLES:
+        with open(os.path.join(path, f"{name}.{format.value}"), "wb") as f:
+            async for chunk in export_lines(db, name, format):
+                f.write(chunk if isinstance(chunk, bytes) else chunk.encode())
+        print(f"{name}.{format.value}")
+
+def export_data_command(db, path, format="csv"):
+    asyncio.run(with_async_db(export_files, path, TransferFormat(format)))
+
+COMMANDS = {
+    "create-schema": create_schema,
+    "rebuild-rating-summary": rebuild_rating_summary,
+    "migrate-user-pict": migrate_user_pict,
+    "explain-hot-queries": explain_hot_queries,
+    "import-data": import_data_command,
+    "export-data": export_data_command,
+}
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    parser.add_argument("args", nargs="*", help="import-data PATH, export-data DIRECTORY [csv|ndjson]")
+    args = parser.parse_args()
+    init_engine(settings)
+    db = SessionLocal()
+    try:
+        exit_code = COMMANDS[args.command](db, *args.args)
+    finally:
+        db.close()
+    raise SystemExit(exit_code)
@@ -0,0 +1,80 @@
+"""Measure cold start: importing app.py, and process start to first response.
+
+    python bench/bench_cold_start.py --runs 5 --target-seconds 3
+
+For each run, in a fresh process:
+
+    import          time to `import app` (no database connection is made)
+    first_request   time from starting uvicorn to the first successful
+                    GET /resep_master/?limit=1, which opens the first
+                    database connection
+
+Prints one JSON object with the median of each and exits with status 1 if
+the median first_request is above --target-seconds, so it can gate a deploy.
+Uses the database configured by the DB_* environment variables.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def time_import():
+    code = "import time; started = time.perf_counter(); import app; print(time.perf_counter() - started)"
+    return float(subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True, capture_output=True, text=True).stdout)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def time_first_request(timeout):
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"], cwd=ROOT)
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/resep_master/", params={"limit": 1}).status_code == 200:
+                    return time.perf_counter() - started
+            except httpx.TransportError:
+                pass
+            time.sleep(0.01)
+        raise SystemExit(f"no successful response within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--target-seconds", type=float, default=3.0)
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    imports = [time_import() for _ in range(args.runs)]
+    first_requests = [time_first_request(args.timeout) for _ in range(args.runs)]
+    result = {
+        "runs": args.runs,
+        "import_seconds": round(statistics.median(imports), 3),
+        "first_request_seconds": round(statistics.median(first_requests), 3),
+        "target_seconds": args.target_seconds,
+    }
+    print(json.dumps(result))
+    if result["first_request_seconds"] > args.target_seconds:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
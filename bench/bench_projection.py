@@ -0,0 +1,90 @@
+"""Compare full-entity and projected reads of the user table.
+
+    python bench/bench_projection.py --rows 100000
+
+Seeds the user table up to --rows, then reads it once per mode, each in a
+fresh process so peak RSS is not shared:
+
+    orm         db.query(User) with user_pict loaded (the old read_all_user)
+    projection  db.query(*USER_COLUMNS), the list endpoints' path
+
+Prints one JSON object per mode with rows/sec and peak RSS.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+SEED_BATCH_SIZE = 10000
+
+
+def seed(app, rows, legacy_pict_bytes):
+    db = app.SessionLocal()
+    try:
+        existing = db.query(app.User).count()
+        legacy_pict = "A" * legacy_pict_bytes if legacy_pict_bytes else None
+        for start in range(existing, rows, SEED_BATCH_SIZE):
+            batch = [
+                {
+                    "name": f"user {i}",
+                    "email": f"user{i}@example.com",
+                    "user_pict_key": uuid.uuid4().hex * 2,
+                    "user_pict_type": "image/jpeg",
+                    "user_pict": legacy_pict,
+                }
+                for i in range(start, min(start + SEED_BATCH_SIZE, rows))
+            ]
+            db.execute(app.User.__table__.insert(), batch)
+            db.commit()
+    finally:
+        db.close()
+
+
+def run(app, mode):
+    db = app.SessionLocal()
+    try:
+        started = time.perf_counter()
+        if mode == "orm":
+            users = db.query(app.User).options(app.undefer(app.User.user_pict)).all()
+        else:
+            users = db.query(*app.USER_COLUMNS).all()
+        items = [app.user_list_item(user) for user in users]
+        elapsed = time.perf_counter() - started
+    finally:
+        db.close()
+    return {
+        "mode": mode,
+        "rows": len(items),
+        "seconds": round(elapsed, 4),
+        "rows_per_sec": round(len(items) / elapsed),
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--legacy-pict-bytes", type=int, default=0, help="fill user.user_pict with this many bytes per row")
+    parser.add_argument("--mode", choices=["orm", "projection"])
+    args = parser.parse_args()
+
+    import app
+    app.init_engine(app.settings)
+
+    if args.mode:
+        print(json.dumps(run(app, args.mode)))
+        return
+
+    seed(app, args.rows, args.legacy_pict_bytes)
+    for mode in ("orm", "projection"):
+        subprocess.run([sys.executable, os.path.abspath(__file__), "--mode", mode], check=True)
+
+
+if __name__ == "__main__":
+    main()
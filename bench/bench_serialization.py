@@ -0,0 +1,82 @@
+"""Compare CPU per row of the read_all_* endpoints per JSON_RESPONSE mode.
+
+    python bench/datagen.py --recipes 10000
+    python bench/bench_serialization.py --requests 200 --limit 1000
+
+Runs each mode in a fresh process, calling every list endpoint in-process
+over httpx's ASGI transport (no network), --requests times with pages of
+--limit rows:
+
+    validated  rows validated against response_model (the default)
+    fast       rows sent as built by the precompiled serializer
+    orjson     as fast, encoded with orjson (skipped if it is not installed)
+
+Prints one JSON object per mode with the process CPU time per row in
+microseconds for each endpoint.
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+ENDPOINTS = [
+    "/resep_master/",
+    "/bahan_master/",
+    "/bahan_detail/",
+    "/cara_membuat/",
+    "/cara_membuat_detail/",
+    "/testi_diskusi/",
+    "/reply_diskusi/",
+    "/rating/",
+]
+
+
+async def run(args):
+    import app
+    app.init_engine(app.settings)
+    results = {}
+    async with app.app.router.lifespan_context(app.app):
+        async with httpx.AsyncClient(app=app.app, base_url="http://bench") as client:
+            for path in ENDPOINTS:
+                await client.get(path, params={"limit": args.limit})
+                rows = 0
+                started = time.process_time()
+                for _ in range(args.requests):
+                    response = await client.get(path, params={"limit": args.limit})
+                    rows += len(response.json())
+                cpu = time.process_time() - started
+                results[path] = {"rows": rows, "cpu_us_per_row": round(cpu / max(1, rows) * 1e6, 2)}
+    return {"mode": args.mode, "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--mode", choices=["validated", "fast", "orjson"])
+    args = parser.parse_args()
+
+    if args.mode:
+        os.environ["JSON_RESPONSE"] = args.mode
+        os.environ["CACHE_BACKEND"] = "none"
+        logging.getLogger("app").setLevel(logging.ERROR)
+        print(json.dumps(asyncio.run(run(args))))
+        return
+
+    modes = ["validated", "fast"] + (["orjson"] if importlib.util.find_spec("orjson") else [])
+    for mode in modes:
+        subprocess.run([sys.executable, os.path.abspath(__file__), "--mode", mode,
+                        "--requests", str(args.requests), "--limit", str(args.limit)], check=True)
+
+
+if __name__ == "__main__":
+    main()
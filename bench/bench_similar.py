@@ -0,0 +1,116 @@
+"""Benchmark the similar-recipes index against a plain Python set loop.
+
+    python bench/bench_similar.py --recipes 100000 --output similar.json
+
+Generates --recipes recipes of about --ingredients-per-recipe ingredients
+each, drawn from a --vocabulary sized Zipf-like distribution (a few
+ingredients like garam are in most recipes, most are rare), without touching
+the database. Then measures:
+
+    build        SimilarIndex.load() over every (recipe, ingredient) pair
+    jaccard      SimilarIndex.similar(..., metric=jaccard), top --limit
+    cosine       the same with cosine
+    naive        Jaccard against every recipe with Python sets (--naive-queries calls)
+    update       SimilarIndex.set_ingredients() for one changed recipe
+
+Prints one JSON object; "results" holds calls/sec and p50/p99 latency per
+measurement, comparable with bench/compare.py.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+def generate(rng, recipes, vocabulary, per_recipe):
+    names = [f"bahan {i}" for i in range(vocabulary)]
+    weights = [1 / (rank + 1) for rank in range(vocabulary)]
+    ingredients = {}
+    for recipe_id in range(1, recipes + 1):
+        count = max(1, rng.randint(per_recipe // 2, per_recipe * 3 // 2))
+        ingredients[recipe_id] = set(rng.choices(names, weights, k=count))
+    return names, weights, ingredients
+
+
+def naive_similar(ingredients, recipe_id, limit):
+    mine = ingredients[recipe_id]
+    scores = []
+    for other_id, theirs in ingredients.items():
+        overlap = len(mine & theirs)
+        if other_id != recipe_id and overlap:
+            scores.append((overlap / len(mine | theirs), other_id))
+    scores.sort(reverse=True)
+    return scores[:limit]
+
+
+def timed(fn, calls):
+    latencies = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return {
+        "calls": calls,
+        "calls_per_sec": round(calls / sum(latencies), 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 3),
+        "p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recipes", type=int, default=100000)
+    parser.add_argument("--vocabulary", type=int, default=2000)
+    parser.add_argument("--ingredients-per-recipe", type=int, default=10)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--naive-queries", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="also write the JSON result to this file")
+    args = parser.parse_args()
+
+    import app
+    rng = random.Random(args.seed)
+    names, weights, ingredients = generate(rng, args.recipes, args.vocabulary, args.ingredients_per_recipe)
+    pairs = [(recipe_id, name) for recipe_id, recipe in ingredients.items() for name in recipe]
+
+    index = app.SimilarIndex(rebuild_seconds=0)
+    started = time.perf_counter()
+    index.load(pairs)
+    build_seconds = time.perf_counter() - started
+
+    pick = lambda: rng.randint(1, args.recipes)
+    results = {
+        "jaccard": timed(lambda: index.similar(pick(), args.limit, app.SimilarMetric.jaccard), args.queries),
+        "cosine": timed(lambda: index.similar(pick(), args.limit, app.SimilarMetric.cosine), args.queries),
+        "naive": timed(lambda: naive_similar(ingredients, pick(), args.limit), args.naive_queries),
+    }
+
+    def update():
+        recipe_id = pick()
+        ingredients[recipe_id] = set(rng.choices(names, weights, k=args.ingredients_per_recipe))
+        index.set_ingredients({recipe_id: ingredients[recipe_id]})
+    results["update"] = timed(update, args.queries)
+
+    result = {
+        "benchmark": "similar",
+        "recipes": args.recipes,
+        "vocabulary": len(index.vocabulary),
+        "pairs": len(pairs),
+        "build_seconds": round(build_seconds, 3),
+        "index_mb": round(index.bits.nbytes / 1024 / 1024, 1),
+        "results": results,
+    }
+    print(json.dumps(result))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""How many concurrent event subscribers one worker sustains.
+
+    uvicorn app:app --workers 1 &
+    python bench/bench_subscribers.py --url http://127.0.0.1:8000 --subscribers 100 500 1000 2000
+
+For each --subscribers count, opens that many GET /resep_master/{id}/events
+streams (spread over --recipes recipes), then POSTs --rate ratings per
+second to those recipes for --duration seconds and records when every
+subscriber receives each rating. Per count it reports how many subscribers
+connected, the share of expected deliveries that arrived, deliveries per
+second, delivery latency (POST sent -> event received) p50/p99 and how many
+subscribers were dropped for falling behind (overflow).
+
+The client is one Python process too; past a few thousand deliveries per
+second run it from another machine, or several copies with fewer
+subscribers each, so the numbers measure the server and not the client.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+
+class Subscriber:
+    def __init__(self, resep_id):
+        self.resep_id = resep_id
+        self.connected = asyncio.Event()
+        self.received = {}
+        self.overflowed = False
+        self.error = None
+
+    async def run(self, client):
+        try:
+            async with client.stream("GET", f"/resep_master/{self.resep_id}/events") as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if line.startswith(": subscribed"):
+                        self.connected.set()
+                    elif line.startswith("data: "):
+                        event = json.loads(line[6:])
+                        if event["type"] == "overflow":
+                            self.overflowed = True
+                        elif event["type"] == "rating" and event["action"] == "created":
+                            self.received[event["data"]["id"]] = time.perf_counter()
+        except httpx.HTTPError as error:
+            self.error = error
+        finally:
+            self.connected.set()
+
+
+async def publish(client, recipes, rate, duration):
+    # rating id -> (recipe, time the POST was sent)
+    sent = {}
+    deadline = time.perf_counter() + duration
+    i = 0
+    while time.perf_counter() < deadline:
+        resep_id = recipes[i % len(recipes)]
+        started = time.perf_counter()
+        response = await client.post("/rating/", params={"resep_master_id": resep_id, "rating_value": 5})
+        if response.status_code == 201:
+            sent[response.json()["id"]] = (resep_id, started)
+        i += 1
+        await asyncio.sleep(max(0, started + 1 / rate - time.perf_counter()))
+    return sent
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else None
+
+
+async def run_level(args, recipes, count):
+    limits = httpx.Limits(max_connections=count + 10, max_keepalive_connections=count + 10)
+    timeout = httpx.Timeout(30, read=None)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=timeout) as client:
+        subscribers = [Subscriber(recipes[i % len(recipes)]) for i in range(count)]
+        tasks = [asyncio.create_task(subscriber.run(client)) for subscriber in subscribers]
+        try:
+            await asyncio.wait_for(asyncio.gather(*[subscriber.connected.wait() for subscriber in subscribers]), args.connect_timeout)
+        except asyncio.TimeoutError:
+            pass
+        connected = [subscriber for subscriber in subscribers if subscriber.connected.is_set() and subscriber.error is None]
+        started = time.perf_counter()
+        sent = await publish(client, recipes, args.rate, args.duration)
+        await asyncio.sleep(args.grace)
+        elapsed = time.perf_counter() - started
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    expected = 0
+    latencies = []
+    for subscriber in connected:
+        for rating_id, (resep_id, sent_at) in sent.items():
+            if resep_id == subscriber.resep_id:
+                expected += 1
+                if rating_id in subscriber.received:
+                    latencies.append(subscriber.received[rating_id] - sent_at)
+    latencies.sort()
+    return {
+        "subscribers": count,
+        "connected": len(connected),
+        "events": len(sent),
+        "expected_deliveries": expected,
+        "delivered": len(latencies),
+        "delivered_ratio": round(len(latencies) / expected, 4) if expected else None,
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+        "overflowed": sum(subscriber.overflowed for subscriber in subscribers),
+    }
+
+
+async def main(args):
+    async with httpx.AsyncClient(base_url=args.url, timeout=30) as client:
+        recipes = [(await client.post("/resep_master/", params={"name": f"bench events {i}"})).json()["id"] for i in range(args.recipes)]
+    results = {}
+    for count in args.subscribers:
+        results[f"subscribers_{count}"] = await run_level(args, recipes, count)
+        print(json.dumps(results[f"subscribers_{count}"]), flush=True)
+    result = {
+        "benchmark": "subscribers",
+        "url": args.url,
+        "recipes": args.recipes,
+        "rate": args.rate,
+        "duration": args.duration,
+        "results": results,
+    }
+    print(json.dumps(result))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--subscribers", type=int, nargs="+", default=[100, 500, 1000, 2000])
+    parser.add_argument("--recipes", type=int, default=1, help="recipes the subscribers are spread over")
+    parser.add_argument("--rate", type=float, default=20, help="ratings posted per second")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--grace", type=float, default=2, help="seconds to wait for the last events")
+    parser.add_argument("--connect-timeout", type=float, default=30)
+    parser.add_argument("--output", help="also write the JSON result to this file")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,47 @@
+"""Compare two benchmark results written with --output.
+
+    python bench/compare.py before.json after.json --threshold 10
+
+Works with the microbench and load_test output: for every entry under
+"results" present in both files it prints throughput and p99 side by side
+with the change in percent, and exits with status 1 if any throughput
+dropped, or p99 rose, by more than --threshold percent.
+"""
+import argparse
+import json
+
+THROUGHPUT_KEYS = ("calls_per_sec", "throughput_rps")
+
+
+def change(before, after):
+    return (after - before) / before * 100 if before else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=10, help="percent")
+    args = parser.parse_args()
+    with open(args.before) as f:
+        before = json.load(f)["results"]
+    with open(args.after) as f:
+        after = json.load(f)["results"]
+
+    regressions = []
+    print(f"{'name':28} {'throughput':>22} {'change':>8} {'p99 ms':>20} {'change':>8}")
+    for name in sorted(set(before) & set(after)):
+        key = next(key for key in THROUGHPUT_KEYS if key in before[name])
+        throughput = change(before[name][key], after[name][key])
+        p99 = change(before[name]["p99_ms"] or 0, after[name]["p99_ms"] or 0)
+        print(f"{name:28} {before[name][key]:>10} -> {after[name][key]:<9} {throughput:>+7.1f}% "
+              f"{before[name]['p99_ms']:>8} -> {after[name]['p99_ms']:<9} {p99:>+7.1f}%")
+        if throughput < -args.threshold or p99 > args.threshold:
+            regressions.append(name)
+    if regressions:
+        print(f"regressed by more than {args.threshold}%: {', '.join(regressions)}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""Fill the schema with realistic volumes of generated data.
+
+    python app.py create-schema
+    python bench/datagen.py --recipes 100000 --seed 1
+
+Appends --recipes recipes, each with ingredient groups and ingredients,
+steps, ratings, testimonials and replies, plus --users users, in batches of
+plain multi-row INSERTs with precomputed ids. Counts per recipe vary
+randomly around the --*-per-* averages; with the defaults 100k recipes come
+to about 2M ratings and 1.5M replies. The same --seed gives the same data.
+Afterwards rating_summary and testi_diskusi.reply_count are rebuilt.
+
+Prints one JSON object with the rows inserted per table and the time taken.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+from sqlalchemy import func, text
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+INGREDIENTS = [
+    "santan", "santan kental", "gula merah", "gula pasir", "garam", "bawang merah", "bawang putih", "cabai merah",
+    "cabai rawit", "kunyit", "jahe", "lengkuas", "serai", "daun salam", "daun jeruk", "kemiri", "ketumbar",
+    "merica", "kecap manis", "kecap asin", "minyak goreng", "telur", "ayam", "daging sapi", "udang", "tahu",
+    "tempe", "kentang", "wortel", "kol", "tepung terigu", "tepung beras", "tepung tapioka", "pisang", "kelapa parut",
+    "pandan", "nangka", "ubi", "beras", "mie", "kacang tanah", "kacang panjang", "tomat", "jeruk nipis", "asam jawa",
+]
+DISHES = ["rendang", "opor", "soto", "gulai", "sate", "nasi goreng", "mie goreng", "kolak", "klepon", "bakwan",
+          "pepes", "sayur asem", "gado-gado", "lodeh", "semur", "bubur", "martabak", "perkedel", "sambal", "es campur"]
+STYLES = ["padang", "betawi", "jawa", "sunda", "bali", "medan", "spesial", "rumahan", "pedas", "manis", "kampung"]
+STEPS = ["haluskan bumbu", "tumis bumbu hingga harum", "masukkan santan, aduk rata", "masak dengan api kecil",
+         "tambahkan garam dan gula", "rebus hingga empuk", "goreng hingga kecoklatan", "kukus selama 20 menit",
+         "aduk terus agar santan tidak pecah", "angkat dan sajikan", "bungkus dengan daun pisang", "panggang sebentar"]
+COMMENTS = ["enak banget", "sudah dicoba, mantap", "terlalu manis buat saya", "resep andalan keluarga",
+            "santannya pas", "kurang pedas", "anak-anak suka", "terima kasih resepnya", "gagal, nanti coba lagi"]
+
+
+def varied(rng, average):
+    # Counts per parent vary between 0 and twice the average.
+    return rng.randint(0, 2 * average) if average else 0
+
+
+def next_id(db, model):
+    return (db.query(func.max(model.id)).scalar() or 0) + 1
+
+
+class Inserter:
+    # Buffers rows per table and writes them in batches. Every table is
+    # flushed together, in the order rows were first added (parents before
+    # children), so foreign keys always point at rows already written.
+    def __init__(self, db, batch_size):
+        self.db = db
+        self.batch_size = batch_size
+        self.pending = {}
+        self.counts = {}
+
+    def add(self, model, row):
+        rows = self.pending.setdefault(model, [])
+        rows.append(row)
+        if len(rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        for model, rows in self.pending.items():
+            if rows:
+                self.db.execute(model.__table__.insert(), rows)
+                self.counts[model.__tablename__] = self.counts.get(model.__tablename__, 0) + len(rows)
+                rows.clear()
+        self.db.commit()
+
+
+def generate(app, args):
+    rng = random.Random(args.seed)
+    db = app.SessionLocal()
+    ids = {model: next_id(db, model) for model in (
+        app.User, app.ResepMaster, app.BahanMaster, app.BahanDetail, app.CaraMembuat,
+        app.CaraMembuatDetail, app.TestiDiskusi, app.ReplyDiskusi, app.Rating,
+    )}
+
+    def take(model):
+        ids[model] += 1
+        return ids[model] - 1
+
+    inserter = Inserter(db, args.batch_size)
+    first_user = ids[app.User]
+    for i in range(args.users):
+        inserter.add(app.User, {"id": take(app.User), "name": f"user {first_user + i}", "email": f"user{first_user + i}@example.com"})
+    inserter.flush()
+    user_ids = range(first_user, ids[app.User])
+
+    for _ in range(args.recipes):
+        resep_id = take(app.ResepMaster)
+        inserter.add(app.ResepMaster, {"id": resep_id, "name": f"{rng.choice(DISHES)} {rng.choice(STYLES)}"})
+        for _ in range(max(1, varied(rng, args.bahan_groups_per_recipe))):
+            bahan_id = take(app.BahanMaster)
+            inserter.add(app.BahanMaster, {"id": bahan_id, "id_resep_master": resep_id, "porsi": rng.randint(1, 8)})
+            for name in rng.sample(INGREDIENTS, min(len(INGREDIENTS), max(1, varied(rng, args.ingredients_per_group)))):
+                inserter.add(app.BahanDetail, {"id": take(app.BahanDetail), "id_bahan_master": bahan_id, "name": name})
+        cara_id = take(app.CaraMembuat)
+        inserter.add(app.CaraMembuat, {"id": cara_id, "id_resep_master": resep_id, "lama_waktu": rng.randint(5, 180), "tips": rng.choice(STEPS)})
+        for _ in range(max(1, varied(rng, args.steps_per_recipe))):
+            inserter.add(app.CaraMembuatDetail, {"id": take(app.CaraMembuatDetail), "id_cara_membuat": cara_id, "cara": rng.choice(STEPS)})
+        for _ in range(varied(rng, args.ratings_per_recipe)):
+            inserter.add(app.Rating, {"id": take(app.Rating), "id_resep_master": resep_id, "rating": rng.choice([1, 2, 3, 4, 4, 5, 5, 5])})
+        for _ in range(varied(rng, args.testimonials_per_recipe)):
+            testi_id = take(app.TestiDiskusi)
+            inserter.add(app.TestiDiskusi, {"id": testi_id, "id_resep_master": resep_id, "user_id": rng.choice(user_ids),
+                                            "foto": "", "testimonial": rng.choice(COMMENTS), "reply_count": 0})
+            for _ in range(varied(rng, args.replies_per_testimonial)):
+                inserter.add(app.ReplyDiskusi, {"id": take(app.ReplyDiskusi), "id_testi_diskusi": testi_id,
+                                                "user_id": rng.choice(user_ids), "testimonial": rng.choice(COMMENTS)})
+    inserter.flush()
+
+    app.rebuild_rating_summary(db)
+    db.execute(text(
+        "UPDATE testi_diskusi SET reply_count = "
+        "(SELECT count(*) FROM reply_diskusi WHERE reply_diskusi.id_testi_diskusi = testi_diskusi.id)"
+    ))
+    db.commit()
+    if db.bind.dialect.name == "postgresql":
+        # Explicit ids leave the sequences behind; move them past the data.
+        for model in ids:
+            table = model.__tablename__
+            db.execute(text(f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), (SELECT max(id) FROM \"{table}\"))"))
+        db.commit()
+        db.execute(text("ANALYZE"))
+    db.close()
+    return inserter.counts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recipes", type=int, default=100000)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--bahan-groups-per-recipe", type=int, default=2)
+    parser.add_argument("--ingredients-per-group", type=int, default=5)
+    parser.add_argument("--steps-per-recipe", type=int, default=6)
+    parser.add_argument("--ratings-per-recipe", type=int, default=20)
+    parser.add_argument("--testimonials-per-recipe", type=int, default=3)
+    parser.add_argument("--replies-per-testimonial", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="also write the JSON result to this file")
+    args = parser.parse_args()
+
+    import app
+    app.init_engine(app.settings)
+
+    started = time.perf_counter()
+    counts = generate(app, args)
+    result = {"benchmark": "datagen", "seed": args.seed, "rows": counts, "seconds": round(time.perf_counter() - started, 2)}
+    print(json.dumps(result))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
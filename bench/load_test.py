@@ -0,0 +1,146 @@
+"""Concurrent load test against a running server.
+
+    uvicorn app:app --workers 1 &
+    python bench/load_test.py --url http://127.0.0.1:8000 --concurrency 64 --duration 30
+
+Uses the recipes already in the database (bench/datagen.py) or, if there
+are none, seeds --recipes through the API. Then runs --concurrency clients
+for --duration seconds against a read-heavy recipe mix with some rating
+writes; every --burst-interval seconds --burst-size extra writes (ratings
+and testimonials) arrive at once on top of it. Prints throughput and latency
+percentiles, overall and per action, as JSON (see bench/compare.py).
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import httpx
+
+MIX = [
+    ("read_resep_master", 35),
+    ("read_resep_full", 20),
+    ("read_all_resep_master", 10),
+    ("read_testi_diskusi_feed", 10),
+    ("search", 5),
+    ("create_rating", 15),
+    ("create_testi_diskusi", 5),
+]
+BURST_MIX = [
+    ("create_rating", 3),
+    ("create_testi_diskusi", 1),
+]
+
+
+async def existing_recipes(client, limit=1000):
+    return [resep["id"] for resep in (await client.get("/resep_master/", params={"limit": limit})).json()]
+
+
+async def seed(client, recipes):
+    ids = []
+    for i in range(recipes):
+        resep = (await client.post("/resep_master/", params={"name": f"resep {i}"})).json()
+        bahan = (await client.post("/bahan_master/", params={"resep_master_id": resep["id"], "porsi": 2})).json()
+        for name in ("santan", "gula", "garam"):
+            await client.post("/bahan_detail/", params={"bahan_master_id": bahan["id"], "name": name})
+        ids.append(resep["id"])
+    return ids
+
+
+async def request(client, action, ids):
+    resep_id = random.choice(ids)
+    if action == "read_resep_master":
+        return await client.get(f"/resep_master/{resep_id}")
+    if action == "read_resep_full":
+        return await client.get(f"/resep_master/{resep_id}/full")
+    if action == "read_all_resep_master":
+        return await client.get("/resep_master/", params={"limit": 50})
+    if action == "read_testi_diskusi_feed":
+        return await client.get(f"/resep_master/{resep_id}/testi_diskusi", params={"limit": 20})
+    if action == "search":
+        return await client.get("/resep_master/search", params={"q": random.choice(["santan", "ayam", "gula"]), "limit": 20})
+    if action == "create_testi_diskusi":
+        return await client.post("/testi_diskusi/", params={"resep_master_id": resep_id, "user_id": 1, "foto": "", "testimonial": "enak"})
+    return await client.post("/rating/", params={"resep_master_id": resep_id, "rating_value": random.randint(1, 5)})
+
+
+async def timed(client, action, ids, latencies, errors):
+    started = time.perf_counter()
+    try:
+        response = await request(client, action, ids)
+        ok = response.status_code < 400
+    except httpx.HTTPError:
+        ok = False
+    if ok:
+        latencies.setdefault(action, []).append(time.perf_counter() - started)
+    else:
+        errors.append(action)
+
+
+async def worker(client, ids, deadline, latencies, errors):
+    actions, weights = zip(*MIX)
+    while time.perf_counter() < deadline:
+        await timed(client, random.choices(actions, weights)[0], ids, latencies, errors)
+
+
+async def bursts(client, ids, deadline, latencies, errors, size, interval):
+    actions, weights = zip(*BURST_MIX)
+    while interval and time.perf_counter() + interval < deadline:
+        await asyncio.sleep(interval)
+        await asyncio.gather(*[timed(client, action, ids, latencies, errors) for action in random.choices(actions, weights, k=size)])
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else None
+
+
+def summary(latencies, elapsed):
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+    }
+
+
+async def main(args):
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30) as client:
+        ids = await existing_recipes(client) or await seed(client, args.recipes)
+        if not (await client.get("/users/1")).is_success:
+            await client.post("/users/", params={"name": "bench", "email": "bench@example.com"})
+        latencies, errors = {}, []
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(
+            bursts(client, ids, deadline, latencies, errors, args.burst_size, args.burst_interval),
+            *[worker(client, ids, deadline, latencies, errors) for _ in range(args.concurrency)],
+        )
+        elapsed = time.perf_counter() - started
+    result = {
+        "benchmark": "load_test",
+        "url": args.url,
+        "concurrency": args.concurrency,
+        "duration": round(elapsed, 2),
+        "errors": len(errors),
+        **summary([value for values in latencies.values() for value in values], elapsed),
+        "results": {action: summary(values, elapsed) for action, values in sorted(latencies.items())},
+    }
+    print(json.dumps(result))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--recipes", type=int, default=50, help="recipes to seed if the database has none")
+    parser.add_argument("--burst-size", type=int, default=200)
+    parser.add_argument("--burst-interval", type=float, default=5, help="seconds between write bursts, 0 for none")
+    parser.add_argument("--output", help="also write the JSON result to this file")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,157 @@
+"""Per-handler microbenchmarks, run in-process through the ASGI app.
+
+    python bench/datagen.py --recipes 10000
+    python bench/microbench.py --iterations 500 --output micro.json
+
+Calls each handler --iterations times in a row (after --warmup calls) over
+httpx's ASGI transport, so the numbers are handler + serialization +
+database time with no network or server in between. Ids are drawn from the
+data already in the database. The read cache is off unless --cache is given,
+so reads measure the database path. Write benchmarks add rows.
+
+Prints one JSON object: per benchmark the calls/sec, mean/p50/p99 latency
+in ms and the average number of queries per call. Compare two runs with
+bench/compare.py.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+def sample_ids(app, model, count, rng):
+    db = app.SessionLocal()
+    try:
+        ids = [row[0] for row in db.query(model.id).order_by(model.id.desc()).limit(count * 10)]
+    finally:
+        db.close()
+    if not ids:
+        raise SystemExit(f"no {model.__tablename__} rows, run bench/datagen.py first")
+    return rng.sample(ids, min(count, len(ids)))
+
+
+def benchmarks(ids, rng):
+    # name -> function returning (method, path, keyword arguments for httpx)
+    pick = rng.choice
+    return {
+        "read_resep_master": lambda: ("GET", f"/resep_master/{pick(ids['resep'])}", {}),
+        "read_resep_full": lambda: ("GET", f"/resep_master/{pick(ids['resep'])}/full", {}),
+        "read_all_resep_master": lambda: ("GET", "/resep_master/", {"params": {"limit": 50, "after": pick(ids['resep'])}}),
+        "read_top_rated": lambda: ("GET", "/resep_master/top_rated", {"params": {"limit": 10}}),
+        "search": lambda: ("GET", "/resep_master/search", {"params": {"q": pick(["santan", "ayam", "gula merah", "rendang"]), "limit": 20}}),
+        "search_include_exclude": lambda: ("GET", "/resep_master/search", {"params": {"include": "santan", "exclude": "kacang tanah", "limit": 20}}),
+        "read_bahan_master": lambda: ("GET", f"/bahan_master/{pick(ids['bahan_master'])}", {}),
+        "read_bahan_detail": lambda: ("GET", f"/bahan_detail/{pick(ids['bahan_detail'])}", {}),
+        "read_all_bahan_detail": lambda: ("GET", "/bahan_detail/", {"params": {"limit": 100, "after": pick(ids['bahan_detail'])}}),
+        "read_cara_membuat_detail": lambda: ("GET", f"/cara_membuat_detail/{pick(ids['cara_membuat_detail'])}", {}),
+        "read_testi_diskusi_feed": lambda: ("GET", f"/resep_master/{pick(ids['resep'])}/testi_diskusi", {"params": {"limit": 20}}),
+        "read_reply_diskusi_feed": lambda: ("GET", f"/testi_diskusi/{pick(ids['testi'])}/reply_diskusi", {"params": {"limit": 20}}),
+        "read_user": lambda: ("GET", f"/users/{pick(ids['user'])}", {}),
+        "read_all_user": lambda: ("GET", "/users", {"params": {"limit": 100}}),
+        "read_rating": lambda: ("GET", f"/rating/{pick(ids['rating'])}", {}),
+        "create_rating": lambda: ("POST", "/rating/", {"params": {"resep_master_id": pick(ids['resep']), "rating_value": rng.randint(1, 5)}}),
+        "create_rating_bulk": lambda: ("POST", "/rating/bulk", {"json": [
+            {"id_resep_master": pick(ids['resep']), "rating": rng.randint(1, 5)} for _ in range(100)
+        ]}),
+        "create_testi_diskusi": lambda: ("POST", "/testi_diskusi/", {"params": {
+            "resep_master_id": pick(ids['resep']), "user_id": pick(ids['user']), "foto": "", "testimonial": "enak"
+        }}),
+        "create_reply_diskusi": lambda: ("POST", "/reply_diskusi/", {"params": {
+            "testi_diskusi_id": pick(ids['testi']), "user_id": pick(ids['user']), "testimonial": "setuju"
+        }}),
+        "create_resep_full": lambda: ("POST", "/resep_master/full", {"json": {
+            "name": "bench resep",
+            "bahan_master": [{"porsi": 2, "bahan_detail": ["santan", "gula merah", "garam", "pandan"]}],
+            "cara_membuat": [{"lama_waktu": 30, "tips": "aduk terus", "cara_membuat_detail": ["rebus", "aduk", "sajikan"]}],
+        }}),
+    }
+
+
+def query_totals(app):
+    routes = app.REQUEST_METRICS.routes.values()
+    return sum(route.queries.sum for route in routes), sum(route.queries.count for route in routes)
+
+
+async def run_one(app, client, make_request, iterations, warmup):
+    for _ in range(warmup):
+        method, path, kwargs = make_request()
+        await client.request(method, path, **kwargs)
+    queries_before, requests_before = query_totals(app)
+    latencies = []
+    errors = 0
+    for _ in range(iterations):
+        method, path, kwargs = make_request()
+        started = time.perf_counter()
+        response = await client.request(method, path, **kwargs)
+        latencies.append(time.perf_counter() - started)
+        errors += response.status_code >= 400
+    queries_after, requests_after = query_totals(app)
+    latencies.sort()
+    return {
+        "calls": iterations,
+        "errors": errors,
+        "calls_per_sec": round(iterations / sum(latencies), 1),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 3),
+        "p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 3),
+        "queries_per_call": round((queries_after - queries_before) / max(1, requests_after - requests_before), 2),
+    }
+
+
+async def main(args):
+    import app
+    app.init_engine(app.settings)
+    rng = random.Random(args.seed)
+    ids = {
+        "resep": sample_ids(app, app.ResepMaster, 1000, rng),
+        "bahan_master": sample_ids(app, app.BahanMaster, 1000, rng),
+        "bahan_detail": sample_ids(app, app.BahanDetail, 1000, rng),
+        "cara_membuat_detail": sample_ids(app, app.CaraMembuatDetail, 1000, rng),
+        "testi": sample_ids(app, app.TestiDiskusi, 1000, rng),
+        "rating": sample_ids(app, app.Rating, 1000, rng),
+        "user": sample_ids(app, app.User, 1000, rng),
+    }
+    selected = benchmarks(ids, rng)
+    if args.only:
+        selected = {name: selected[name] for name in args.only}
+    results = {}
+    async with app.app.router.lifespan_context(app.app):
+        async with httpx.AsyncClient(app=app.app, base_url="http://bench") as client:
+            for name, make_request in selected.items():
+                results[name] = await run_one(app, client, make_request, args.iterations, args.warmup)
+                print(f"{name:28} {results[name]['calls_per_sec']:>10} calls/s  p99 {results[name]['p99_ms']} ms", file=sys.stderr)
+    return {
+        "benchmark": "microbench",
+        "database": app.database_url(app.settings).get_backend_name(),
+        "cache": app.settings.cache_backend,
+        "iterations": args.iterations,
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--cache", action="store_true", help="keep the read cache on")
+    parser.add_argument("--only", nargs="+", help="run only these benchmarks")
+    parser.add_argument("--output", help="also write the JSON result to this file")
+    args = parser.parse_args()
+    if not args.cache:
+        os.environ["CACHE_BACKEND"] = "none"
+    # Bulk writes trip the slow request log on every call; keep it quiet.
+    logging.getLogger("app").setLevel(logging.ERROR)
+    result = asyncio.run(main(args))
+    print(json.dumps(result))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
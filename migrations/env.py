@@ -0,0 +1,33 @@
+import os
+import sys
+
+from alembic import context
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import Base, database_url, settings
+
+target_metadata = Base.metadata
+
+
+def run_migrations_offline():
+    url = database_url(settings)
+    context.configure(url=url, target_metadata=target_metadata, literal_binds=True, render_as_batch=url.get_backend_name() == "sqlite")
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    connectable = create_engine(database_url(settings), poolclass=NullPool)
+    with connectable.connect() as connection:
+        context.configure(connection=connection, target_metadata=target_metadata, render_as_batch=connection.dialect.name == "sqlite")
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,83 @@
+"""baseline: the tables as the original create_all built them
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+
+Databases created by the old import-time create_all already have these
+tables; mark them with `alembic stamp 0001` and then `alembic upgrade head`.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'resep_master',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('name', sa.String(255)),
+    )
+    op.create_table(
+        'user',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('user_pict', sa.Text()),
+        sa.Column('name', sa.String(255)),
+        sa.Column('email', sa.String(255)),
+    )
+    op.create_table(
+        'bahan_master',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('id_resep_master', sa.Integer(), sa.ForeignKey('resep_master.id')),
+        sa.Column('porsi', sa.Integer()),
+    )
+    op.create_table(
+        'bahan_detail',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('id_bahan_master', sa.Integer(), sa.ForeignKey('bahan_master.id')),
+        sa.Column('name', sa.String(255)),
+    )
+    op.create_table(
+        'cara_membuat',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('id_resep_master', sa.Integer(), sa.ForeignKey('resep_master.id')),
+        sa.Column('lama_waktu', sa.Integer()),
+        sa.Column('tips', sa.String(255)),
+    )
+    op.create_table(
+        'cara_membuat_detail',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('id_cara_membuat', sa.Integer(), sa.ForeignKey('cara_membuat.id')),
+        sa.Column('cara', sa.String(255)),
+    )
+    op.create_table(
+        'testi_diskusi',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('id_resep_master', sa.Integer(), sa.ForeignKey('resep_master.id')),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('user.id')),
+        sa.Column('foto', sa.String(255)),
+        sa.Column('testimonial', sa.String(255)),
+    )
+    op.create_table(
+        'reply_diskusi',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('id_testi_diskusi', sa.Integer(), sa.ForeignKey('testi_diskusi.id')),
+        sa.Column('user_id', sa.Integer()),
+        sa.Column('testimonial', sa.String(255)),
+    )
+    op.create_table(
+        'rating',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('id_resep_master', sa.Integer(), sa.ForeignKey('resep_master.id')),
+        sa.Column('rating', sa.Float()),
+    )
+
+
+def downgrade():
+    for table in ('rating', 'reply_diskusi', 'testi_diskusi', 'cara_membuat_detail', 'cara_membuat', 'bahan_detail', 'bahan_master', 'user', 'resep_master'):
+        op.drop_table(table)
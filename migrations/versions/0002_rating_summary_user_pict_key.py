@@ -0,0 +1,62 @@
+"""rating_summary table and user picture blob columns
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+
+Both used to be created outside of migrations (create_all and the
+migrate-user-pict command), so each step is skipped if it already exists.
+A newly created rating_summary is filled from the existing ratings here.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    user_columns = {column['name'] for column in inspector.get_columns('user')}
+    with op.batch_alter_table('user') as batch_op:
+        if 'user_pict_key' not in user_columns:
+            batch_op.add_column(sa.Column('user_pict_key', sa.String(64)))
+        if 'user_pict_type' not in user_columns:
+            batch_op.add_column(sa.Column('user_pict_type', sa.String(100)))
+    if not inspector.has_table('rating_summary'):
+        op.create_table(
+            'rating_summary',
+            sa.Column('id_resep_master', sa.Integer(), sa.ForeignKey('resep_master.id'), primary_key=True),
+            sa.Column('count', sa.Integer(), nullable=False),
+            sa.Column('total', sa.Float(), nullable=False),
+            sa.Column('average', sa.Float()),
+            sa.Column('star_1', sa.Integer(), nullable=False),
+            sa.Column('star_2', sa.Integer(), nullable=False),
+            sa.Column('star_3', sa.Integer(), nullable=False),
+            sa.Column('star_4', sa.Integer(), nullable=False),
+            sa.Column('star_5', sa.Integer(), nullable=False),
+        )
+        op.create_index('ix_rating_summary_average', 'rating_summary', ['average'])
+        # Same buckets as app.rating_bucket.
+        op.execute(
+            "INSERT INTO rating_summary (id_resep_master, count, total, average, star_1, star_2, star_3, star_4, star_5) "
+            "SELECT id_resep_master, count(rating), sum(rating), avg(rating), "
+            "sum(CASE WHEN rating < 1.5 THEN 1 ELSE 0 END), "
+            "sum(CASE WHEN rating >= 1.5 AND rating < 2.5 THEN 1 ELSE 0 END), "
+            "sum(CASE WHEN rating >= 2.5 AND rating < 3.5 THEN 1 ELSE 0 END), "
+            "sum(CASE WHEN rating >= 3.5 AND rating < 4.5 THEN 1 ELSE 0 END), "
+            "sum(CASE WHEN rating >= 4.5 THEN 1 ELSE 0 END) "
+            "FROM rating WHERE id_resep_master IS NOT NULL AND rating IS NOT NULL "
+            "GROUP BY id_resep_master"
+        )
+
+
+def downgrade():
+    op.drop_index('ix_rating_summary_average', table_name='rating_summary')
+    op.drop_table('rating_summary')
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.drop_column('user_pict_type')
+        batch_op.drop_column('user_pict_key')
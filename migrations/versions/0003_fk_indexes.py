@@ -0,0 +1,39 @@
+"""indexes on the foreign keys used by per-recipe reads and cascades
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+
+On PostgreSQL the indexes are built CONCURRENTLY so writes are not blocked
+while they build on a live database.
+"""
+from alembic import op
+
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_bahan_master_id_resep_master', 'bahan_master', ['id_resep_master']),
+    ('ix_bahan_detail_id_bahan_master', 'bahan_detail', ['id_bahan_master']),
+    ('ix_cara_membuat_id_resep_master', 'cara_membuat', ['id_resep_master']),
+    ('ix_cara_membuat_detail_id_cara_membuat', 'cara_membuat_detail', ['id_cara_membuat']),
+    ('ix_testi_diskusi_id_resep_master_id', 'testi_diskusi', ['id_resep_master', 'id']),
+    ('ix_testi_diskusi_user_id', 'testi_diskusi', ['user_id']),
+    ('ix_reply_diskusi_id_testi_diskusi_id', 'reply_diskusi', ['id_testi_diskusi', 'id']),
+    ('ix_rating_id_resep_master_rating', 'rating', ['id_resep_master', 'rating']),
+]
+
+
+def upgrade():
+    concurrently = op.get_context().dialect.name == 'postgresql'
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=concurrently, if_not_exists=True)
+
+
+def downgrade():
+    for name, table, _ in INDEXES:
+        op.drop_index(name, table_name=table)
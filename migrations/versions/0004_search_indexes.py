@@ -0,0 +1,40 @@
+"""GIN indexes for recipe search
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+
+Expression indexes on to_tsvector('simple', coalesce(column, '')): PostgreSQL
+keeps them current on every write, and search_vector() in app.py builds the
+same expression so the search queries use them. Nothing to do on SQLite,
+where search falls back to LIKE.
+"""
+from alembic import op
+
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_resep_master_name_search', 'resep_master', 'name'),
+    ('ix_bahan_detail_name_search', 'bahan_detail', 'name'),
+    ('ix_cara_membuat_tips_search', 'cara_membuat', 'tips'),
+    ('ix_cara_membuat_detail_cara_search', 'cara_membuat_detail', 'cara'),
+]
+
+
+def upgrade():
+    if op.get_context().dialect.name != 'postgresql':
+        return
+    with op.get_context().autocommit_block():
+        for name, table, column in INDEXES:
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} USING gin (to_tsvector('simple'::regconfig, coalesce({column}, '')))")
+
+
+def downgrade():
+    if op.get_context().dialect.name != 'postgresql':
+        return
+    for name, _, _ in INDEXES:
+        op.execute(f"DROP INDEX IF EXISTS {name}")
@@ -0,0 +1,31 @@
+"""testi_diskusi.reply_count
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17
+
+Denormalized count of reply_diskusi rows per testimonial, kept up to date by
+the reply handlers; filled from the existing replies here.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('testi_diskusi') as batch_op:
+        batch_op.add_column(sa.Column('reply_count', sa.Integer(), nullable=False, server_default='0'))
+    op.execute(
+        "UPDATE testi_diskusi SET reply_count = "
+        "(SELECT count(*) FROM reply_diskusi WHERE reply_diskusi.id_testi_diskusi = testi_diskusi.id)"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('testi_diskusi') as batch_op:
+        batch_op.drop_column('reply_count')
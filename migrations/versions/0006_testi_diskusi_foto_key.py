@@ -0,0 +1,26 @@
+"""testi_diskusi photo blob columns
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('testi_diskusi') as batch_op:
+        batch_op.add_column(sa.Column('foto_key', sa.String(64)))
+        batch_op.add_column(sa.Column('foto_type', sa.String(100)))
+
+
+def downgrade():
+    with op.batch_alter_table('testi_diskusi') as batch_op:
+        batch_op.drop_column('foto_type')
+        batch_op.drop_column('foto_key')
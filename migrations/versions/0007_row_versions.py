@@ -0,0 +1,35 @@
+"""version column on every editable table
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17
+
+Bumped by every update; PATCH/PUT with If-Match only apply to the version
+the client read. Existing rows start at 1. On PostgreSQL 11+ adding a column
+with a constant default does not rewrite the table.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+TABLES = [
+    'user', 'resep_master', 'bahan_master', 'bahan_detail', 'cara_membuat',
+    'cara_membuat_detail', 'testi_diskusi', 'reply_diskusi', 'rating',
+]
+
+
+def upgrade():
+    for table in TABLES:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade():
+    for table in reversed(TABLES):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('version')
@@ -0,0 +1,66 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Settings are read when app is imported, so point it at a scratch SQLite
+# database before that. Tests that need PostgreSQL take TEST_POSTGRES_URL.
+TMP_DIR = tempfile.mkdtemp(prefix="resep-tests-")
+os.environ["DB_URL"] = "sqlite:///" + os.path.join(TMP_DIR, "test.db")
+os.environ["BLOB_ROOT"] = os.path.join(TMP_DIR, "blobs")
+os.environ["CACHE_BACKEND"] = "none"
+os.environ["EVENTS_NOTIFY"] = "false"
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import app  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+
+
+@pytest.fixture
+def engine():
+    engine = app.init_engine(app.settings)
+    app.Base.metadata.drop_all(engine)
+    app.Base.metadata.create_all(engine)
+    app.similar_index.reset()
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def client(engine):
+    with TestClient(app.app) as client:
+        yield client
+
+
+
+@pytest.fixture
+def postgres_engine(monkeypatch):
+    # A migrated, emptied PostgreSQL database at TEST_POSTGRES_URL; skipped
+    # when that is not set or not reachable.
+    url = os.environ.get("TEST_POSTGRES_URL")
+    if not url:
+        pytest.skip("TEST_POSTGRES_URL is not set")
+    monkeypatch.setattr(app.settings, "db_url", url)
+    engine = app.init_engine(app.settings)
+    try:
+        engine.connect().close()
+    except OperationalError as error:
+        engine.dispose()
+        pytest.skip(f"cannot connect to TEST_POSTGRES_URL: {error.orig}")
+    app.create_schema(None)
+    tables = ", ".join(f'"{table.name}"' for table in app.Base.metadata.sorted_tables)
+    with engine.begin() as connection:
+        connection.execute(text(f"TRUNCATE {tables} RESTART IDENTITY CASCADE"))
+    app.similar_index.reset()
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def postgres_client(postgres_engine):
+    with TestClient(app.app) as client:
+        yield client
@@ -0,0 +1,57 @@
+import pytest
+
+
+@pytest.fixture
+def recipe(client):
+    resep_id = client.post("/resep_master/", params={"name": "rendang"}).json()["id"]
+    client.post("/rating/", params={"resep_master_id": resep_id, "rating_value": 4})
+    bahan_id = client.post("/bahan_master/", params={"resep_master_id": resep_id, "porsi": 2}).json()["id"]
+    user_id = client.post("/users/", params={"name": "tester", "email": "tester@example.com"}).json()["id"]
+    testi_id = client.post("/testi_diskusi/", params={"resep_master_id": resep_id, "user_id": user_id, "foto": "", "testimonial": "enak"}).json()["id"]
+    return {"resep": resep_id, "bahan": bahan_id, "user": user_id, "testi": testi_id}
+
+
+@pytest.mark.parametrize("path, policy", [
+    ("/resep_master/", "public, max-age=30"),
+    ("/resep_master/search?q=rendang", "public, max-age=30"),
+    ("/bahan_master/{bahan}", "public, max-age=30"),
+    ("/resep_master/{resep}", "no-cache"),
+    ("/resep_master/{resep}/full", "no-cache"),
+    ("/resep_master/top_rated", "no-cache"),
+    ("/testi_diskusi/{testi}", "no-cache"),
+    ("/resep_master/{resep}/testi_diskusi", "no-cache"),
+    ("/testi_diskusi/{testi}/reply_diskusi", "no-cache"),
+    ("/rating/", "no-cache"),
+    ("/users/{user}", "private, no-cache"),
+    ("/metrics/cache", "no-store"),
+])
+def test_cache_control_per_route(client, recipe, path, policy):
+    response = client.get(path.format(**recipe))
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == policy
+
+
+def test_matching_etag_gets_304(client, recipe):
+    first = client.get(f"/resep_master/{recipe['resep']}/full")
+    etag = first.headers["ETag"]
+
+    again = client.get(f"/resep_master/{recipe['resep']}/full", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.content == b""
+    assert again.headers["ETag"] == etag
+
+    weak = client.get(f"/resep_master/{recipe['resep']}/full", headers={"If-None-Match": f'"other", W/{etag}'})
+    assert weak.status_code == 304
+
+    client.post("/rating/", params={"resep_master_id": recipe["resep"], "rating_value": 2})
+    changed = client.get(f"/resep_master/{recipe['resep']}/full", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+
+
+def test_list_etag_without_cache_entry(client, recipe):
+    etag = client.get("/resep_master/").headers["ETag"]
+    response = client.get("/resep_master/", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["Cache-Control"] == "public, max-age=30"
+    assert client.get("/resep_master/", headers={"If-None-Match": "*"}).status_code == 304
@@ -0,0 +1,70 @@
+import asyncio
+import json
+
+import app
+
+
+class FakeConnection:
+    # Stands in for the LISTEN connection: records each round trip and
+    # loops the payloads back like PostgreSQL does.
+    def __init__(self, hub, on_execute=None):
+        self.hub = hub
+        self.on_execute = on_execute
+        self.calls = []
+
+    async def execute(self, query, channel, payloads):
+        if self.on_execute is not None:
+            self.on_execute()
+        self.calls.append(payloads)
+        for payload in payloads:
+            self.hub.notified(self, 0, channel, payload)
+
+
+def test_notify_payloads_fit_the_limit():
+    events = [app.change_event(1, "rating", "created", {"id": i, "note": "x" * 100}) for i in range(500)]
+    events.append(app.change_event(1, "rating", "created", {"id": 500, "note": "x" * app.NOTIFY_MAX_BYTES}))
+    payloads, too_large = app.notify_payloads(events)
+    assert too_large == events[-1:]
+    assert all(len(payload.encode()) <= app.NOTIFY_MAX_BYTES for payload in payloads)
+    assert [event for payload in payloads for event in json.loads(payload)] == events[:-1]
+
+
+def test_bulk_create_is_one_notify_round_trip(client, monkeypatch):
+    connection = FakeConnection(app.events)
+    monkeypatch.setattr(app.events, "connection", connection)
+    resep_id = client.post("/resep_master/", params={"name": "rendang"}).json()["id"]
+    subscription = app.events.subscribe(resep_id)
+    subscription.queue = asyncio.Queue()
+    try:
+        response = client.post("/rating/bulk", json=[{"id_resep_master": resep_id, "rating": 4} for _ in range(1000)])
+        assert response.status_code == 201
+    finally:
+        app.events.unsubscribe(subscription)
+
+    assert len(connection.calls) == 1
+    assert len(connection.calls[0]) > 1
+    received = [subscription.queue.get_nowait()["data"]["id"] for _ in range(subscription.queue.qsize())]
+    assert received == [row["id"] for row in response.json()]
+
+
+def test_write_buffer_answers_before_publishing(engine, monkeypatch):
+    async def flush():
+        async_engine = app.init_async_engine(app.settings)
+        try:
+            async with app.AsyncSessionLocal() as db:
+                recipe = app.ResepMaster(name="rendang")
+                db.add(recipe)
+                await db.commit()
+            loop = asyncio.get_running_loop()
+            batch = [(app.Rating, {"id_resep_master": recipe.id, "rating": 5.0}, loop.create_future()) for _ in range(3)]
+            answered = []
+            connection = FakeConnection(app.events, lambda: answered.append(all(future.done() for _, _, future in batch)))
+            monkeypatch.setattr(app.events, "connection", connection)
+            await app.write_buffer.flush(batch)
+            return answered, [future.result()["id"] for _, _, future in batch]
+        finally:
+            await async_engine.dispose()
+
+    answered, ids = asyncio.run(flush())
+    assert answered == [True]
+    assert len(set(ids)) == 3
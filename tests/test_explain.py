@@ -0,0 +1,40 @@
+import os
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+import app
+
+# The indexes come from the Alembic migrations, so the schema is built with
+# them (create_schema) rather than from the models.
+POSTGRES_URL = os.environ.get("TEST_POSTGRES_URL")
+
+
+@pytest.fixture(params=["sqlite", "postgresql"])
+def migrated_db(request, tmp_path, monkeypatch):
+    if request.param == "sqlite":
+        url = f"sqlite:///{tmp_path / 'explain.db'}"
+    elif not POSTGRES_URL:
+        pytest.skip("TEST_POSTGRES_URL is not set")
+    else:
+        url = POSTGRES_URL
+    monkeypatch.setattr(app.settings, "db_url", url)
+    engine = app.init_engine(app.settings)
+    try:
+        engine.connect().close()
+    except OperationalError as error:
+        engine.dispose()
+        pytest.skip(f"cannot connect to TEST_POSTGRES_URL: {error.orig}")
+    app.create_schema(None)
+    db = app.SessionLocal()
+    yield db
+    db.close()
+    engine.dispose()
+
+
+def test_hot_queries_use_indexes(migrated_db):
+    queries = app.hot_queries()
+    if migrated_db.bind.dialect.name == "postgresql":
+        queries.update(app.search_hot_queries())
+    scans = {name: app.seq_scans(migrated_db, stmt) for name, stmt in queries.items()}
+    assert {name: tables for name, tables in scans.items() if tables} == {}
@@ -0,0 +1,63 @@
+import contextlib
+
+import pytest
+
+import app
+
+# One query for the recipe (its rating_summary is joined) and one selectinload
+# per relationship below it: bahan_master, bahan_detail, cara_membuat,
+# cara_membuat_detail, testi_diskusi, reply_diskusi.
+FULL_RECIPE_QUERIES = 7
+
+
+@contextlib.contextmanager
+def count_queries():
+    # Every statement the app's engine runs inside the block.
+    engine = app.app.state.request_engine
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    app.event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        app.event.remove(engine, "before_cursor_execute", record)
+
+
+def create_recipe(client, size):
+    recipe = client.post("/resep_master/full", json={
+        "name": f"recipe of {size}",
+        "bahan_master": [{"porsi": 2, "bahan_detail": [f"bahan {i}" for i in range(size)]} for _ in range(size)],
+        "cara_membuat": [{"lama_waktu": 10, "tips": "aduk", "cara_membuat_detail": [f"langkah {i}" for i in range(size)]} for _ in range(size)],
+    })
+    assert recipe.status_code == 201
+    resep_id = recipe.json()["id"]
+    user_id = client.post("/users/", params={"name": "tester", "email": "tester@example.com"}).json()["id"]
+    for i in range(size):
+        testi = client.post("/testi_diskusi/", params={"resep_master_id": resep_id, "user_id": user_id, "foto": "", "testimonial": f"enak {i}"})
+        assert testi.status_code == 201
+        for j in range(size):
+            reply = client.post("/reply_diskusi/", params={"testi_diskusi_id": testi.json()["id"], "user_id": user_id, "testimonial": f"setuju {j}"})
+            assert reply.status_code == 201
+        client.post("/rating/", params={"resep_master_id": resep_id, "rating_value": 4})
+    return resep_id
+
+
+@pytest.mark.parametrize("size", [1, 5])
+def test_full_recipe_query_count(client, size):
+    resep_id = create_recipe(client, size)
+
+    with count_queries() as statements:
+        response = client.get(f"/resep_master/{resep_id}/full")
+
+    assert response.status_code == 200
+    full = response.json()
+    assert len(full["bahan_master"]) == size
+    assert all(len(bahan["bahan_detail"]) == size for bahan in full["bahan_master"])
+    assert all(len(cara["cara_membuat_detail"]) == size for cara in full["cara_membuat"])
+    assert len(full["testi_diskusi"]) == size
+    assert all(len(testi["reply_diskusi"]) == size for testi in full["testi_diskusi"])
+    assert full["rating_summary"]["count"] == size
+    assert len(statements) == FULL_RECIPE_QUERIES, statements
@@ -0,0 +1,52 @@
+import json
+
+
+def create_recipes(client, count):
+    return [client.post("/resep_master/", params={"name": f"resep {i}"}).json()["id"] for i in range(count)]
+
+
+def test_pages_follow_next_cursor(client):
+    ids = create_recipes(client, 5)
+
+    seen, pages, params = [], 0, {"limit": 2}
+    while True:
+        response = client.get("/resep_master/", params=params)
+        assert response.status_code == 200
+        seen += [row["id"] for row in response.json()]
+        pages += 1
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        params = {"limit": 2, "after": cursor}
+
+    assert seen == ids
+    assert pages == 3
+
+
+def test_last_full_page_has_no_cursor(client):
+    ids = create_recipes(client, 4)
+    response = client.get("/resep_master/", params={"limit": 2, "after": ids[1]})
+    assert [row["id"] for row in response.json()] == ids[2:]
+    assert "X-Next-Cursor" not in response.headers
+
+
+def test_stream_returns_every_row_after_cursor(client):
+    ids = create_recipes(client, 5)
+    response = client.get("/resep_master/", params={"stream": True, "after": ids[0]})
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert [json.loads(line)["id"] for line in response.text.splitlines()] == ids[1:]
+
+
+def test_discussion_feed_is_newest_first(client):
+    resep_id = create_recipes(client, 1)[0]
+    user_id = client.post("/users/", params={"name": "tester", "email": "tester@example.com"}).json()["id"]
+    ids = [
+        client.post("/testi_diskusi/", params={"resep_master_id": resep_id, "user_id": user_id, "foto": "", "testimonial": f"enak {i}"}).json()["id"]
+        for i in range(3)
+    ]
+
+    first = client.get(f"/resep_master/{resep_id}/testi_diskusi", params={"limit": 2})
+    assert [row["id"] for row in first.json()] == ids[:0:-1]
+    second = client.get(f"/resep_master/{resep_id}/testi_diskusi", params={"limit": 2, "before": first.headers["X-Next-Cursor"]})
+    assert [row["id"] for row in second.json()] == ids[:1]
+    assert "X-Next-Cursor" not in second.headers
@@ -0,0 +1,92 @@
+import pytest
+
+
+# SQLite has no UPDATE ... RETURNING here, so it takes the read-then-update
+# path of patch_row; PostgreSQL takes the UPDATE ... FROM old ... RETURNING one.
+@pytest.fixture(params=["sqlite", "postgresql"])
+def patch_client(request):
+    return request.getfixturevalue("client" if request.param == "sqlite" else "postgres_client")
+
+
+def create_recipe(client, name="rendang"):
+    return client.post("/resep_master/", params={"name": name}).json()["id"]
+
+
+def summary(client, resep_id):
+    return client.get(f"/resep_master/{resep_id}").json()["rating_summary"]
+
+
+def test_stale_if_match_is_412(patch_client):
+    client = patch_client
+    resep_id = create_recipe(client)
+    first = client.patch(f"/resep_master/{resep_id}", json={"name": "soto"}, headers={"If-Match": '"1"'})
+    assert first.status_code == 200
+    assert first.headers["ETag"] == '"2"'
+    assert first.json()["version"] == 2
+
+    stale = client.patch(f"/resep_master/{resep_id}", json={"name": "sate"}, headers={"If-Match": '"1"'})
+    assert stale.status_code == 412
+    assert client.get(f"/resep_master/{resep_id}").json()["name"] == "soto"
+    assert client.patch(f"/resep_master/{resep_id}", json={"name": "sate"}, headers={"If-Match": first.headers["ETag"]}).status_code == 200
+    assert client.patch("/resep_master/999", json={"name": "sate"}, headers={"If-Match": '"1"'}).status_code == 404
+
+
+def test_stale_body_version_is_409(patch_client):
+    client = patch_client
+    resep_id = create_recipe(client)
+    assert client.patch(f"/resep_master/{resep_id}", json={"name": "soto", "version": 1}).status_code == 200
+    stale = client.patch(f"/resep_master/{resep_id}", json={"name": "sate", "version": 1})
+    assert stale.status_code == 409
+    recipe = client.get(f"/resep_master/{resep_id}").json()
+    assert (recipe["name"], recipe["version"]) == ("soto", 2)
+
+
+def test_falsy_values_are_written_and_null_is_left_alone(patch_client):
+    client = patch_client
+    resep_id = create_recipe(client)
+    bahan_id = client.post("/bahan_master/", params={"resep_master_id": resep_id, "porsi": 4}).json()["id"]
+    bahan = client.patch(f"/bahan_master/{bahan_id}", json={"porsi": 0})
+    assert bahan.status_code == 200
+    assert bahan.json()["porsi"] == 0
+    assert client.get(f"/bahan_master/{bahan_id}").json()["porsi"] == 0
+
+    cara_id = client.post("/cara_membuat/", params={"resep_master_id": resep_id, "lama_waktu": 10, "tips": "aduk"}).json()["id"]
+    assert client.patch(f"/cara_membuat/{cara_id}", json={"lama_waktu": 0, "tips": ""}).json()["lama_waktu"] == 0
+    assert client.get(f"/cara_membuat/{cara_id}").json()["tips"] == ""
+
+    rating_id = client.post("/rating/", params={"resep_master_id": resep_id, "rating_value": 4}).json()["id"]
+    assert client.patch(f"/rating/{rating_id}", json={"rating": 0.0}).json()["rating"] == 0.0
+    assert summary(client, resep_id)["average"] == 0.0
+
+    # null means "not sent": the column keeps its value.
+    kept = client.patch(f"/cara_membuat/{cara_id}", json={"tips": None, "lama_waktu": 5})
+    assert (kept.json()["tips"], kept.json()["lama_waktu"]) == ("", 5)
+    assert client.patch(f"/cara_membuat/{cara_id}", json={"tips": None}).status_code == 400
+
+
+def test_moving_a_rating_moves_its_summary(patch_client):
+    client = patch_client
+    rendang, soto = create_recipe(client, "rendang"), create_recipe(client, "soto")
+    rating_id = client.post("/rating/", params={"resep_master_id": rendang, "rating_value": 5}).json()["id"]
+    client.post("/rating/", params={"resep_master_id": rendang, "rating_value": 3})
+
+    assert client.patch(f"/rating/{rating_id}", json={"id_resep_master": soto, "rating": 4}).status_code == 200
+    assert summary(client, rendang) == {"count": 1, "average": 3.0, "histogram": [0, 0, 1, 0, 0]}
+    assert summary(client, soto) == {"count": 1, "average": 4.0, "histogram": [0, 0, 0, 1, 0]}
+
+
+def test_moving_a_reply_moves_its_count(patch_client):
+    client = patch_client
+    resep_id = create_recipe(client)
+    user_id = client.post("/users/", params={"name": "tester", "email": "tester@example.com"}).json()["id"]
+    testi_ids = [client.post("/testi_diskusi/", params={"resep_master_id": resep_id, "user_id": user_id, "foto": "", "testimonial": text}).json()["id"]
+                 for text in ("enak", "pedas")]
+    reply_id = client.post("/reply_diskusi/", params={"testi_diskusi_id": testi_ids[0], "user_id": user_id, "testimonial": "setuju"}).json()["id"]
+
+    def reply_counts():
+        feed = client.get(f"/resep_master/{resep_id}/testi_diskusi").json()
+        return {testi["id"]: testi["reply_count"] for testi in feed}
+
+    assert reply_counts() == {testi_ids[0]: 1, testi_ids[1]: 0}
+    assert client.patch(f"/reply_diskusi/{reply_id}", json={"id_testi_diskusi": testi_ids[1]}).status_code == 200
+    assert reply_counts() == {testi_ids[0]: 0, testi_ids[1]: 1}
@@ -0,0 +1,83 @@
+import asyncio
+import os
+
+import pytest
+from alembic import command
+from alembic.config import Config
+
+import app
+
+
+def create_recipe(client, name="rendang"):
+    response = client.post("/resep_master/", params={"name": name})
+    assert response.status_code == 201
+    return response.json()["id"]
+
+
+def rate(client, resep_master_id, value):
+    response = client.post("/rating/", params={"resep_master_id": resep_master_id, "rating_value": value})
+    assert response.status_code == 201
+    return response.json()["id"]
+
+
+def test_summary_follows_ratings(client):
+    resep_id = create_recipe(client)
+    rate(client, resep_id, 4)
+    rating_id = rate(client, resep_id, 2)
+
+    summary = client.get(f"/resep_master/{resep_id}").json()["rating_summary"]
+    assert summary["count"] == 2
+    assert summary["average"] == 3
+
+    assert client.delete(f"/rating/{rating_id}").status_code == 204
+    summary = client.get(f"/resep_master/{resep_id}").json()["rating_summary"]
+    assert summary["count"] == 1
+    assert summary["average"] == 4
+
+
+def test_delete_rated_recipe(client):
+    resep_id = create_recipe(client)
+    rate(client, resep_id, 5)
+
+    assert client.delete(f"/resep_master/{resep_id}").status_code == 204
+    assert client.get(f"/resep_master/{resep_id}").status_code == 404
+    assert client.get("/resep_master/top_rated").json() == []
+
+
+def test_taking_votes_from_missing_summary_inserts_nothing(engine):
+    async def take_back():
+        async_engine = app.init_async_engine(app.settings)
+        try:
+            async with app.AsyncSessionLocal() as db:
+                recipe = app.ResepMaster(name="rendang")
+                db.add(recipe)
+                await db.commit()
+                await app.apply_ratings(db, recipe.id, [4, 5], sign=-1)
+                await db.commit()
+                return (await db.execute(app.select(app.RatingSummary))).scalars().all()
+        finally:
+            await async_engine.dispose()
+
+    assert asyncio.run(take_back()) == []
+
+
+def test_migration_fills_rating_summary(tmp_path, monkeypatch):
+    monkeypatch.setattr(app.settings, "db_url", f"sqlite:///{tmp_path / 'migrated.db'}")
+    config = Config(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic.ini"))
+    command.upgrade(config, "0001")
+    engine = app.init_engine(app.settings)
+    with engine.begin() as connection:
+        connection.execute(app.text("INSERT INTO resep_master (id, name) VALUES (1, 'rendang'), (2, 'soto')"))
+        connection.execute(app.text("INSERT INTO rating (id_resep_master, rating) VALUES (1, 5), (1, 2), (1, 3.6), (2, 1)"))
+    command.upgrade(config, "head")
+
+    db = app.SessionLocal()
+    try:
+        summaries = {row.id_resep_master: row for row in db.execute(app.select(app.RatingSummary)).scalars()}
+    finally:
+        db.close()
+        engine.dispose()
+    assert summaries[1].count == 3
+    assert summaries[1].average == pytest.approx(3.5333, abs=1e-3)
+    assert summaries[1].histogram == [0, 1, 0, 1, 1]
+    assert summaries[2].histogram == [1, 0, 0, 0, 0]
@@ -0,0 +1,115 @@
+import asyncio
+import fnmatch
+import types
+
+import pytest
+
+import app
+
+
+class FakeRedis:
+    # The part of redis.asyncio.Redis that RedisCache uses, in a dict.
+    def __init__(self):
+        self.values = {}
+        self.expiry = {}
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.values[key] = value.encode()
+        self.expiry[key] = ex
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+
+    async def scan_iter(self, match="*"):
+        for key in list(self.values):
+            if fnmatch.fnmatch(key, match):
+                yield key
+
+
+def test_memory_cache_expires_entries(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(app, "time", types.SimpleNamespace(monotonic=lambda: now[0]))
+    cache = app.MemoryCache(max_entries=10, ttl=5)
+
+    async def run():
+        await cache.set("a", 1)
+        now[0] += 4
+        hit = await cache.get("a")
+        now[0] += 2
+        return hit, await cache.get("a")
+
+    assert asyncio.run(run()) == (1, None)
+    assert len(cache) == 0
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = app.MemoryCache(max_entries=2, ttl=60)
+
+    async def run():
+        await cache.set("a", 1)
+        await cache.set("b", 2)
+        await cache.get("a")
+        await cache.set("c", 3)
+        return [await cache.get(key) for key in "abc"]
+
+    assert asyncio.run(run()) == [1, None, 3]
+
+
+def test_redis_cache_round_trip_and_clear():
+    client = FakeRedis()
+    cache = app.RedisCache(client, ttl=0.5, prefix="test:")
+    client.values["other:key"] = b"1"
+
+    async def run():
+        await cache.set("a", {"id": 1})
+        await cache.set("b", [1, 2])
+        values = [await cache.get("a"), await cache.get("b"), await cache.get("missing")]
+        await cache.delete("a")
+        deleted = await cache.get("a")
+        await cache.clear()
+        return values, deleted
+
+    assert asyncio.run(run()) == ([{"id": 1}, [1, 2], None], None)
+    assert client.expiry == {"test:a": 1, "test:b": 1}
+    assert client.values == {"other:key": b"1"}
+
+
+@pytest.fixture(params=["memory", "redis"])
+def cached_client(request, client, monkeypatch):
+    if request.param == "memory":
+        backend = app.MemoryCache(100, 60)
+    else:
+        backend = app.RedisCache(FakeRedis(), 60)
+    monkeypatch.setattr(app.read_cache, "backend", backend)
+    yield client
+
+
+def test_writes_evict_what_the_next_read_depends_on(cached_client):
+    client = cached_client
+    resep_id = client.post("/resep_master/", params={"name": "rendang"}).json()["id"]
+    user_id = client.post("/users/", params={"name": "tester", "email": "tester@example.com"}).json()["id"]
+
+    def reads():
+        return client.get(f"/resep_master/{resep_id}").json(), client.get(f"/resep_master/{resep_id}/full").json()
+
+    hits = app.read_cache.hits
+    reads()
+    assert reads()[1]["rating_summary"]["count"] == 0
+    assert app.read_cache.hits == hits + 2
+
+    client.post("/rating/", params={"resep_master_id": resep_id, "rating_value": 5})
+    recipe, full = reads()
+    assert recipe["rating_summary"]["count"] == 1
+    assert full["rating_summary"]["count"] == 1
+
+    client.post("/testi_diskusi/", params={"resep_master_id": resep_id, "user_id": user_id, "foto": "", "testimonial": "enak"})
+    assert [testi["testimonial"] for testi in reads()[1]["testi_diskusi"]] == ["enak"]
+
+    client.patch(f"/resep_master/{resep_id}", json={"name": "soto"})
+    recipe, full = reads()
+    assert recipe["name"] == "soto"
+    assert full["name"] == "soto"
@@ -0,0 +1,70 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+import app
+
+
+@pytest.fixture
+def replica_url(tmp_path):
+    # A separate database standing in for a replica; its recipe 1 has a
+    # different name, so each read shows where it was served from.
+    url = f"sqlite:///{tmp_path / 'replica.db'}"
+    engine = create_engine(url)
+    app.Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO resep_master (id, name) VALUES (1, 'replica')"))
+    engine.dispose()
+    return url
+
+
+def replica_client(engine, monkeypatch, replica_urls):
+    monkeypatch.setattr(app.settings, "db_replica_urls", replica_urls)
+    monkeypatch.setattr(app.settings, "db_replica_check_interval", 3600)
+    return TestClient(app.app)
+
+
+def name_read(client):
+    return client.get("/resep_master/1").json()["name"]
+
+
+def test_reads_go_to_replica_until_client_writes(engine, monkeypatch, replica_url):
+    with replica_client(engine, monkeypatch, replica_url) as client:
+        assert client.post("/resep_master/", params={"name": "primary"}).status_code == 201
+        assert app.READ_YOUR_WRITES_COOKIE in client.cookies
+        assert name_read(client) == "primary"
+
+        client.cookies.clear()
+        assert name_read(client) == "replica"
+        assert client.get("/metrics/replicas").json()["replicas"][0]["reads"] >= 1
+
+
+def test_lagging_replica_is_skipped(engine, monkeypatch, replica_url):
+    async def lag(replica):
+        return app.settings.db_replica_max_lag_seconds + 10
+
+    monkeypatch.setattr(app.Replicas, "lag", lambda self, replica: lag(replica))
+    with replica_client(engine, monkeypatch, replica_url) as client:
+        client.post("/resep_master/", params={"name": "primary"})
+        client.cookies.clear()
+        assert name_read(client) == "primary"
+        replica = client.get("/metrics/replicas").json()["replicas"][0]
+        assert replica["healthy"] is False
+        assert replica["error"].endswith("behind")
+
+
+def test_unreachable_replica_falls_back_to_primary(engine, monkeypatch, tmp_path):
+    missing = f"sqlite:///{tmp_path / 'no-such-dir' / 'replica.db'}"
+    with replica_client(engine, monkeypatch, missing) as client:
+        client.post("/resep_master/", params={"name": "primary"})
+        client.cookies.clear()
+        assert name_read(client) == "primary"
+        assert client.get("/metrics/replicas").json()["replicas"][0]["healthy"] is False
+
+
+def test_several_replicas_with_least_connections(engine, monkeypatch, replica_url):
+    monkeypatch.setattr(app.settings, "db_replica_policy", "least_connections")
+    with replica_client(engine, monkeypatch, f"{replica_url},{replica_url}") as client:
+        for _ in range(4):
+            assert name_read(client) == "replica"
+        assert sum(replica["reads"] for replica in client.get("/metrics/replicas").json()["replicas"]) == 4
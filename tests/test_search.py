@@ -0,0 +1,57 @@
+import pytest
+
+RECIPES = {
+    "Rendang sapi": ["daging sapi", "santan"],
+    "Soto ayam": ["ayam", "Santan kental"],
+    "Sayur lodeh": ["santan", "labu siam"],
+    "Ayam goreng": ["ayam", "garam"],
+}
+
+
+@pytest.fixture(params=["sqlite", "postgresql"])
+def search_client(request):
+    client = request.getfixturevalue("client" if request.param == "sqlite" else "postgres_client")
+    ids = {}
+    for name, ingredients in RECIPES.items():
+        response = client.post("/resep_master/full", json={"name": name, "bahan_master": [{"porsi": 2, "bahan_detail": ingredients}]})
+        ids[name] = response.json()["id"]
+    return client, ids
+
+
+def search(client, **params):
+    response = client.get("/resep_master/search", params=params)
+    assert response.status_code == 200, response.text
+    return response
+
+
+def names(response, ids):
+    by_id = {resep_id: name for name, resep_id in ids.items()}
+    return sorted(by_id[row["id"]] for row in response.json())
+
+
+def test_include_and_exclude_ingredients(search_client):
+    client, ids = search_client
+    assert names(search(client, include="santan"), ids) == ["Rendang sapi", "Sayur lodeh", "Soto ayam"]
+    assert names(search(client, include=["santan", "sapi"]), ids) == ["Rendang sapi"]
+    assert names(search(client, include="santan", exclude="ayam"), ids) == ["Rendang sapi", "Sayur lodeh"]
+    assert names(search(client, include="santan", exclude=["ayam", "labu"]), ids) == ["Rendang sapi"]
+
+
+def test_text_query_with_filters(search_client):
+    client, ids = search_client
+    assert names(search(client, q="ayam"), ids) == ["Ayam goreng", "Soto ayam"]
+    assert names(search(client, q="ayam", include="santan"), ids) == ["Soto ayam"]
+    assert names(search(client, q="ayam", exclude="garam"), ids) == ["Soto ayam"]
+
+
+def test_pages_by_offset(search_client):
+    client, ids = search_client
+    first = search(client, include="santan", limit=2)
+    assert len(first.json()) == 2
+    rest = search(client, include="santan", limit=2, offset=first.headers["X-Next-Offset"])
+    assert "X-Next-Offset" not in rest.headers
+    assert {row["id"] for row in first.json() + rest.json()} == {ids[name] for name in ["Rendang sapi", "Sayur lodeh", "Soto ayam"]}
+
+
+def test_query_or_include_required(client):
+    assert client.get("/resep_master/search", params={"exclude": "ayam"}).status_code == 400
@@ -0,0 +1,87 @@
+import math
+
+import pytest
+
+import app
+
+pytest.importorskip("numpy")
+
+INGREDIENTS = {
+    1: {"daging sapi", "santan", "cabai", "bawang merah"},
+    2: {"daging sapi", "santan", "cabai"},
+    3: {"ayam", "santan", "kunyit"},
+    4: {"tempe", "kecap"},
+    5: {"daging sapi", "santan", "cabai", "bawang merah", "serai", "lengkuas"},
+}
+
+
+def expected(ingredients, recipe_id, metric):
+    # Brute force over the sets, best first and ties by newest recipe.
+    target = ingredients[recipe_id]
+    scores = []
+    for other, names in ingredients.items():
+        overlap = len(target & names)
+        if other == recipe_id or not overlap:
+            continue
+        if metric == app.SimilarMetric.cosine:
+            score = overlap / math.sqrt(len(target) * len(names))
+        else:
+            score = overlap / len(target | names)
+        scores.append((other, score))
+    return sorted(scores, key=lambda item: (-item[1], -item[0]))
+
+
+def assert_scores(actual, wanted):
+    assert [recipe_id for recipe_id, _ in actual] == [recipe_id for recipe_id, _ in wanted]
+    assert [score for _, score in actual] == pytest.approx([score for _, score in wanted])
+
+
+@pytest.mark.parametrize("metric", list(app.SimilarMetric))
+def test_scores_match_set_formulas(metric):
+    index = app.SimilarIndex(3600)
+    # Names are normalized, so the spelling below matches "daging sapi".
+    index.load([(recipe_id, name) for recipe_id, names in INGREDIENTS.items() for name in names] + [(2, "  Daging   SAPI ")])
+    for recipe_id in INGREDIENTS:
+        assert_scores(index.similar(recipe_id, 10, metric), expected(INGREDIENTS, recipe_id, metric))
+    assert index.similar(1, 2, metric) == index.similar(1, 10, metric)[:2]
+    assert index.similar(99, 10, metric) == []
+
+
+@pytest.mark.parametrize("metric", list(app.SimilarMetric))
+def test_set_ingredients_updates_scores(metric):
+    index = app.SimilarIndex(3600)
+    index.load([(recipe_id, name) for recipe_id, names in INGREDIENTS.items() for name in names])
+    ingredients = {**INGREDIENTS, 4: {"tempe", "santan", "ayam"}, 6: {"ayam", "kunyit", "jahe"}}
+    index.set_ingredients({4: ingredients[4], 6: ingredients[6]})
+    for recipe_id in ingredients:
+        assert_scores(index.similar(recipe_id, 10, metric), expected(ingredients, recipe_id, metric))
+
+    index.set_ingredients({3: set()})
+    assert index.similar(3, 10, metric) == []
+    assert 3 not in [recipe_id for recipe_id, _ in index.similar(6, 10, metric)]
+
+
+def create_recipe(client, name, ingredients):
+    return client.post("/resep_master/full", json={
+        "name": name,
+        "bahan_master": [{"porsi": 2, "bahan_detail": sorted(ingredients)}],
+        "cara_membuat": [],
+    }).json()["id"]
+
+
+def test_similar_endpoint_follows_ingredient_changes(client):
+    ids = {recipe_id: create_recipe(client, f"resep {recipe_id}", names) for recipe_id, names in INGREDIENTS.items()}
+    response = client.get(f"/resep_master/{ids[1]}/similar", params={"limit": 3})
+    assert response.status_code == 200
+    assert [(row["id"], row["name"]) for row in response.json()] == [(ids[2], "resep 2"), (ids[5], "resep 5"), (ids[3], "resep 3")]
+    assert response.json()[0]["score"] == pytest.approx(3 / 4)
+
+    bahan_master_id = client.get(f"/resep_master/{ids[4]}/full").json()["bahan_master"][0]["id"]
+    for name in ("daging sapi", "santan"):
+        client.post("/bahan_detail/", params={"bahan_master_id": bahan_master_id, "name": name})
+    ingredients = {**INGREDIENTS, 4: INGREDIENTS[4] | {"daging sapi", "santan"}}
+    cosine = client.get(f"/resep_master/{ids[4]}/similar", params={"metric": "cosine"}).json()
+    assert_scores([(row["id"], row["score"]) for row in cosine],
+                  [(ids[recipe_id], score) for recipe_id, score in expected(ingredients, 4, app.SimilarMetric.cosine)])
+
+    assert client.get("/resep_master/999/similar").status_code == 404
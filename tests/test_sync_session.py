@@ -0,0 +1,27 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app
+
+
+@pytest.fixture
+def sync_client(engine, monkeypatch):
+    monkeypatch.setattr(app.settings, "db_async", False)
+    with TestClient(app.app) as client:
+        yield client
+
+
+def test_crud_through_threaded_session(sync_client):
+    resep_id = sync_client.post("/resep_master/", params={"name": "rendang"}).json()["id"]
+    assert sync_client.post("/rating/", params={"resep_master_id": resep_id, "rating_value": 4}).status_code == 201
+    assert sync_client.get(f"/resep_master/{resep_id}").json()["rating_summary"]["count"] == 1
+    assert sync_client.patch(f"/resep_master/{resep_id}", json={"name": "soto"}).json()["name"] == "soto"
+
+    streamed = sync_client.get("/resep_master/", params={"stream": True})
+    assert [json.loads(line)["id"] for line in streamed.text.splitlines()] == [resep_id]
+    assert sync_client.get("/metrics/pool").json()["size"] == app.settings.db_pool_size
+
+    assert sync_client.delete(f"/resep_master/{resep_id}").status_code == 204
+    assert sync_client.get(f"/resep_master/{resep_id}").status_code == 404
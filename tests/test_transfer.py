@@ -0,0 +1,92 @@
+import json
+
+import pytest
+
+import app
+
+ADMIN = {"x-admin-token": "test-token"}
+
+
+@pytest.fixture(params=["sqlite", "postgresql"])
+def transfer_client(request, monkeypatch):
+    monkeypatch.setattr(app.settings, "admin_token", ADMIN["x-admin-token"])
+    return request.getfixturevalue("client" if request.param == "sqlite" else "postgres_client")
+
+
+def create_recipe(client):
+    resep_id = client.post("/resep_master/full", json={
+        "name": "rendang, \"asli\"",
+        "bahan_master": [{"porsi": 4, "bahan_detail": ["daging sapi", "santan"]}],
+        "cara_membuat": [{"lama_waktu": 120, "tips": "api kecil\nsabar", "cara_membuat_detail": ["tumis", "masak"]}],
+    }).json()["id"]
+    user_id = client.post("/users/", params={"name": "tester", "email": "tester@example.com"}).json()["id"]
+    testi_id = client.post("/testi_diskusi/", params={"resep_master_id": resep_id, "user_id": user_id, "foto": "", "testimonial": "enak"}).json()["id"]
+    client.post("/reply_diskusi/", params={"testi_diskusi_id": testi_id, "user_id": user_id, "testimonial": "setuju"})
+    for value in (5, 3):
+        client.post("/rating/", params={"resep_master_id": resep_id, "rating_value": value})
+    return resep_id
+
+
+def without_ids(full):
+    # The recipe tree with every id and version dropped, to compare a copy.
+    if isinstance(full, list):
+        return [without_ids(item) for item in full]
+    if isinstance(full, dict):
+        return {key: without_ids(value) for key, value in full.items() if key != "version" and key != "id" and not key.startswith("id_") and key != "user_id"}
+    return full
+
+
+def test_ndjson_export_imports_as_a_copy(transfer_client):
+    client = transfer_client
+    resep_id = create_recipe(client)
+    exported = client.get("/admin/export", headers=ADMIN)
+    assert exported.status_code == 200
+    lines = exported.text.splitlines()
+    assert {json.loads(line)["table"] for line in lines} == set(app.TRANSFER_TABLES)
+
+    response = client.post("/admin/import", content=exported.content, headers=ADMIN)
+    assert response.status_code == 200, response.text
+    assert response.json()["rows"] == {"user": 1, "resep_master": 1, "bahan_master": 1, "bahan_detail": 2, "cara_membuat": 1,
+                                       "cara_membuat_detail": 2, "testi_diskusi": 1, "reply_diskusi": 1, "rating": 2}
+
+    recipes = client.get("/resep_master/").json()
+    copy_id = next(recipe["id"] for recipe in recipes if recipe["id"] != resep_id)
+    original = client.get(f"/resep_master/{resep_id}/full").json()
+    copy = client.get(f"/resep_master/{copy_id}/full").json()
+    assert without_ids(copy) == without_ids(original)
+    assert copy["rating_summary"]["count"] == 2
+    assert client.get(f"/resep_master/{copy_id}/testi_diskusi").json()[0]["reply_count"] == 1
+    assert copy["testi_diskusi"][0]["user_id"] != original["testi_diskusi"][0]["user_id"]
+
+
+def test_csv_table_round_trip(transfer_client):
+    client = transfer_client
+    resep_id = create_recipe(client)
+    exported = client.get("/admin/export/rating", params={"format": "csv"}, headers=ADMIN)
+    assert exported.status_code == 200
+    assert exported.text.splitlines()[0] == "id,id_resep_master,rating"
+
+    response = client.post("/admin/import", params={"table": "rating", "format": "csv"}, content=exported.content, headers=ADMIN)
+    assert response.json()["rows"] == {"rating": 2}
+    summary = client.get(f"/resep_master/{resep_id}").json()["rating_summary"]
+    assert summary["count"] == 4
+    assert summary["histogram"] == [0, 0, 2, 0, 2]
+
+    for table in ("resep_master", "cara_membuat"):
+        exported = client.get(f"/admin/export/{table}", params={"format": "csv"}, headers=ADMIN)
+        assert client.post("/admin/import", params={"table": table, "format": "csv"}, content=exported.content, headers=ADMIN).json()["rows"] == {table: 1}
+    names = [recipe["name"] for recipe in client.get("/resep_master/").json()]
+    assert names == ['rendang, "asli"', 'rendang, "asli"']
+    assert [cara["tips"] for cara in client.get("/cara_membuat/").json()] == ["api kecil\nsabar", "api kecil\nsabar"]
+
+
+def test_bad_import_changes_nothing(transfer_client):
+    client = transfer_client
+    create_recipe(client)
+    body = b'{"table": "resep_master", "id": 1, "name": "soto"}\n{"table": "nope"}\n'
+    assert client.post("/admin/import", content=body, headers=ADMIN).status_code == 400
+    assert len(client.get("/resep_master/").json()) == 1
+
+
+def test_export_needs_admin_token(client):
+    assert client.get("/admin/export").status_code == 403
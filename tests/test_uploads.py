@@ -0,0 +1,61 @@
+import io
+import os
+
+import pytest
+
+import app
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def png(width, height):
+    buffer = io.BytesIO()
+    Image.new("1", (width, height)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def stored_blobs():
+    return [name for _, _, names in os.walk(app.blob_store.root) for name in names if not name.endswith(".tmp")]
+
+
+def create_user(client):
+    return client.post("/users/", params={"name": "tester", "email": "tester@example.com"}).json()["id"]
+
+
+def test_upload_makes_thumbnails(client):
+    user_id = create_user(client)
+    response = client.put(f"/users/{user_id}/image", content=png(300, 200), headers={"content-type": "image/png"})
+    assert response.status_code == 200
+    small = client.get(f"/users/{user_id}/image", params={"size": "small"})
+    assert small.status_code == 200
+    assert Image.open(io.BytesIO(small.content)).size == (64, 43)
+
+
+def test_decompression_bomb_is_refused_and_not_kept(client, monkeypatch):
+    monkeypatch.setattr(app.settings, "image_max_pixels", 100 * 100)
+    user_id = create_user(client)
+    before = stored_blobs()
+    bomb = png(1000, 1000)
+    assert len(bomb) < 1000
+
+    response = client.put(f"/users/{user_id}/image", content=bomb, headers={"content-type": "image/png"})
+    assert response.status_code == 413
+    assert stored_blobs() == before
+    assert client.get(f"/users/{user_id}/image").status_code == 404
+
+
+def test_form_upload_is_checked_on_content_length(client, monkeypatch):
+    monkeypatch.setattr(app.settings, "upload_max_bytes", 1000)
+    too_large = b"\x89PNG\r\n\x1a\n" + b"\0" * (1000 + app.MULTIPART_OVERHEAD_BYTES)
+    response = client.post("/users/", params={"name": "tester", "email": "tester@example.com"}, files={"user_pict": ("a.png", too_large, "image/png")})
+    assert response.status_code == 413
+
+    def chunked():
+        yield b"--x\r\n"
+
+    response = client.post("/users/", params={"name": "tester", "email": "tester@example.com"}, content=chunked(), headers={"content-type": "multipart/form-data; boundary=x"})
+    assert response.status_code == 411
+    assert client.get("/users").json() == []
+
+    response = client.post("/users/", params={"name": "tester", "email": "tester@example.com"}, files={"user_pict": ("a.png", png(10, 10), "image/png")})
+    assert response.status_code == 201
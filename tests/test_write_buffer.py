@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app
+
+
+@pytest.fixture
+def buffered_client(engine, monkeypatch):
+    monkeypatch.setattr(app.settings, "write_buffer", True)
+    monkeypatch.setattr(app.write_buffer, "ack", "flush")
+    with TestClient(app.app, raise_server_exceptions=False) as client:
+        yield client
+
+
+def test_buffered_writes_are_batched(buffered_client):
+    client = buffered_client
+    resep_id = client.post("/resep_master/", params={"name": "rendang"}).json()["id"]
+    batches = app.write_buffer.batch_rows.count
+    response = client.post("/rating/", params={"resep_master_id": resep_id, "rating_value": 4})
+    assert response.status_code == 201
+    assert response.json()["id_resep_master"] == resep_id
+    assert app.write_buffer.batch_rows.count == batches + 1
+    assert client.get(f"/resep_master/{resep_id}").json()["rating_summary"]["count"] == 1
+
+
+def test_flush_bug_fails_the_batch_and_keeps_the_task(engine, monkeypatch):
+    buffer = app.WriteBuffer(max_rows=10, max_delay=0.01, queue_size=10, ack="flush")
+
+    def broken(value):
+        raise RuntimeError("broken histogram")
+
+    async def run():
+        async_engine = app.init_async_engine(app.settings)
+        buffer.start()
+        try:
+            async with app.AsyncSessionLocal() as db:
+                recipe = app.ResepMaster(name="rendang")
+                db.add(recipe)
+                await db.commit()
+            values = {"id_resep_master": recipe.id, "rating": 4.0}
+            with monkeypatch.context() as patch:
+                patch.setattr(buffer.batch_rows, "observe", broken)
+                with pytest.raises(RuntimeError):
+                    await asyncio.wait_for(buffer.submit(app.Rating, values), 5)
+            assert not buffer.task.done()
+            return await asyncio.wait_for(buffer.submit(app.Rating, values), 5)
+        finally:
+            await asyncio.wait_for(buffer.stop(), 5)
+            await async_engine.dispose()
+
+    assert asyncio.run(run())["rating"] == 4.0
+    assert buffer.failed == 1